@@ -0,0 +1,280 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+"""
+Packaging of blueprint directories for upload.
+
+A blueprint is uploaded as a tar.gz archive of its directory. Files
+matching the patterns in the directory's `.cfyignore` file (and the
+`DEFAULT_IGNORED_PATTERNS`) are left out. The archive is compressed in a
+background thread while it's being uploaded, so it's never kept whole in
+memory or on disk.
+
+`.cfyignore` holds one glob pattern per line; blank lines and lines
+starting with `#` are skipped. A pattern without a `/` matches a file or
+directory name at any depth, a pattern with a `/` matches a path relative
+to the blueprint's directory, and a pattern ending with a `/` only matches
+directories.
+"""
+
+import os
+import sys
+import time
+import Queue
+import urllib
+import fnmatch
+import tarfile
+import threading
+
+from cloudify_rest_client.blueprints import Blueprint
+
+from cloudify_cli import uploads
+from cloudify_cli import constants
+
+
+IGNORE_FILE_NAME = '.cfyignore'
+DEFAULT_IGNORED_PATTERNS = [
+    '.git/',
+    '{0}/'.format(constants.CLOUDIFY_WD_SETTINGS_DIRECTORY_NAME)
+]
+
+CHUNK_SIZE = 64 * 1024
+BUFFERED_CHUNKS = 16
+_QUEUE_TIMEOUT = 0.5
+
+
+class IgnoreRules(object):
+    """Decides which paths of a blueprint directory are left out"""
+
+    def __init__(self, patterns):
+        self._rules = []
+        for pattern in patterns:
+            pattern = pattern.strip()
+            if not pattern or pattern.startswith('#'):
+                continue
+            directories_only = pattern.endswith('/')
+            pattern = pattern.rstrip('/')
+            anchored = '/' in pattern
+            self._rules.append((pattern.lstrip('/'), anchored,
+                                directories_only))
+
+    def ignored(self, relative_path, is_dir):
+        """Whether `relative_path` (relative to the blueprint's directory,
+        with `/` separators) is left out
+        """
+        name = relative_path.rsplit('/', 1)[-1]
+        for pattern, anchored, directories_only in self._rules:
+            if directories_only and not is_dir:
+                continue
+            if fnmatch.fnmatchcase(relative_path if anchored else name,
+                                   pattern):
+                return True
+        return False
+
+
+def load_ignore_rules(blueprint_dir):
+    """Return the ignore rules of a blueprint directory"""
+    patterns = list(DEFAULT_IGNORED_PATTERNS)
+    ignore_file_path = os.path.join(blueprint_dir, IGNORE_FILE_NAME)
+    if os.path.isfile(ignore_file_path):
+        with open(ignore_file_path) as f:
+            patterns.extend(f.read().splitlines())
+    return IgnoreRules(patterns)
+
+
+class ArchiveStats(object):
+
+    def __init__(self):
+        self.files = 0
+        self.ignored = 0
+        self.size = 0
+        self.compress_time = 0.0
+        self.upload_time = 0.0
+
+
+def walk_blueprint_dir(blueprint_dir, ignore_rules=None, stats=None):
+    """Yield the (path, relative path) of every file and directory in a
+    blueprint directory that isn't ignored, in a stable order
+
+    Relative paths use `/` separators. If `stats` is given, the yielded
+    files and the ignored paths are counted in it.
+    """
+    if ignore_rules is None:
+        ignore_rules = load_ignore_rules(blueprint_dir)
+    stats = stats or ArchiveStats()
+    for dirpath, dirnames, filenames in os.walk(blueprint_dir):
+        relative_dir = os.path.relpath(dirpath, blueprint_dir)
+        if relative_dir == '.':
+            relative_dir = ''
+        else:
+            relative_dir = relative_dir.replace(os.sep, '/') + '/'
+        for dirname in sorted(dirnames):
+            if ignore_rules.ignored(relative_dir + dirname, True):
+                # pruned, so os.walk doesn't descend into it
+                dirnames.remove(dirname)
+                stats.ignored += 1
+        dirnames.sort()
+        for dirname in dirnames:
+            yield os.path.join(dirpath, dirname), relative_dir + dirname
+        for filename in sorted(filenames):
+            if ignore_rules.ignored(relative_dir + filename, False):
+                stats.ignored += 1
+                continue
+            stats.files += 1
+            yield os.path.join(dirpath, filename), relative_dir + filename
+
+
+def archive_name(blueprint_path):
+    """The name of the archive's top level directory
+
+    Same as the REST client's, which names it after the main file.
+    """
+    return os.path.splitext(os.path.basename(blueprint_path))[0]
+
+
+class _ChunksWriter(object):
+    """A file-like object handing what's written to it to a queue, in
+    chunks of `CHUNK_SIZE` bytes
+    """
+
+    def __init__(self, chunks, stats, aborted):
+        self._chunks = chunks
+        self._stats = stats
+        self._aborted = aborted
+        self._buffer = []
+        self._buffered = 0
+        self.blocked_time = 0.0
+
+    def write(self, data):
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self._buffered:
+            return
+        chunk = ''.join(self._buffer)
+        self._buffer = []
+        self._buffered = 0
+        self._stats.size += len(chunk)
+        self.put(chunk)
+
+    def put(self, item):
+        started = time.time()
+        while not self._aborted.is_set():
+            try:
+                self._chunks.put(item, timeout=_QUEUE_TIMEOUT)
+                break
+            except Queue.Full:
+                continue
+        self.blocked_time += time.time() - started
+        if self._aborted.is_set():
+            raise _Aborted()
+
+
+class _Aborted(Exception):
+    pass
+
+
+class _ArchiveProducer(object):
+    """Compresses a blueprint directory in a background thread"""
+
+    _END = object()
+
+    def __init__(self, blueprint_path, stats):
+        self._blueprint_path = os.path.abspath(blueprint_path)
+        self._stats = stats
+        self._chunks = Queue.Queue(maxsize=BUFFERED_CHUNKS)
+        self._aborted = threading.Event()
+        self._writer = _ChunksWriter(self._chunks, stats, self._aborted)
+
+    def _produce(self):
+        started = time.time()
+        try:
+            blueprint_dir = os.path.dirname(self._blueprint_path)
+            name = archive_name(self._blueprint_path)
+            with tarfile.open(fileobj=self._writer, mode='w|gz') as tar:
+                tar.add(blueprint_dir, arcname=name, recursive=False)
+                for path, relative_path in walk_blueprint_dir(
+                        blueprint_dir, stats=self._stats):
+                    tar.add(path,
+                            arcname='{0}/{1}'.format(name, relative_path),
+                            recursive=False)
+            self._writer.flush()
+            item = self._END
+        except _Aborted:
+            return
+        except BaseException:
+            item = sys.exc_info()
+        finally:
+            self._stats.compress_time = \
+                time.time() - started - self._writer.blocked_time
+        try:
+            self._writer.put(item)
+        except _Aborted:
+            pass
+
+    def __iter__(self):
+        thread = threading.Thread(target=self._produce)
+        thread.daemon = True
+        thread.start()
+        try:
+            while True:
+                # waiting with a timeout keeps the main thread responsive
+                # to KeyboardInterrupt
+                try:
+                    item = self._chunks.get(timeout=_QUEUE_TIMEOUT)
+                except Queue.Empty:
+                    continue
+                if item is self._END:
+                    return
+                if isinstance(item, tuple):
+                    tpe, value, tb = item
+                    raise tpe, value, tb
+                yield item
+        finally:
+            # the upload may stop reading before the archive is complete
+            self._aborted.set()
+
+
+def stream_blueprint_archive(blueprint_path, stats=None):
+    """Return an iterator of the chunks of a blueprint's archive
+
+    The archive is compressed while it's being iterated over. If `stats`
+    is given, the archive's size, file counts and compression time are
+    recorded in it.
+    """
+    return iter(_ArchiveProducer(blueprint_path, stats or ArchiveStats()))
+
+
+def upload_blueprint(client, blueprint_path, blueprint_id, stats=None):
+    """Upload a blueprint's directory to the manager, as a streamed archive
+
+    Returns the uploaded blueprint. If `stats` is given, the archive's
+    size, file counts, compression time and upload time are recorded in
+    it.
+    """
+    stats = stats or ArchiveStats()
+    query_params = {'application_file_name':
+                    urllib.quote(os.path.basename(blueprint_path))}
+    started = time.time()
+    response = uploads.put_stream(
+        client,
+        '/blueprints/{0}'.format(blueprint_id),
+        stream_blueprint_archive(blueprint_path, stats),
+        params=query_params)
+    stats.upload_time = time.time() - started
+    return Blueprint(response)
@@ -0,0 +1,178 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+"""
+Watching a blueprint for changes (`cfy local init --watch`).
+
+The blueprint and the local files it imports are polled for changes. On
+every change, the environment is initialized again: the blueprint is
+parsed first (unchanged content is served by `plan_cache`), so errors are
+reported right away and leave the environment as is. Node instances of
+nodes whose definitions didn't change keep their runtime state (see
+`RuntimeState`).
+"""
+
+import os
+import json
+import time
+import urllib
+import urlparse
+
+from dsl_parser import exceptions as parser_exceptions
+
+from cloudify_cli import plan_cache
+from cloudify_cli.logger import get_logger
+
+
+DEFAULT_WATCH_INTERVAL = 0.1
+
+# errors of blueprints (or of inputs they don't accept), as opposed to
+# errors of the CLI
+BLUEPRINT_ERRORS = (parser_exceptions.DSLParsingException,
+                    parser_exceptions.MissingRequiredInputError,
+                    parser_exceptions.UnknownInputError,
+                    parser_exceptions.FunctionEvaluationError,
+                    EnvironmentError)
+
+
+class RuntimeState(object):
+    """The node instances of an environment, kept in memory so that an
+    environment initialized again can carry over their runtime state
+
+    The instances of a node whose definition is unchanged, and which has
+    as many instances as before, keep their ids, runtime properties and
+    state.
+    """
+
+    def __init__(self, env):
+        self._nodes = dict((node['id'], _digest(node))
+                           for node in env.plan['nodes'])
+        self._node_instances = dict(
+            (instance.id, instance)
+            for instance in env.storage.get_node_instances())
+        self.kept_nodes = []
+
+    def rename_node_instances(self, plan):
+        """Rename the node instances of unchanged nodes in a deployment
+        `plan` after their previous instances
+        """
+        renamed = {}
+        self.kept_nodes = []
+        for node in plan['nodes']:
+            if self._nodes.get(node['id']) != _digest(node):
+                continue
+            previous_ids = sorted(
+                instance.id for instance in self._node_instances.values()
+                if instance.node_id == node['id'])
+            current_ids = sorted(
+                instance['id'] for instance in plan['node_instances']
+                if instance['name'] == node['id'])
+            if len(previous_ids) != len(current_ids):
+                continue
+            renamed.update(zip(current_ids, previous_ids))
+            self.kept_nodes.append(node['id'])
+        for instance in plan['node_instances']:
+            instance['id'] = renamed.get(instance['id'], instance['id'])
+            if instance.get('host_id'):
+                instance['host_id'] = renamed.get(instance['host_id'],
+                                                  instance['host_id'])
+            for relationship in instance.get('relationships', []):
+                relationship['target_id'] = renamed.get(
+                    relationship['target_id'], relationship['target_id'])
+
+    def restore_node_instances(self, node_instances):
+        """Restore the runtime state of the (renamed) instances of the
+        nodes kept by `rename_node_instances`
+        """
+        for instance in node_instances:
+            if instance.node_id not in self.kept_nodes:
+                continue
+            previous_instance = self._node_instances[instance.id]
+            instance['runtime_properties'] = \
+                previous_instance.runtime_properties
+            instance['version'] = previous_instance.version
+            if previous_instance.state:
+                instance['state'] = previous_instance.state
+
+
+def watched_paths(blueprint_path, resolver=None, validate_version=True):
+    """Return the paths of a blueprint and of the local files it imports"""
+    paths = [os.path.abspath(blueprint_path)]
+    for import_url in plan_cache.blueprint_imports(
+            blueprint_path,
+            resolver=resolver,
+            validate_version=validate_version):
+        parsed_url = urlparse.urlparse(import_url)
+        if parsed_url.scheme == 'file':
+            paths.append(urllib.url2pathname(parsed_url.path))
+    return paths
+
+
+def watch(blueprint_path, reinitialize, resolver=None, validate_version=True,
+          interval=DEFAULT_WATCH_INTERVAL):
+    """Call `reinitialize` whenever the blueprint or a local file it
+    imports changes, until interrupted
+
+    `reinitialize` returns whether the environment was initialized again.
+    Blueprint errors it raises are reported, and watching goes on.
+    """
+    logger = get_logger()
+    paths = watched_paths(blueprint_path, resolver, validate_version)
+    times = _modification_times(paths)
+    logger.info('Watching {0} blueprint files for changes (press Ctrl+C to '
+                'stop)...'.format(len(paths)))
+    try:
+        while True:
+            time.sleep(interval)
+            current_times = _modification_times(paths)
+            if current_times == times:
+                continue
+            times = current_times
+            started = time.time()
+            try:
+                reinitialized = reinitialize()
+            except BLUEPRINT_ERRORS as e:
+                logger.error('Invalid blueprint ({0} ms): {1}'.format(
+                    _elapsed_ms(started), e))
+                continue
+            if reinitialized:
+                logger.info('Initialized again in {0} ms'.format(
+                    _elapsed_ms(started)))
+            # the blueprint's imports may have changed too
+            paths = watched_paths(blueprint_path, resolver, validate_version)
+            times = _modification_times(paths)
+    except KeyboardInterrupt:
+        logger.info('Stopped watching {0}'.format(blueprint_path))
+
+
+def _modification_times(paths):
+    times = {}
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            # e.g. while an editor replaces the file
+            times[path] = None
+        else:
+            times[path] = (stat.st_mtime, stat.st_size)
+    return times
+
+
+def _elapsed_ms(started):
+    return int((time.time() - started) * 1000)
+
+
+def _digest(node):
+    return json.dumps(node, sort_keys=True)
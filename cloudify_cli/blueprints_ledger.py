@@ -0,0 +1,128 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+"""
+A local ledger of the blueprints uploaded to a manager.
+
+A blueprint is uploaded as an archive of its whole directory, so it is
+identified by a digest of that directory's content. The ledger maps these
+digests to the ids the blueprints were uploaded with, and is kept under
+`.cloudify/blueprints-ledger/<manager>.json`.
+"""
+
+import os
+import re
+import json
+import hashlib
+import tempfile
+import threading
+
+from cloudify_cli import utils
+from cloudify_cli import blueprint_archive
+
+
+BLUEPRINTS_LEDGER_DIR_NAME = 'blueprints-ledger'
+LEDGER_FILE_SUFFIX = '.json'
+
+_READ_CHUNK_SIZE = 64 * 1024
+
+
+def blueprint_digest(blueprint_path):
+    """Return a digest of the directory a blueprint is uploaded from
+
+    The main file's name is part of the digest, as is the relative path
+    and content of every file that would be archived (see
+    `blueprint_archive`).
+    """
+    blueprint_path = os.path.abspath(os.path.expanduser(blueprint_path))
+    digest = hashlib.sha256()
+    digest.update(os.path.basename(blueprint_path))
+    digest.update('\0')
+    for path, relative_path in blueprint_archive.walk_blueprint_dir(
+            os.path.dirname(blueprint_path)):
+        if os.path.isdir(path):
+            continue
+        digest.update(relative_path)
+        digest.update('\0')
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(_READ_CHUNK_SIZE), ''):
+                digest.update(chunk)
+        digest.update('\0')
+    return digest.hexdigest()
+
+
+class BlueprintsLedger(object):
+    """The digests of the blueprints uploaded to a single manager
+
+    A ledger may be shared by several threads (e.g. when uploading
+    blueprints in parallel).
+    """
+
+    def __init__(self, ledger_path):
+        self._ledger_path = ledger_path
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    def get(self, digest):
+        """Return the id of the blueprint uploaded with `digest`, or None"""
+        with self._lock:
+            return self._entries.get(digest)
+
+    def record(self, digest, blueprint_id):
+        with self._lock:
+            self._entries[digest] = blueprint_id
+            self._dump()
+
+    def forget(self, digest):
+        with self._lock:
+            if self._entries.pop(digest, None) is not None:
+                self._dump()
+
+    def _load(self):
+        try:
+            with open(self._ledger_path) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            # a missing or corrupted ledger is simply rebuilt
+            return {}
+
+    def _dump(self):
+        ledger_dir = os.path.dirname(self._ledger_path)
+        if not os.path.isdir(ledger_dir):
+            os.makedirs(ledger_dir)
+        fd, tmp_path = tempfile.mkstemp(dir=ledger_dir)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self._entries, f, indent=2, sort_keys=True)
+        # os.rename can't replace an existing file on windows
+        if os.name == 'nt' and os.path.exists(self._ledger_path):
+            os.remove(self._ledger_path)
+        os.rename(tmp_path, self._ledger_path)
+
+
+def get_blueprints_ledger(manager):
+    """Return the ledger of the blueprints uploaded to `manager`
+
+    Returns None if the working directory isn't initialized.
+    """
+    if not utils.is_initialized():
+        return None
+    return BlueprintsLedger(os.path.join(
+        utils.get_init_path(),
+        BLUEPRINTS_LEDGER_DIR_NAME,
+        _safe_name(manager) + LEDGER_FILE_SUFFIX))
+
+
+def _safe_name(name):
+    return re.sub(r'[^\w.-]', '_', str(name))
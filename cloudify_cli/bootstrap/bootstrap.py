@@ -19,6 +19,7 @@ import time
 import copy
 import shutil
 import base64
+import hashlib
 import tarfile
 import tempfile
 import urlparse
@@ -38,6 +39,9 @@ from cloudify_rest_client.exceptions import CloudifyClientError
 from cloudify_cli import utils
 from cloudify_cli import common
 from cloudify_cli import constants
+from cloudify_cli import uploads
+from cloudify_cli import downloads
+from cloudify_cli import local_storage
 from cloudify_cli.logger import get_logger
 from cloudify_cli.bootstrap.tasks import (
     PROVIDER_RUNTIME_PROPERTY,
@@ -50,6 +54,14 @@ from cloudify_cli.exceptions import CloudifyBootstrapError
 
 MANAGER_DEPLOYMENT_ARCHIVE_IGNORED_FILES = ['.git']
 MAX_MANAGER_DEPLOYMENT_SIZE = 50 * (10 ** 6)  # 50MB
+# the files and directories named when the manager deployment is too large
+LARGEST_MANAGER_DEPLOYMENT_PATHS_COUNT = 5
+# manager deployment archives, named after their sha256 digest, are kept
+# under the working directory's .cloudify, and on the manager's host
+MANAGER_DEPLOYMENT_ARCHIVES_DIR_NAME = 'manager-deployments'
+REMOTE_MANAGER_DEPLOYMENT_ARCHIVES_DIR = '~/cloudify/manager-deployments'
+MANAGER_DEPLOYMENT_ARCHIVE_SUFFIX = '.tar.gz'
+_READ_CHUNK_SIZE = 64 * 1024
 CLOUDIFY_USERNAME_ENV_VAR = 'CLOUDIFY_USERNAME'
 CLOUDIFY_PASSWORD_ENV_VAR = 'CLOUDIFY_PASSWORD'
 
@@ -70,45 +82,241 @@ def delete_workdir():
 
 
 def load_env(name='manager'):
-    storage = local.FileStorage(storage_dir=_workdir())
+    # environments may have been migrated to another storage type
+    storage = local_storage.load_storage(_workdir(), name) or \
+        local.FileStorage(storage_dir=_workdir())
     return local.load_env(name=name,
                           storage=storage)
 
 
+def _ignored_archive_path(path):
+    return any((path.endswith(ignored_file) for ignored_file in
+                MANAGER_DEPLOYMENT_ARCHIVE_IGNORED_FILES))
+
+
 def blueprint_archive_filter_func(tarinfo):
-    if any((tarinfo.name.endswith(ignored_file) for ignored_file in
-            MANAGER_DEPLOYMENT_ARCHIVE_IGNORED_FILES)):
+    if _ignored_archive_path(tarinfo.name):
         # ignoring file when creating the archive
         return None
     return tarinfo
 
 
-def tar_manager_deployment(manager_deployment_path=None):
+def _write_manager_deployment_archive(file_obj, manager_deployment_path):
     name = 'manager'
-    file_obj = BytesIO()
     with tarfile.open(fileobj=file_obj, mode='w:gz') as tar:
         tar.add(manager_deployment_path or os.path.join(_workdir(), name),
                 arcname=name,
                 filter=blueprint_archive_filter_func)
+
+
+def tar_manager_deployment(manager_deployment_path=None):
+    file_obj = BytesIO()
+    _write_manager_deployment_archive(file_obj, manager_deployment_path)
     file_obj.seek(0)
     return file_obj
 
 
-# Temp workaround to allow teardown and recovery on different clients
-# assumes deployment name is manager
-def dump_manager_deployment():
-    archive_obj = tar_manager_deployment()
-    output = StringIO()
-    base64.encode(archive_obj, output)
-    return output.getvalue()
+class _SizeLimitExceeded(Exception):
+    pass
+
+
+class _CountingSink(object):
+    """A file-like object that counts the bytes written to it and
+    discards them, raising `_SizeLimitExceeded` once they exceed `limit`
+    """
+
+    def __init__(self, limit):
+        self.size = 0
+        self._limit = limit
+        self._exceeded = False
+
+    def write(self, data):
+        self.size += len(data)
+        # raised once, so closing the archive after the error succeeds
+        if self.size > self._limit and not self._exceeded:
+            self._exceeded = True
+            raise _SizeLimitExceeded()
+
+    def flush(self):
+        pass
+
+
+def _largest_paths(folder, count=LARGEST_MANAGER_DEPLOYMENT_PATHS_COUNT):
+    """Return the `count` largest files and directories under `folder` (by
+    their size on disk), as (relative path, size) tuples
+    """
+    file_sizes = []
+    dir_sizes = {}
+    for dirpath, dirnames, filenames in os.walk(folder):
+        dirnames[:] = [dirname for dirname in dirnames
+                       if not _ignored_archive_path(dirname)]
+        relative_dir = os.path.relpath(dirpath, folder)
+        for filename in filenames:
+            if _ignored_archive_path(filename):
+                continue
+            path = os.path.join(dirpath, filename)
+            if os.path.islink(path) or not os.path.isfile(path):
+                continue
+            size = os.path.getsize(path)
+            file_sizes.append((os.path.join(relative_dir, filename)
+                               if relative_dir != os.curdir else filename,
+                               size))
+            # counted in every directory containing the file
+            parent = relative_dir
+            while parent not in (os.curdir, ''):
+                dir_sizes[parent] = dir_sizes.get(parent, 0) + size
+                parent = os.path.dirname(parent)
+
+    def largest(sizes):
+        return sorted(sizes, key=lambda item: item[1],
+                      reverse=True)[:count]
+    return largest(file_sizes), largest(dir_sizes.items())
+
+
+class _DigestingWriter(object):
+    """A file-like object writing to `file_obj`, while digesting and
+    counting what's written
+    """
+
+    def __init__(self, file_obj):
+        self._file_obj = file_obj
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self._file_obj.write(data)
+        self.digest.update(data)
+        self.size += len(data)
+
+    def flush(self):
+        self._file_obj.flush()
+
+
+def _archives_dir():
+    return os.path.join(utils.get_init_path(),
+                        MANAGER_DEPLOYMENT_ARCHIVES_DIR_NAME)
+
+
+def _archive_path(digest):
+    return os.path.join(_archives_dir(),
+                        digest + MANAGER_DEPLOYMENT_ARCHIVE_SUFFIX)
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_READ_CHUNK_SIZE), ''):
+            digest.update(chunk)
+    return digest.hexdigest()
 
 
-def read_manager_deployment_dump_if_needed(manager_deployment_dump):
+def store_manager_deployment():
+    """Archive the manager deployment into the working directory's
+    manager deployment archives, and return its reference
+
+    The archive is streamed to disk, and named after its sha256 digest.
+    The reference (its `sha256`, `size` and `path` on the manager's host)
+    is what the provider context holds as the `manager_deployment`.
+    Archives of previous manager deployments are removed.
+    """
+    archives_dir = _archives_dir()
+    if not os.path.isdir(archives_dir):
+        os.makedirs(archives_dir)
+    fd, archived_path = tempfile.mkstemp(dir=archives_dir)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            writer = _DigestingWriter(f)
+            _write_manager_deployment_archive(writer, None)
+        digest = writer.digest.hexdigest()
+        for name in os.listdir(archives_dir):
+            if name != os.path.basename(archived_path):
+                os.remove(os.path.join(archives_dir, name))
+        os.rename(archived_path, _archive_path(digest))
+    except BaseException:
+        if os.path.exists(archived_path):
+            os.remove(archived_path)
+        raise
+    return {
+        'sha256': digest,
+        'size': writer.size,
+        'path': '{0}/{1}{2}'.format(REMOTE_MANAGER_DEPLOYMENT_ARCHIVES_DIR,
+                                    digest,
+                                    MANAGER_DEPLOYMENT_ARCHIVE_SUFFIX)
+    }
+
+
+def upload_manager_deployment(manager_deployment, fabric_env=None):
+    """Copy a stored manager deployment archive (see
+    `store_manager_deployment`) to the manager's host, with `fabric_env`
+    (or the current fabric settings)
+    """
+    with fabric.settings(**(fabric_env or {})):
+        fabric.run('mkdir -p {0}'.format(
+            REMOTE_MANAGER_DEPLOYMENT_ARCHIVES_DIR))
+        fabric.put(_archive_path(manager_deployment['sha256']),
+                   manager_deployment['path'])
+
+
+def _get_manager_deployment_archive(manager_deployment, key_filename=None):
+    """Return the path of a manager deployment's archive, fetching it from
+    the manager's host if it isn't stored locally
+    """
+    digest = manager_deployment['sha256']
+    archive_path = _archive_path(digest)
+    if os.path.isfile(archive_path) and \
+            _file_digest(archive_path) == digest:
+        return archive_path
+    archives_dir = _archives_dir()
+    if not os.path.isdir(archives_dir):
+        os.makedirs(archives_dir)
+    get_logger().info('Fetching the manager deployment from {0}...'.format(
+        manager_deployment['path']))
+    fd, fetched_path = tempfile.mkstemp(dir=archives_dir)
+    os.close(fd)
+    try:
+        key_filename = key_filename or \
+            os.path.expanduser(utils.get_management_key())
+        with fabric.settings(fabric.hide('running', 'stdout'),
+                             host_string=utils.build_manager_host_string(),
+                             key_filename=key_filename,
+                             port=utils.get_management_port()):
+            fabric.get(manager_deployment['path'], fetched_path)
+        if _file_digest(fetched_path) != digest:
+            raise CloudifyBootstrapError(
+                'The manager deployment fetched from {0} does not match its '
+                'sha256 digest ({1})'.format(manager_deployment['path'],
+                                             digest))
+        # os.rename can't replace an existing file on windows
+        if os.path.exists(archive_path):
+            os.remove(archive_path)
+        os.rename(fetched_path, archive_path)
+    finally:
+        if os.path.exists(fetched_path):
+            os.remove(fetched_path)
+    return archive_path
+
+
+def read_manager_deployment_dump_if_needed(manager_deployment_dump,
+                                           key_filename=None):
+    """Extract the manager deployment, unless it's already in the
+    working directory
+
+    `manager_deployment_dump` is the provider context's
+    `manager_deployment`: a reference to the stored archive (fetched from
+    the manager's host only now, if it isn't stored locally), or the
+    base64 encoded archive itself, as kept by previous versions.
+    """
     name = 'manager'
     if not manager_deployment_dump:
         return False
     if os.path.exists(os.path.join(_workdir(), name)):
         return False
+    if isinstance(manager_deployment_dump, dict):
+        archive_path = _get_manager_deployment_archive(
+            manager_deployment_dump, key_filename=key_filename)
+        with tarfile.open(archive_path, mode='r:gz') as tar:
+            tar.extractall(_workdir())
+        return True
     dump_input = StringIO(manager_deployment_dump)
     dump_input.seek(0)
     file_obj = BytesIO()
@@ -121,16 +329,27 @@ def read_manager_deployment_dump_if_needed(manager_deployment_dump):
 
 def validate_manager_deployment_size(blueprint_path):
     blueprint_folder = os.path.dirname(os.path.abspath(blueprint_path))
-    # checking for the size of the blueprint's folder when archived
-    archive_obj = tar_manager_deployment(blueprint_folder)
-    manager_dep_size = len(archive_obj.getvalue())
-    if manager_dep_size > MAX_MANAGER_DEPLOYMENT_SIZE:
+    # checking for the size of the blueprint's folder when archived; the
+    # archive is only counted, and stops as soon as it's too large
+    sink = _CountingSink(MAX_MANAGER_DEPLOYMENT_SIZE)
+    try:
+        _write_manager_deployment_archive(sink, blueprint_folder)
+    except _SizeLimitExceeded:
+        largest_files, largest_dirs = _largest_paths(blueprint_folder)
+
+        def describe(paths):
+            return ', '.join('{0} ({1} bytes)'.format(path, size)
+                             for path, size in paths) or 'none'
         raise CloudifyBootstrapError(
             "The manager blueprint's folder is above the maximum allowed size "
-            "when archived (size is {0} bytes; max is {1}); Please ensure the "
-            "manager blueprint's folder doesn't contain any unnecessary files "
-            "or directories".format(manager_dep_size,
-                                    MAX_MANAGER_DEPLOYMENT_SIZE))
+            "when archived (size is over {0} bytes; max is {1}); Please "
+            "ensure the manager blueprint's folder doesn't contain any "
+            "unnecessary files or directories. Its largest files are: {2}; "
+            "its largest directories are: {3}".format(
+                sink.size,
+                MAX_MANAGER_DEPLOYMENT_SIZE,
+                describe(largest_files),
+                describe(largest_dirs)))
 
 
 def _validate_credentials_are_set():
@@ -180,7 +399,8 @@ def bootstrap_validation(blueprint_path,
                             'cloudify.interfaces.validation.creation'},
                 task_retries=task_retries,
                 task_retry_interval=task_retry_interval,
-                task_thread_pool_size=task_thread_pool_size)
+                task_thread_pool_size=common.task_thread_pool_size(
+                    env.plan, task_thread_pool_size))
 
 
 def _perform_sanity(env,
@@ -208,7 +428,8 @@ def _perform_sanity(env,
 def _handle_provider_context(rest_client,
                              remote_agents_private_key_path,
                              manager_node,
-                             manager_node_instance):
+                             manager_node_instance,
+                             fabric_env):
     provider_context = manager_node_instance.runtime_properties.get(
         'provider_context', {})
     cloudify_configuration = manager_node.properties['cloudify']
@@ -224,8 +445,9 @@ def _handle_provider_context(rest_client,
     # and then calling teardown or recover. Anyway, this code will only live
     # until we implement the fuller feature of uploading manager blueprint
     # deployments to the manager.
-    cloudify_configuration['manager_deployment'] = \
-        _dump_manager_deployment(manager_node_instance)
+    manager_deployment = _dump_manager_deployment(manager_node_instance)
+    upload_manager_deployment(manager_deployment, fabric_env=fabric_env)
+    cloudify_configuration['manager_deployment'] = manager_deployment
 
     rest_client.manager.create_context(name='provider',
                                        context=provider_context)
@@ -272,6 +494,8 @@ def bootstrap(blueprint_path,
         ]
         raise
 
+    task_thread_pool_size = common.task_thread_pool_size(
+        env.plan, task_thread_pool_size)
     env.execute(workflow='install',
                 task_retries=task_retries,
                 task_retry_interval=task_retry_interval,
@@ -344,7 +568,8 @@ def bootstrap(blueprint_path,
             rest_client=rest_client,
             remote_agents_private_key_path=agent_remote_key_path,
             manager_node=manager_node,
-            manager_node_instance=manager_node_instance)
+            manager_node_instance=manager_node_instance,
+            fabric_env=fabric_env)
 
         _upload_resources(manager_node, fabric_env, rest_client, task_retries,
                           task_retry_interval)
@@ -376,7 +601,8 @@ def teardown(name='manager',
     env.execute('uninstall',
                 task_retries=task_retries,
                 task_retry_interval=task_retry_interval,
-                task_thread_pool_size=task_thread_pool_size)
+                task_thread_pool_size=common.task_thread_pool_size(
+                    env.plan, task_thread_pool_size))
 
     # deleting local environment data
     shutil.rmtree(_workdir())
@@ -386,7 +612,8 @@ def recover(snapshot_path,
             name='manager',
             task_retries=5,
             task_retry_interval=30,
-            task_thread_pool_size=1):
+            task_thread_pool_size=1,
+            bandwidth_limit=None):
     env = load_env(name)
     with env.storage.payload() as payload:
         manager_node_instance_id = payload['manager_node_instance_id']
@@ -395,7 +622,8 @@ def recover(snapshot_path,
                 parameters={'node_instance_id': manager_node_instance_id},
                 task_retries=task_retries,
                 task_retry_interval=task_retry_interval,
-                task_thread_pool_size=task_thread_pool_size)
+                task_thread_pool_size=common.task_thread_pool_size(
+                    env.plan, task_thread_pool_size))
 
     manager_ip = env.outputs()['manager_ip']
     manager_node = env.storage.get_node('manager_configuration')
@@ -417,12 +645,19 @@ def recover(snapshot_path,
         rest_client=client,
         remote_agents_private_key_path=agent_remote_key_path,
         manager_node=manager_node,
-        manager_node_instance=manager_node_instance)
+        manager_node_instance=manager_node_instance,
+        fabric_env=fabric_env)
     snapshot_id = 'restored-snapshot'
     logger.info("Uploading snapshot '{0}' to "
                 "management server {1} as {2}"
                 .format(snapshot_path.name, manager_ip, snapshot_id))
-    client.snapshots.upload(snapshot_path.name, snapshot_id)
+    _, result = uploads.upload_snapshot(
+        client,
+        snapshot_path.name,
+        snapshot_id,
+        bandwidth_limit=bandwidth_limit,
+        progress_handler=downloads.log_progress(logger, 'Uploaded'))
+    logger.info('Snapshot uploaded ({0})'.format(result))
 
     logger.info("Restoring snapshot '{0}'..."
                 .format(snapshot_id))
@@ -477,7 +712,7 @@ def _dump_manager_deployment(manager_node_instance):
 
     # explicitly flush runtime properties to local storage
     manager_node_instance.update()
-    return dump_manager_deployment()
+    return store_manager_deployment()
 
 
 def _copy_agent_key(agent_local_key_path, agent_remote_key_path,
@@ -558,14 +793,29 @@ def _upload_plugins(plugin_resources, temp_dir, rest_client, retries,
            stop_func=partial(_stop_retries, retries, wait_interval),
            retry_on_exception=is_error)
     def upload_plugin(plugin_path):
-        utils.upload_plugin(file(plugin_path), rest_client, plugins.validate)
+        return rest_client.plugins.upload(plugin_path)
 
-    for plugin_source_path in plugin_resources:
-        plugin_local_path = \
-            _get_resource_into_dir(temp_dir, plugin_source_path,
-                                   retries, wait_interval, timeout)
+    plugin_local_paths = [
+        _get_resource_into_dir(temp_dir, plugin_source_path,
+                               retries, wait_interval, timeout)
+        for plugin_source_path in plugin_resources]
+    if not plugin_local_paths:
+        return
 
-        upload_plugin(plugin_local_path)
+    logger = get_logger()
+    logger.info('Uploading {0} plugins to the manager...'
+                .format(len(plugin_local_paths)))
+    results = plugins.upload_plugins(rest_client, plugin_local_paths,
+                                     upload_plugin=upload_plugin)
+    for result in results:
+        logger.info('Plugin {0}: {1}'.format(
+            os.path.basename(result['plugin']), result['status']))
+    failed = [result for result in results if result['status'] == 'failed']
+    if failed:
+        raise CloudifyBootstrapError(
+            'Failed to upload plugins: {0}'.format(', '.join(
+                '{0} ({1})'.format(result['plugin'], result['error'])
+                for result in failed)))
 
 
 def upload_dsl_resources(dsl_resources, temp_dir, fabric_env, retries,
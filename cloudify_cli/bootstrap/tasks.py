@@ -770,6 +770,9 @@ def _upload_provider_context(remote_agents_private_key_path,
         '"Content-Type: application/json" -d @{2}'.format(
             API_VERSION, request_params, container_provider_context_file)
 
+    # the manager deployment archive is only referenced by the context
+    _upload_manager_deployment(cloudify_configuration['manager_deployment'])
+
     # uploading the provider context to the REST service
     _run_command_in_cfy(upload_provider_context_cmd, terminal=True)
 
@@ -849,7 +852,7 @@ def _validate_package_url_accessible(package_url):
 
 # temp workaround to enable teardown and recovery from different machines
 def _dump_manager_deployment():
-    from cloudify_cli.bootstrap.bootstrap import dump_manager_deployment
+    from cloudify_cli.bootstrap.bootstrap import store_manager_deployment
     from cloudify_cli.bootstrap.bootstrap import load_env
 
     # explicitly write the manager node instance id to local storage
@@ -859,4 +862,9 @@ def _dump_manager_deployment():
 
     # explicitly flush runtime properties to local storage
     ctx.instance.update()
-    return dump_manager_deployment()
+    return store_manager_deployment()
+
+
+def _upload_manager_deployment(manager_deployment):
+    from cloudify_cli.bootstrap.bootstrap import upload_manager_deployment
+    upload_manager_deployment(manager_deployment)
@@ -43,6 +43,7 @@ from cloudify_cli.commands import snapshots
 from cloudify_cli.commands import agents
 from cloudify_cli.commands import deployments
 from cloudify_cli.commands import events
+from cloudify_cli.commands import imports
 from cloudify_cli.commands import executions
 from cloudify_cli.commands import nodes
 from cloudify_cli.commands import node_instances
@@ -20,40 +20,134 @@ Handles all commands that start with 'cfy blueprints'
 import json
 
 import os
+import glob
+import time
 import urlparse
+import multiprocessing
+
+import yaml
 
 from cloudify_cli import utils
+from cloudify_cli import downloads
+from cloudify_cli import plan_cache
+from cloudify_cli import import_cache
+from cloudify_cli import blueprints_ledger
+from cloudify_cli import blueprint_archive
 from cloudify_cli.logger import get_logger
 from cloudify_cli.exceptions import CloudifyCliError
-from dsl_parser.parser import parse_from_path
+from cloudify_cli.constants import DEFAULT_BLUEPRINT_FILE_NAME
+from cloudify_rest_client.exceptions import CloudifyClientError
 from dsl_parser.exceptions import DSLParsingException
 
 SUPPORTED_ARCHIVE_TYPES = ['zip', 'tar', 'tar.gz', 'tar.bz2']
 DESCRIPTION_LIMIT = 20
 
 
-def validate(blueprint_path):
+def validate(blueprint_path, offline=False, concurrency=None):
+    blueprint_paths = _expand_blueprint_paths(blueprint_path)
+    if len(blueprint_paths) == 1:
+        _validate_blueprint(blueprint_paths[0], offline=offline)
+        return
+
+    logger = get_logger()
+    concurrency = concurrency or multiprocessing.cpu_count()
+    logger.info('Validating {0} blueprints using {1} processes...'
+                .format(len(blueprint_paths), concurrency))
+    started = time.time()
+    # the first blueprint is validated here, so that the remote imports
+    # it shares with the rest are already in the imports cache when the
+    # worker processes start
+    results = [_validate_in_worker((blueprint_paths[0], offline))]
+    results.extend(utils.run_in_processes(
+        _validate_in_worker,
+        [(path, offline) for path in blueprint_paths[1:]],
+        concurrency))
+
+    failed = [(path, error) for path, error, _ in results if error]
+    pt = utils.table(['blueprint', 'status', 'duration'],
+                     data=[{'blueprint': path,
+                            'status': 'invalid' if error else 'valid',
+                            'duration': '{0:.2f}s'.format(duration)}
+                           for path, error, duration in results])
+    utils.print_table('Validated blueprints:', pt)
+    for path, error in failed:
+        logger.info('Failed to validate blueprint {0}: {1}'
+                    .format(path, error))
+    logger.info('Validated {0} blueprints in {1:.2f} seconds'
+                .format(len(results), time.time() - started))
+    if failed:
+        raise CloudifyCliError('{0} of {1} blueprints failed validation'
+                               .format(len(failed), len(results)))
+
+
+def _expand_blueprint_paths(patterns):
+    """Return the blueprint paths matched by `patterns`, without duplicates
+
+    Patterns that aren't globs are kept as is, so that a missing blueprint
+    is reported when it's validated.
+    """
+    blueprint_paths = []
+    seen = set()
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matched = sorted(glob.glob(os.path.expanduser(pattern)))
+            if not matched:
+                raise CloudifyCliError(
+                    'No blueprints match {0}'.format(pattern))
+        else:
+            matched = [pattern]
+        for path in matched:
+            if os.path.abspath(path) not in seen:
+                seen.add(os.path.abspath(path))
+                blueprint_paths.append(path)
+    return blueprint_paths
+
+
+def _parse_blueprint(blueprint_path, offline):
+    resolver = utils.get_import_resolver()
+    if offline:
+        resolver = import_cache.get_caching_resolver(resolver, offline=True)
+    validate_version = utils.is_validate_definitions_version()
+    plan_cache.parse_blueprint(blueprint_path,
+                               resolver=resolver,
+                               validate_version=validate_version)
+
+
+def _validate_blueprint(blueprint_path, offline=False):
     logger = get_logger()
 
     logger.info(
-        'Validating blueprint: {0}'.format(blueprint_path.name))
+        'Validating blueprint: {0}'.format(blueprint_path))
     try:
-        resolver = utils.get_import_resolver()
-        validate_version = utils.is_validate_definitions_version()
-        parse_from_path(dsl_file_path=blueprint_path.name,
-                        resolver=resolver,
-                        validate_version=validate_version)
+        _parse_blueprint(blueprint_path, offline)
     except DSLParsingException as ex:
         raise CloudifyCliError('Failed to validate blueprint {0}'.format(
             str(ex)))
     logger.info('Blueprint validated successfully')
 
 
+def _validate_in_worker(args):
+    """Validate a blueprint, returning (path, error, duration)
+
+    Runs in a worker process, so errors are returned rather than raised.
+    """
+    blueprint_path, offline = args
+    started = time.time()
+    try:
+        _parse_blueprint(blueprint_path, offline)
+        error = None
+    except DSLParsingException as ex:
+        error = str(ex)
+    except (CloudifyCliError, IOError, OSError) as ex:
+        error = str(ex)
+    return blueprint_path, error, time.time() - started
+
+
 def upload(blueprint_path, blueprint_id, validate_blueprint):
     logger = get_logger()
     rest_host = utils.get_rest_host()
     if validate_blueprint:
-        validate(blueprint_path)
+        _validate_blueprint(blueprint_path.name)
     else:
         logger.debug("Skipping blueprint validation...")
 
@@ -61,9 +155,179 @@ def upload(blueprint_path, blueprint_id, validate_blueprint):
                 .format(blueprint_path.name, rest_host))
 
     client = utils.get_rest_client(rest_host)
-    blueprint = client.blueprints.upload(blueprint_path.name, blueprint_id)
+    ledger = blueprints_ledger.get_blueprints_ledger(rest_host)
+    if ledger is not None:
+        digest = blueprints_ledger.blueprint_digest(blueprint_path.name)
+    stats = blueprint_archive.ArchiveStats()
+    blueprint = blueprint_archive.upload_blueprint(
+        client, blueprint_path.name, blueprint_id, stats)
+    if ledger is not None:
+        ledger.record(digest, blueprint_id)
     logger.info("Blueprint uploaded. "
                 "The blueprint's id is {0}".format(blueprint.id))
+    logger.info('Blueprint archive: {0} ({1} files, {2} ignored). '
+                'Compressing took {3:.2f} seconds, uploading took {4:.2f} '
+                'seconds'.format(utils.format_size(stats.size),
+                                 stats.files,
+                                 stats.ignored,
+                                 stats.compress_time,
+                                 stats.upload_time))
+
+
+def find_uploaded(blueprint_path):
+    """Return the id of a blueprint already uploaded from `blueprint_path`
+
+    Returns None if the blueprint's content changed since it was uploaded,
+    or if it was never uploaded (as far as the blueprints ledger knows).
+    """
+    if not utils.is_initialized():
+        return None
+    rest_host = utils.get_rest_host()
+    ledger = blueprints_ledger.get_blueprints_ledger(rest_host)
+    digest = blueprints_ledger.blueprint_digest(blueprint_path)
+    return _find_uploaded(utils.get_rest_client(rest_host), ledger, digest)
+
+
+def _find_uploaded(client, ledger, digest):
+    blueprint_id = ledger.get(digest)
+    if blueprint_id is None:
+        return None
+    try:
+        client.blueprints.get(blueprint_id, _include=['id'])
+    except CloudifyClientError as e:
+        if e.status_code != 404:
+            raise
+        # the blueprint was deleted from the manager
+        ledger.forget(digest)
+        return None
+    return blueprint_id
+
+
+def upload_many(blueprints_location, blueprint_filename, validate_blueprint,
+                concurrency):
+    logger = get_logger()
+    rest_host = utils.get_rest_host()
+    blueprints = _read_blueprints_location(
+        blueprints_location, blueprint_filename or DEFAULT_BLUEPRINT_FILE_NAME)
+    if validate_blueprint:
+        validate([blueprint_path for blueprint_path, _ in blueprints])
+    else:
+        logger.debug("Skipping blueprints validation...")
+
+    logger.info('Uploading {0} blueprints to management server {1}...'
+                .format(len(blueprints), rest_host))
+    client = utils.use_connection_pool(utils.get_rest_client(rest_host),
+                                       concurrency)
+    ledger = blueprints_ledger.get_blueprints_ledger(rest_host)
+    started = time.time()
+    results = utils.run_concurrently(
+        lambda blueprint: _upload_one(client, ledger, *blueprint),
+        blueprints,
+        concurrency)
+    elapsed = time.time() - started
+
+    failed = [result for result in results if result['status'] == 'failed']
+    uploaded = [result for result in results
+                if result['status'] == 'uploaded']
+    pt = utils.table(['id', 'blueprint', 'status', 'size', 'duration',
+                      'throughput'],
+                     data=[_format_upload_result(result)
+                           for result in results])
+    utils.print_table('Blueprints:', pt)
+    for result in failed:
+        logger.info('Failed to upload blueprint {0}: {1}'
+                    .format(result['blueprint'], result['error']))
+    total_size = sum(result['size'] for result in uploaded)
+    logger.info('Uploaded {0} blueprints ({1}) in {2:.2f} seconds, '
+                '{3} were already uploaded'
+                .format(len(uploaded),
+                        utils.format_size(total_size),
+                        elapsed,
+                        len(results) - len(uploaded) - len(failed)))
+    if failed:
+        raise CloudifyCliError('{0} of {1} blueprints failed to upload'
+                               .format(len(failed), len(results)))
+
+
+def _read_blueprints_location(blueprints_location, blueprint_filename):
+    """Return the (blueprint path, blueprint id) of every blueprint to
+    upload
+
+    `blueprints_location` is either a directory, in which every
+    subdirectory with a `blueprint_filename` file is a blueprint whose id
+    is the subdirectory's name, or a YAML manifest, mapping blueprint ids
+    to blueprint paths (relative to the manifest's directory).
+    """
+    blueprints_location = os.path.expanduser(blueprints_location)
+    if os.path.isdir(blueprints_location):
+        blueprints = []
+        for name in sorted(os.listdir(blueprints_location)):
+            blueprint_path = os.path.join(blueprints_location, name,
+                                          blueprint_filename)
+            if os.path.isfile(blueprint_path):
+                blueprints.append((blueprint_path, name))
+        if not blueprints:
+            raise CloudifyCliError(
+                'No blueprints were found in {0} (expected subdirectories '
+                'containing a {1} file)'.format(blueprints_location,
+                                                blueprint_filename))
+        return blueprints
+
+    try:
+        with open(blueprints_location) as f:
+            manifest = yaml.safe_load(f)
+    except (IOError, yaml.YAMLError) as e:
+        raise CloudifyCliError('Failed to read blueprints manifest {0}: {1}'
+                               .format(blueprints_location, e))
+    if not isinstance(manifest, dict) or not manifest:
+        raise CloudifyCliError(
+            'Blueprints manifest {0} must map blueprint ids to blueprint '
+            'paths'.format(blueprints_location))
+    manifest_dir = os.path.dirname(os.path.abspath(blueprints_location))
+    return [(os.path.join(manifest_dir, os.path.expanduser(str(path))),
+             str(blueprint_id))
+            for blueprint_id, path in sorted(manifest.items())]
+
+
+def _upload_one(client, ledger, blueprint_path, blueprint_id):
+    result = {'id': blueprint_id,
+              'blueprint': blueprint_path,
+              'status': 'uploaded',
+              'size': 0,
+              'duration': 0,
+              'error': None}
+    try:
+        digest = blueprints_ledger.blueprint_digest(blueprint_path)
+        if ledger is not None:
+            uploaded_blueprint_id = _find_uploaded(client, ledger, digest)
+            if uploaded_blueprint_id is not None:
+                result.update(id=uploaded_blueprint_id, status='skipped')
+                return result
+
+        stats = blueprint_archive.ArchiveStats()
+        blueprint_archive.upload_blueprint(
+            client, blueprint_path, blueprint_id, stats)
+        result.update(size=stats.size, duration=stats.upload_time)
+        if ledger is not None:
+            ledger.record(digest, blueprint_id)
+    except (CloudifyClientError, IOError, OSError) as e:
+        result.update(status='failed', error=str(e))
+    return result
+
+
+def _format_upload_result(result):
+    row = dict(result)
+    if result['status'] != 'uploaded':
+        row.update(size='', duration='', throughput='')
+        return row
+    row['size'] = utils.format_size(result['size'])
+    row['duration'] = '{0:.2f}s'.format(result['duration'])
+    if result['duration']:
+        row['throughput'] = '{0}/s'.format(
+            utils.format_size(result['size'] / result['duration']))
+    else:
+        row['throughput'] = ''
+    return row
 
 
 def publish_archive(archive_location, blueprint_filename, blueprint_id):
@@ -116,12 +380,18 @@ def determine_archive_type(archive_location):
     return os.path.expanduser(archive_location), 'url'
 
 
-def download(blueprint_id, output):
+def download(blueprint_id, output, sha256=None):
     logger = get_logger()
     logger.info('Downloading blueprint \'{0}\' ...'.format(blueprint_id))
     client = utils.get_rest_client()
-    target_file = client.blueprints.download(blueprint_id, output)
-    logger.info('Blueprint downloaded as {0}'.format(target_file))
+    result = downloads.download(
+        client,
+        '/blueprints/{0}/archive'.format(blueprint_id),
+        output,
+        expected_sha256=sha256,
+        progress_handler=downloads.log_progress(logger))
+    logger.info('Blueprint downloaded as {0} ({1})'
+                .format(result.path, result))
 
 
 def delete(blueprint_id):
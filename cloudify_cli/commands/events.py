@@ -17,16 +17,47 @@
 Handles all commands that start with 'cfy events'
 """
 
+import os
+import json
+import gzip
+
 from cloudify_cli import utils
+from cloudify_cli import events_cache
+from cloudify_cli import events_stats
 from cloudify_cli.exceptions import CloudifyCliError, \
     SuppressedCloudifyCliError
 from cloudify_cli.logger import get_logger, get_events_logger
 from cloudify_rest_client.exceptions import CloudifyClientError
+from cloudify_rest_client.executions import Execution
 from cloudify_cli.execution_events_fetcher import ExecutionEventsFetcher, \
-    wait_for_execution
+    DeploymentEventsFetcher, EventsFilter, EventsWatcher, wait_for_execution
+
+
+EXPORT_FILE_SUFFIX = '.ndjson.gz'
+EXPORT_CHECKPOINT_SUFFIX = '.checkpoint'
+EXPORT_BATCH_SIZE = 1000
+
 
+def ls(execution_id, deployment_id, include_logs, tail, json,
+       level=None, event_types=None, node_id=None, operation=None,
+       since=None, until=None):
+    events_filter = EventsFilter(level=level,
+                                 event_types=event_types,
+                                 node_id=node_id,
+                                 operation=operation,
+                                 since=since,
+                                 until=until)
+    # log levels only apply to logs
+    include_logs = include_logs or events_filter.include_logs
+    events_logger = get_events_logger(json)
+    if not events_filter.is_empty:
+        events_logger = events_filter.wrap(events_logger)
+
+    if deployment_id:
+        _ls_deployment(deployment_id, include_logs, tail, events_logger,
+                       events_filter)
+        return
 
-def ls(execution_id, include_logs, tail, json):
     logger = get_logger()
     rest_host = utils.get_rest_host()
     logger.info("Getting events from management server {0} for "
@@ -35,20 +66,24 @@ def ls(execution_id, include_logs, tail, json):
                                             execution_id,
                                             include_logs))
     client = utils.get_rest_client(rest_host)
+    execution_events_cache = _get_events_cache(
+        rest_host, execution_id, include_logs, events_filter)
     try:
         execution_events = ExecutionEventsFetcher(
             client,
             execution_id,
-            include_logs=include_logs)
-
-        events_logger = get_events_logger(json)
+            include_logs=include_logs,
+            events_cache=execution_events_cache,
+            events_filter=events_filter)
 
         if tail:
             execution = wait_for_execution(client,
                                            client.executions.get(execution_id),
                                            events_handler=events_logger,
                                            include_logs=include_logs,
-                                           timeout=None)   # don't timeout ever
+                                           timeout=None,   # don't timeout ever
+                                           events_cache=execution_events_cache,
+                                           events_filter=events_filter)
             if execution.error:
                 logger.info('Execution of workflow {0} for deployment '
                             '{1} failed. [error={2}]'.format(
@@ -65,8 +100,241 @@ def ls(execution_id, include_logs, tail, json):
             # don't tail, get only the events created until now and return
             events = execution_events.fetch_and_process_events(
                 events_handler=events_logger)
+            if not events_filter.is_empty:
+                events = events_filter.matched_count
             logger.info('\nTotal events: {0}'.format(events))
     except CloudifyClientError as e:
         if e.status_code != 404:
             raise
         raise CloudifyCliError('Execution {0} not found'.format(execution_id))
+
+
+def _ls_deployment(deployment_id, include_logs, tail, events_logger,
+                   events_filter):
+    logger = get_logger()
+    rest_host = utils.get_rest_host()
+    logger.info("Getting events from management server {0} for "
+                "deployment '{1}' "
+                "[include_logs={2}]".format(rest_host,
+                                            deployment_id,
+                                            include_logs))
+    client = utils.get_rest_client(rest_host)
+
+    def get_events_cache(execution_id):
+        return _get_events_cache(rest_host, execution_id, include_logs,
+                                 events_filter)
+
+    try:
+        deployment_events = DeploymentEventsFetcher(
+            client,
+            deployment_id,
+            include_logs=include_logs,
+            events_cache_getter=get_events_cache,
+            events_filter=events_filter)
+    except CloudifyClientError as e:
+        if e.status_code != 404:
+            raise
+        raise CloudifyCliError('Deployment {0} does not exist'.format(
+            deployment_id))
+
+    if tail:
+        logger.info('Tailing events of all executions of deployment {0}, '
+                    'press Ctrl+C to stop'.format(deployment_id))
+        deployment_events.tail(events_handler=events_logger)
+    else:
+        events = deployment_events.fetch_and_process_events(
+            events_handler=events_logger)
+        if not events_filter.is_empty:
+            events = events_filter.matched_count
+        logger.info('\nTotal events: {0}'.format(events))
+
+
+def _get_events_cache(rest_host, execution_id, include_logs, events_filter):
+    # the offsets of filtered events don't match the cached ones
+    if not events_filter.is_empty:
+        return None
+    return events_cache.get_execution_events_cache(
+        rest_host, execution_id, include_logs=include_logs)
+
+
+def stats(execution_id, group_by, json_output):
+    logger = get_logger()
+    rest_host = utils.get_rest_host()
+    # keep the output parsable when JSON is requested
+    log = logger.debug if json_output else logger.info
+    log("Getting events from management server {0} for "
+        "execution id '{1}'".format(rest_host, execution_id))
+    client = utils.get_rest_client(rest_host)
+    execution_stats = events_stats.ExecutionEventsStats()
+    try:
+        execution_events = ExecutionEventsFetcher(
+            client,
+            execution_id,
+            events_cache=events_cache.get_execution_events_cache(
+                rest_host, execution_id))
+        execution_events.fetch_and_process_events(
+            events_handler=execution_stats, timeout=None)
+    except CloudifyClientError as e:
+        if e.status_code != 404:
+            raise
+        raise CloudifyCliError('Execution {0} not found'.format(execution_id))
+
+    group_by_types = [group_by] if group_by else events_stats.GROUP_BY_TYPES
+    result = execution_stats.to_dict()
+    if json_output:
+        for other_group_by in events_stats.GROUP_BY_TYPES:
+            if other_group_by not in group_by_types:
+                del result[other_group_by]
+        logger.info(json.dumps(result, sort_keys=True, indent=2))
+        return
+
+    columns = ['tasks', 'succeeded', 'failed', 'retries', 'duration',
+               'max_duration', 'avg_queue_delay']
+    for group_by_type in group_by_types:
+        pt = utils.table([group_by_type] + columns,
+                         data=result[group_by_type])
+        utils.print_table('Tasks by {0}:'.format(
+            group_by_type.replace('_', ' ')), pt)
+    pt = utils.table(['start', 'duration', 'node_instance', 'operation',
+                      'status'],
+                     data=result['critical_path'])
+    utils.print_table('Critical path:', pt)
+    logger.info('Total events: {0}, wall time: {1}s'.format(
+        result['events'], result['wall_time']))
+    if result['open_tasks']:
+        logger.info('{0} task(s) have not ended yet'.format(
+            result['open_tasks']))
+
+
+def export(execution_ids, deployment_id, output, include_logs, concurrency):
+    logger = get_logger()
+    rest_host = utils.get_rest_host()
+    client = utils.get_rest_client(rest_host)
+
+    if deployment_id:
+        logger.info("Getting executions of deployment '{0}' from management "
+                    "server {1}".format(deployment_id, rest_host))
+        try:
+            execution_ids = [e.id for e in client.executions.list(
+                deployment_id=deployment_id,
+                include_system_workflows=True)]
+        except CloudifyClientError as e:
+            if e.status_code != 404:
+                raise
+            raise CloudifyCliError('Deployment {0} does not exist'.format(
+                deployment_id))
+
+    output = os.path.abspath(output or utils.get_cwd())
+    if not os.path.isdir(output):
+        os.makedirs(output)
+
+    logger.info('Exporting events of {0} execution(s) from management server '
+                '{1} to {2} [include_logs={3}]'.format(len(execution_ids),
+                                                       rest_host,
+                                                       output,
+                                                       include_logs))
+
+    def export_execution(execution_id):
+        try:
+            return _export_execution_events(client,
+                                            execution_id,
+                                            output,
+                                            include_logs)
+        except CloudifyClientError as e:
+            status = 'not found' if e.status_code == 404 \
+                else 'failed ({0})'.format(e)
+            return {'execution_id': execution_id,
+                    'events': '-',
+                    'status': status,
+                    'failed': True}
+
+    results = utils.run_concurrently(export_execution,
+                                     execution_ids,
+                                     concurrency)
+
+    pt = utils.table(['execution_id', 'events', 'status'], data=results)
+    utils.print_table('Exported executions:', pt)
+
+    if any(result['failed'] for result in results):
+        raise SuppressedCloudifyCliError()
+
+
+def _export_execution_events(client, execution_id, output_dir, include_logs):
+    """Append the execution's events to a gzipped NDJSON file
+
+    Every batch of events is written as a separate gzip member, after
+    which a checkpoint holding the events offset and the file's size is
+    dumped next to the file. An interrupted export is resumed from the
+    checkpoint, dropping whatever was written after it.
+    """
+    events_path = os.path.join(output_dir,
+                               execution_id + EXPORT_FILE_SUFFIX)
+    checkpoint_path = events_path + EXPORT_CHECKPOINT_SUFFIX
+    checkpoint = _load_export_checkpoint(checkpoint_path, events_path)
+    if checkpoint['completed']:
+        return {'execution_id': execution_id,
+                'events': checkpoint['offset'],
+                'status': 'already exported',
+                'failed': False}
+
+    # the status is checked before fetching, so that once the execution
+    # has ended, the fetch below is guaranteed to get all of its events
+    execution = client.executions.get(execution_id)
+    execution_ended = execution.status in Execution.END_STATES
+
+    def write_events(events):
+        with gzip.open(events_path, 'ab') as f:
+            for event in events:
+                f.write(json.dumps(event))
+                f.write('\n')
+        checkpoint['offset'] += len(events)
+        checkpoint['size'] = os.path.getsize(events_path)
+        _dump_export_checkpoint(checkpoint_path, checkpoint)
+
+    events_watcher = EventsWatcher(write_events)
+    events_watcher.end_log_received = checkpoint['end_log_received']
+    events_fetcher = ExecutionEventsFetcher(client,
+                                            execution_id,
+                                            batch_size=EXPORT_BATCH_SIZE,
+                                            include_logs=include_logs,
+                                            from_event=checkpoint['offset'])
+    events_count = events_fetcher.fetch_and_process_events(
+        events_handler=events_watcher, timeout=None)
+
+    checkpoint['end_log_received'] = events_watcher.end_log_received
+    checkpoint['completed'] = \
+        execution_ended and events_watcher.end_log_received
+    _dump_export_checkpoint(checkpoint_path, checkpoint)
+    return {'execution_id': execution_id,
+            'events': checkpoint['offset'],
+            'status': 'exported {0} new event(s){1}'.format(
+                events_count,
+                '' if checkpoint['completed'] else ' (execution not ended)'),
+            'failed': False}
+
+
+def _load_export_checkpoint(checkpoint_path, events_path):
+    if os.path.isfile(checkpoint_path):
+        with open(checkpoint_path) as f:
+            checkpoint = json.load(f)
+    else:
+        checkpoint = {'offset': 0,
+                      'size': 0,
+                      'end_log_received': False,
+                      'completed': False}
+    # drop events that were written after the last checkpoint
+    # (e.g. when the previous export was killed mid-batch)
+    if os.path.isfile(events_path):
+        with open(events_path, 'r+b') as f:
+            f.truncate(checkpoint['size'])
+    return checkpoint
+
+
+def _dump_export_checkpoint(checkpoint_path, checkpoint):
+    tmp_path = checkpoint_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+    # os.rename can't replace an existing file on windows
+    if os.name == 'nt' and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    os.rename(tmp_path, checkpoint_path)
@@ -0,0 +1,53 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+"""
+Handles all commands that start with 'cfy imports'
+"""
+
+from dsl_parser.parser import parse_from_path
+from dsl_parser.exceptions import DSLParsingException
+
+from cloudify_cli import utils
+from cloudify_cli import import_cache
+from cloudify_cli.logger import get_logger
+from cloudify_cli.exceptions import CloudifyCliError
+
+
+def prefetch(blueprint_path):
+    logger = get_logger()
+
+    logger.info("Fetching the remote imports of blueprint: {0}"
+                .format(blueprint_path.name))
+    resolver = import_cache.get_caching_resolver(
+        utils.get_import_resolver(), refresh=True)
+    try:
+        parse_from_path(
+            dsl_file_path=blueprint_path.name,
+            resolver=resolver,
+            validate_version=utils.is_validate_definitions_version())
+    except DSLParsingException as ex:
+        raise CloudifyCliError('Failed to fetch the imports of blueprint '
+                               '{0}'.format(str(ex)))
+
+    served = [{'import': import_url, 'status': status, 'size': size}
+              for import_url, status, size in resolver.served]
+    pt = utils.table(['import', 'status', 'size'], data=served)
+    utils.print_table('Remote imports:', pt)
+    stale = [import_url for import_url, status, _ in resolver.served
+             if status == import_cache.STATUS_STALE]
+    if stale:
+        logger.warning('{0} of the imports could not be fetched, and their '
+                       'cached copies may be outdated'.format(len(stale)))
@@ -22,6 +22,7 @@ import errno
 import urlparse
 
 from cloudify_cli import utils
+from cloudify_cli.logger import get_logger
 from cloudify_cli.commands import blueprints
 from cloudify_cli.commands import executions
 from cloudify_cli.commands import deployments
@@ -83,6 +84,7 @@ def install(blueprint_path, blueprint_id, validate_blueprint, archive_location,
                                    blueprint_id)
     else:
         blueprint_path_supplied = bool(blueprint_path)
+        blueprint_id_supplied = bool(blueprint_id)
         if not blueprint_path:
             blueprint_path = os.path.join(utils.get_cwd(),
                                           DEFAULT_BLUEPRINT_PATH)
@@ -103,9 +105,22 @@ def install(blueprint_path, blueprint_id, validate_blueprint, archive_location,
 
         try:
             with open(blueprint_path) as blueprint_file:
-                blueprints.upload(blueprint_file,
-                                  blueprint_id,
-                                  validate_blueprint)
+                # an unchanged blueprint is not uploaded again, unless
+                # it's explicitly uploaded with a new id
+                uploaded_blueprint_id = None
+                if not blueprint_id_supplied:
+                    uploaded_blueprint_id = \
+                        blueprints.find_uploaded(blueprint_path)
+                if uploaded_blueprint_id:
+                    get_logger().info(
+                        'Blueprint {0} was already uploaded. Using the '
+                        'uploaded blueprint {1}'.format(
+                            blueprint_path, uploaded_blueprint_id))
+                    blueprint_id = uploaded_blueprint_id
+                else:
+                    blueprints.upload(blueprint_file,
+                                      blueprint_id,
+                                      validate_blueprint)
         except IOError as e:
 
             # No such file or directory
@@ -22,12 +22,19 @@ import json
 import shutil
 
 from cloudify.workflows import local
+from dsl_parser import functions as dsl_functions
 
 from cloudify_cli import utils
 from cloudify_cli import common
+from cloudify_cli import import_cache
 from cloudify_cli import exceptions
+from cloudify_cli import local_storage
+from cloudify_cli import simulation
+from cloudify_cli import blueprint_watch
+from cloudify_cli import execution_timing
 from cloudify_cli.logger import get_logger
 from cloudify_cli.commands import init as cfy_init
+from cloudify_cli.constants import DEFAULT_LOCAL_STORAGE
 from cloudify_cli.constants import DEFAULT_BLUEPRINT_PATH
 from cloudify_cli.constants import DEFAULT_INSTALL_WORKFLOW
 from cloudify_cli.constants import DEFAULT_UNINSTALL_WORKFLOW
@@ -36,11 +43,15 @@ from cloudify_cli.constants import DEFAULT_INPUTS_PATH_FOR_INSTALL_COMMAND
 
 _NAME = 'local'
 _STORAGE_DIR_NAME = 'local-storage'
+_FINGERPRINT_FILE_NAME = 'fingerprint.json'
+
+# the environment of this process, when it's kept in memory storage
+_memory_env = None
 
 
 def install(blueprint_path, inputs, install_plugins, workflow_id, parameters,
             allow_custom_parameters, task_retries, task_retry_interval,
-            task_thread_pool_size):
+            task_thread_pool_size, storage=None, timing_report=None):
 
     # if no blueprint path was supplied, set it to a default value
     if not blueprint_path:
@@ -57,22 +68,52 @@ def install(blueprint_path, inputs, install_plugins, workflow_id, parameters,
 
     init(blueprint_path=blueprint_path,
          inputs=inputs,
-         install_plugins=install_plugins)
+         install_plugins=install_plugins,
+         storage=storage)
 
     # if no workflow was supplied, execute the `install` workflow
     if not workflow_id:
         workflow_id = DEFAULT_INSTALL_WORKFLOW
 
-    execute(workflow_id=workflow_id,
-            parameters=parameters,
-            allow_custom_parameters=allow_custom_parameters,
-            task_retries=task_retries,
-            task_retry_interval=task_retry_interval,
-            task_thread_pool_size=task_thread_pool_size)
+    try:
+        execute(workflow_id=workflow_id,
+                parameters=parameters,
+                allow_custom_parameters=allow_custom_parameters,
+                task_retries=task_retries,
+                task_retry_interval=task_retry_interval,
+                task_thread_pool_size=task_thread_pool_size,
+                timing_report=timing_report)
+    finally:
+        _forget_memory_env()
+
+
+def run(blueprint_path, inputs, install_plugins, workflow_ids, task_retries,
+        task_retry_interval, task_thread_pool_size, persist=False,
+        storage=None, timing_report=None):
+    if not blueprint_path:
+        blueprint_path = DEFAULT_BLUEPRINT_PATH
+    if not persist:
+        storage = local_storage.STORAGE_MEMORY
+    try:
+        init(blueprint_path=blueprint_path,
+             inputs=inputs,
+             install_plugins=install_plugins,
+             storage=storage)
+        with execution_timing.timing_report(timing_report):
+            for workflow_id in workflow_ids or [DEFAULT_INSTALL_WORKFLOW]:
+                execute(workflow_id=workflow_id,
+                        parameters=None,
+                        allow_custom_parameters=False,
+                        task_retries=task_retries,
+                        task_retry_interval=task_retry_interval,
+                        task_thread_pool_size=task_thread_pool_size)
+        outputs()
+    finally:
+        _forget_memory_env()
 
 
 def uninstall(workflow_id, parameters, allow_custom_parameters, task_retries,
-              task_retry_interval, task_thread_pool_size):
+              task_retry_interval, task_thread_pool_size, timing_report=None):
 
     # if no workflow was supplied, execute the `uninstall` workflow
     if not workflow_id:
@@ -83,7 +124,8 @@ def uninstall(workflow_id, parameters, allow_custom_parameters, task_retries,
             allow_custom_parameters=allow_custom_parameters,
             task_retries=task_retries,
             task_retry_interval=task_retry_interval,
-            task_thread_pool_size=task_thread_pool_size)
+            task_thread_pool_size=task_thread_pool_size,
+            timing_report=timing_report)
 
     # Remove the local-storage dir
     utils.remove_if_exists(_storage_dir())
@@ -96,20 +138,74 @@ def uninstall(workflow_id, parameters, allow_custom_parameters, task_retries,
 # The 'overshadowing' of the `install_plugins` parameter is totally fine
 def init(blueprint_path,
          inputs,
-         install_plugins):
-    if os.path.isdir(_storage_dir()):
-        shutil.rmtree(_storage_dir())
-
+         install_plugins,
+         offline=False,
+         storage=None,
+         watch=False):
+    _forget_memory_env()
+    current_storage = local_storage.storage_type(_storage_dir(), _NAME)
+    storage = storage or current_storage or DEFAULT_LOCAL_STORAGE
+    if watch and storage == local_storage.STORAGE_MEMORY:
+        raise exceptions.CloudifyCliError(
+            'An environment kept in memory cannot be watched')
     if not utils.is_initialized():
         cfy_init(reset_config=False, skip_logging=True)
+    resolver = utils.get_import_resolver()
+    if offline:
+        resolver = import_cache.get_caching_resolver(resolver, offline=True)
+    inputs = utils.inputs_to_dict(inputs, 'inputs')
+    _init_environment(blueprint_path, inputs, install_plugins, resolver,
+                      current_storage, storage)
+    if watch:
+        blueprint_watch.watch(
+            blueprint_path,
+            reinitialize=lambda: _reinit_environment(
+                blueprint_path, inputs, install_plugins, resolver, storage),
+            resolver=resolver,
+            validate_version=utils.CloudifyConfig()
+            .validate_definitions_version)
+
+
+def _init_environment(blueprint_path, inputs, install_plugins, resolver,
+                      current_storage, storage):
+    global _memory_env
+    logger = get_logger()
+    fingerprint = common.environment_fingerprint(
+        blueprint_path, inputs=inputs, resolver=resolver)
+    previous_fingerprint = _load_fingerprint()
+    unchanged = current_storage is not None and \
+        fingerprint == previous_fingerprint
+    migrate = (current_storage, storage) == (local_storage.STORAGE_FILE,
+                                             local_storage.STORAGE_SQLITE)
+    if unchanged and (storage == current_storage or migrate):
+        if install_plugins:
+            common.install_blueprint_plugins(blueprint_path=blueprint_path,
+                                             resolver=resolver)
+        if migrate:
+            migrate_storage()
+        logger.info('The blueprint, its imports, inputs and plugins are '
+                    'unchanged; keeping the initialized environment')
+        return
+    if previous_fingerprint:
+        # the parsed blueprint is reused (see `plan_cache`), so when only
+        # the inputs changed, only the deployment plan is prepared again
+        logger.info('Initializing again, as the {0} changed'.format(
+            ', '.join(sorted(part for part in fingerprint
+                             if fingerprint[part] !=
+                             previous_fingerprint.get(part)))))
+
+    # an environment kept in memory leaves the stored one as is
+    if storage != local_storage.STORAGE_MEMORY and \
+            os.path.isdir(_storage_dir()):
+        shutil.rmtree(_storage_dir())
     try:
-        common.initialize_blueprint(
+        env = common.initialize_blueprint(
             blueprint_path=blueprint_path,
             name=_NAME,
             inputs=inputs,
-            storage=_storage(),
+            storage=_storage(storage),
             install_plugins=install_plugins,
-            resolver=utils.get_import_resolver()
+            resolver=resolver
         )
     except ImportError as e:
 
@@ -125,10 +221,67 @@ def init(blueprint_path,
             .format(blueprint_path)
         ]
         raise
+    if storage == local_storage.STORAGE_MEMORY:
+        # kept for the rest of this command only (e.g. `cfy local install`)
+        _memory_env = env
+    else:
+        _dump_fingerprint(fingerprint)
+
+    logger.info("Initiated {0}\nIf you make changes to the "
+                "blueprint, run `cfy local init -p {0}` "
+                "again to apply them".format(blueprint_path))
 
-    get_logger().info("Initiated {0}\nIf you make changes to the "
-                      "blueprint, run `cfy local init -p {0}` "
-                      "again to apply them".format(blueprint_path))
+
+def _reinit_environment(blueprint_path, inputs, install_plugins, resolver,
+                        storage):
+    """Initialize the environment again from a changed blueprint, keeping
+    the runtime state of its unchanged nodes (see `blueprint_watch`)
+
+    The blueprint is parsed before the environment is touched, and the new
+    environment is built aside and swapped in once complete.
+    """
+    logger = get_logger()
+    fingerprint = common.environment_fingerprint(
+        blueprint_path, inputs=inputs, resolver=resolver)
+    if fingerprint == _load_fingerprint():
+        return False
+    previous_env = _load_env()
+    runtime_state = blueprint_watch.RuntimeState(previous_env)
+    _close_storage(previous_env.storage)
+    environment_dir = os.path.join(_storage_dir(), _NAME)
+    initialized_dir = os.path.join(_storage_dir(),
+                                   '.{0}.initializing'.format(_NAME))
+    if os.path.isdir(initialized_dir):
+        shutil.rmtree(initialized_dir)
+    os.makedirs(initialized_dir)
+    try:
+        env = common.initialize_blueprint(
+            blueprint_path=blueprint_path,
+            name=_NAME,
+            inputs=inputs,
+            storage=local_storage.create_storage(storage, initialized_dir),
+            install_plugins=install_plugins,
+            resolver=resolver,
+            runtime_state=runtime_state)
+        _close_storage(env.storage)
+        initialized_environment_dir = os.path.join(initialized_dir, _NAME)
+        workdir = os.path.join(environment_dir, 'workdir')
+        if os.path.isdir(workdir):
+            shutil.rmtree(os.path.join(initialized_environment_dir,
+                                       'workdir'), ignore_errors=True)
+            shutil.copytree(workdir, os.path.join(initialized_environment_dir,
+                                                  'workdir'))
+        local_storage.replace_directory(environment_dir,
+                                        initialized_environment_dir)
+    finally:
+        shutil.rmtree(initialized_dir, ignore_errors=True)
+    _dump_fingerprint(fingerprint)
+    logger.info('Kept the runtime state of {0} of {1} nodes{2}'.format(
+        len(runtime_state.kept_nodes),
+        len(env.plan['nodes']),
+        ': {0}'.format(', '.join(sorted(runtime_state.kept_nodes)))
+        if runtime_state.kept_nodes else ''))
+    return True
 
 
 def execute(workflow_id,
@@ -136,16 +289,35 @@ def execute(workflow_id,
             allow_custom_parameters,
             task_retries,
             task_retry_interval,
-            task_thread_pool_size):
+            task_thread_pool_size,
+            timing_report=None,
+            simulate=False,
+            simulate_duration=simulation.DEFAULT_OPERATION_DURATION,
+            simulate_durations_from=None):
     logger = get_logger()
     parameters = utils.inputs_to_dict(parameters, 'parameters')
     env = _load_env()
-    result = env.execute(workflow=workflow_id,
-                         parameters=parameters,
-                         allow_custom_parameters=allow_custom_parameters,
-                         task_retries=task_retries,
-                         task_retry_interval=task_retry_interval,
-                         task_thread_pool_size=task_thread_pool_size)
+    task_thread_pool_size = common.task_thread_pool_size(
+        env.plan, task_thread_pool_size)
+    with execution_timing.timing_report(timing_report):
+        if simulate:
+            simulation.execute(
+                env,
+                durations=simulation.Durations(simulate_duration,
+                                               simulate_durations_from),
+                workflow=workflow_id,
+                parameters=parameters,
+                allow_custom_parameters=allow_custom_parameters,
+                task_retries=task_retries,
+                task_retry_interval=task_retry_interval,
+                task_thread_pool_size=task_thread_pool_size)
+            return
+        result = env.execute(workflow=workflow_id,
+                             parameters=parameters,
+                             allow_custom_parameters=allow_custom_parameters,
+                             task_retries=task_retries,
+                             task_retry_interval=task_retry_interval,
+                             task_thread_pool_size=task_thread_pool_size)
     if result is not None:
         logger.info(json.dumps(result,
                                sort_keys=True,
@@ -155,24 +327,28 @@ def execute(workflow_id,
 def outputs():
     logger = get_logger()
     env = _load_env()
-    logger.info(json.dumps(env.outputs() or {},
-                           sort_keys=True,
-                           indent=2))
+    for line in utils.iter_json_object(_evaluate_outputs(env)):
+        logger.info(line)
 
 
-def instances(node_id):
+def instances(node_id, fields=None):
     logger = get_logger()
     env = _load_env()
-    node_instances = env.storage.get_node_instances()
-    if node_id:
-        node_instances = [instance for instance in node_instances
-                          if instance.node_id == node_id]
-        if not node_instances:
-            raise exceptions.CloudifyCliError(
-                'Could not find node {0}'.format(node_id))
-    logger.info(json.dumps(node_instances,
-                           sort_keys=True,
-                           indent=2))
+    node_instances = _node_instances(env.storage, node_id, fields)
+    for line in utils.iter_json_array(node_instances):
+        logger.info(line)
+
+
+def migrate_storage():
+    logger = get_logger()
+    if local_storage.storage_type(_storage_dir(), _NAME) != \
+            local_storage.STORAGE_FILE:
+        raise exceptions.CloudifyCliError(
+            '{0} has no local environment kept in file storage'
+            .format(utils.get_cwd()))
+    logger.info('Migrating the local environment to sqlite storage...')
+    local_storage.migrate_file_storage(_storage_dir(), _NAME)
+    logger.info('Local environment migrated to sqlite storage')
 
 
 def install_plugins(blueprint_path):
@@ -208,12 +384,73 @@ def _storage_dir():
     return os.path.join(utils.get_cwd(), _STORAGE_DIR_NAME)
 
 
-def _storage():
-    return local.FileStorage(storage_dir=_storage_dir())
+def _fingerprint_path():
+    return os.path.join(_storage_dir(), _FINGERPRINT_FILE_NAME)
+
+
+def _load_fingerprint():
+    """Return the fingerprint the local environment was initialized with,
+    or None if it isn't initialized
+    """
+    try:
+        with open(_fingerprint_path()) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def _dump_fingerprint(fingerprint):
+    with open(_fingerprint_path(), 'w') as f:
+        json.dump(fingerprint, f, indent=2, sort_keys=True)
+
+
+def _evaluate_outputs(env):
+    # each output is evaluated (and may then be written out) on its own,
+    # reading only the node instances it refers to
+    outputs_def = env.plan['outputs']
+    for name in sorted(outputs_def):
+        evaluated = dsl_functions.evaluate_outputs(
+            outputs_def={name: outputs_def[name]},
+            get_node_instances_method=env.storage.get_node_instances,
+            get_node_instance_method=env.storage.get_node_instance,
+            get_node_method=env.storage.get_node)
+        yield name, evaluated[name]
+
+
+def _node_instances(storage, node_id, fields):
+    found = False
+    for instance in local_storage.iter_node_instances(storage, node_id):
+        found = True
+        if fields is not None:
+            runtime_properties = instance.runtime_properties
+            instance['runtime_properties'] = dict(
+                (field, runtime_properties[field]) for field in fields
+                if field in runtime_properties)
+        yield instance
+    if node_id and not found:
+        raise exceptions.CloudifyCliError(
+            'Could not find node {0}'.format(node_id))
+
+
+def _close_storage(storage):
+    if isinstance(storage, local_storage.SQLiteStorage):
+        storage.close()
+
+
+def _forget_memory_env():
+    global _memory_env
+    _memory_env = None
+
+
+def _storage(storage_type):
+    return local_storage.create_storage(storage_type, _storage_dir())
 
 
 def _load_env():
-    if not os.path.isdir(_storage_dir()):
+    if _memory_env is not None:
+        return _memory_env
+    storage = local_storage.load_storage(_storage_dir(), _NAME)
+    if storage is None:
         error = exceptions.CloudifyCliError(
             '{0} has not been initialized with a blueprint.'.format(
                 utils.get_cwd()))
@@ -226,4 +463,4 @@ def _load_env():
         ]
         raise error
     return local.load_env(name=_NAME,
-                          storage=_storage())
+                          storage=storage)
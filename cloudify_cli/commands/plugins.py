@@ -16,39 +16,71 @@
 """
 Handles all commands that start with 'cfy plugins'
 """
+import os
+import json
+import time
 import tarfile
 
+import requests
+
+from cloudify_rest_client.exceptions import CloudifyClientError
+
 from cloudify_cli import utils
+from cloudify_cli import downloads
 from cloudify_cli.logger import get_logger
 from cloudify_cli.utils import print_table
+from cloudify_cli.constants import DEFAULT_CONCURRENCY
 from cloudify_cli.exceptions import CloudifyCliError
 
 
+WAGON_EXTENSION = '.wgn'
+
+
 def validate(plugin_path):
+    """Validate a plugin archive, and return its parsed package.json"""
     logger = get_logger()
 
     logger.info('Validating plugin {0}...'.format(plugin_path.name))
     if not tarfile.is_tarfile(plugin_path.name):
         raise CloudifyCliError('Archive {0} is of an unsupported type. Only '
                                'tar.gz is allowed'.format(plugin_path.name))
-    with tarfile.open(plugin_path.name, 'r') as tar:
-        tar_members = tar.getmembers()
-        package_json_path = "{0}/{1}".format(tar_members[0].name,
-                                             'package.json')
-        try:
-            package_member = tar.getmember(package_json_path)
-        except KeyError:
-            raise CloudifyCliError(
-                'Failed to validate plugin {0} '
-                '(package.json was not found in archive)'.format(plugin_path))
-        try:
-            tar.extractfile(package_member).read()
-        except:
-            raise CloudifyCliError(
-                'Failed to validate plugin {0} '
-                '(unable to read package.json)'.format(plugin_path))
+    package = _read_package_json(plugin_path)
+    # the archive's total member count isn't reported, as counting them
+    # would take a pass over the whole archive; the wheels are listed in
+    # package.json
+    details = [' '.join(str(package.get(key)) for key in
+                        ['package_name', 'package_version']),
+               utils.format_size(os.path.getsize(plugin_path.name))]
+    if 'wheels' in package:
+        details.append('{0} wheels'.format(len(package['wheels'])))
+    logger.info('Plugin validated successfully ({0})'
+                .format(', '.join(details)))
+    return package
+
+
+def _read_package_json(plugin_path):
+    """Return the parsed package.json of a plugin archive
 
-    logger.info('Plugin validated successfully')
+    The archive is read as a stream, and only up to package.json, rather
+    than decompressing and indexing the whole of it.
+    """
+    with tarfile.open(plugin_path.name, 'r|*') as tar:
+        package_json_path = None
+        for member in tar:
+            if package_json_path is None:
+                package_json_path = '{0}/{1}'.format(member.name,
+                                                     'package.json')
+            if member.name != package_json_path:
+                continue
+            try:
+                return json.loads(tar.extractfile(member).read())
+            except Exception:
+                raise CloudifyCliError(
+                    'Failed to validate plugin {0} '
+                    '(unable to read package.json)'.format(plugin_path))
+    raise CloudifyCliError(
+        'Failed to validate plugin {0} '
+        '(package.json was not found in archive)'.format(plugin_path))
 
 
 def delete(plugin_id, force):
@@ -70,15 +102,166 @@ def upload(plugin_path):
                         validate)
 
 
+def upload_many(plugin_path, concurrency):
+    logger = get_logger()
+    rest_host = utils.get_rest_host()
+    plugin_paths = _expand_plugin_paths(plugin_path)
+    logger.info('Uploading {0} plugins to management server {1}...'
+                .format(len(plugin_paths), rest_host))
+    client = utils.use_connection_pool(utils.get_rest_client(rest_host),
+                                       concurrency)
+    started = time.time()
+    results = upload_plugins(client, plugin_paths, concurrency)
+    elapsed = time.time() - started
+
+    failed = [result for result in results if result['status'] == 'failed']
+    uploaded = [result for result in results
+                if result['status'] == 'uploaded']
+    pt = utils.table(['id', 'plugin', 'package_name', 'package_version',
+                      'distribution', 'status', 'duration'],
+                     data=[_format_upload_result(result)
+                           for result in results])
+    print_table('Plugins:', pt)
+    for result in failed:
+        logger.info('Failed to upload plugin {0}: {1}'
+                    .format(result['plugin'], result['error']))
+    logger.info('Uploaded {0} plugins in {1:.2f} seconds, {2} were already '
+                'uploaded'.format(len(uploaded),
+                                  elapsed,
+                                  len(results) - len(uploaded) - len(failed)))
+    if failed:
+        raise CloudifyCliError('{0} of {1} plugins failed to upload'
+                               .format(len(failed), len(results)))
+
+
+def _expand_plugin_paths(plugin_paths):
+    """Return the plugin archives in `plugin_paths`, in which directories
+    stand for all of the wagons (`.wgn` files) directly in them
+    """
+    expanded = []
+    for plugin_path in plugin_paths:
+        plugin_path = os.path.expanduser(plugin_path)
+        if os.path.isdir(plugin_path):
+            wagons = sorted(
+                os.path.join(plugin_path, name)
+                for name in os.listdir(plugin_path)
+                if name.endswith(WAGON_EXTENSION) and
+                os.path.isfile(os.path.join(plugin_path, name)))
+            if not wagons:
+                raise CloudifyCliError(
+                    'No plugins were found in {0} (expected {1} files)'
+                    .format(plugin_path, WAGON_EXTENSION))
+            expanded.extend(wagons)
+        elif os.path.isfile(plugin_path):
+            expanded.append(plugin_path)
+        else:
+            raise CloudifyCliError('Plugin {0} was not found'
+                                   .format(plugin_path))
+    return expanded
+
+
+def upload_plugins(client, plugin_paths, concurrency=DEFAULT_CONCURRENCY,
+                   upload_plugin=None):
+    """Validate and upload many plugins, `concurrency` at a time
+
+    Plugins whose package name, version and distribution already exist
+    on the manager (or earlier in `plugin_paths`) are skipped.
+
+    :param upload_plugin: uploads a single plugin archive, given its path,
+                          and returns the uploaded plugin (defaults to
+                          `client.plugins.upload`)
+    :return: a dict per plugin, with its `status` (uploaded, skipped or
+             failed), and its `id` or the `error` it failed with
+    """
+    upload_plugin = upload_plugin or client.plugins.upload
+    results = utils.run_concurrently(_validate_one, plugin_paths,
+                                     concurrency)
+
+    # a single call, rather than a call per plugin
+    existing = dict(
+        (_plugin_key(plugin.package_name, plugin.package_version,
+                     plugin.distribution), plugin.id)
+        for plugin in client.plugins.list(
+            _include=['id', 'package_name', 'package_version',
+                      'distribution']))
+    to_upload = []
+    for result in results:
+        if result['status'] == 'failed':
+            continue
+        key = _plugin_key(result['package_name'], result['package_version'],
+                          result['distribution'])
+        if key in existing:
+            result.update(status='skipped', id=existing[key])
+        else:
+            existing[key] = None
+            to_upload.append(result)
+
+    def _upload_one(result):
+        started = time.time()
+        try:
+            plugin = upload_plugin(result['plugin'])
+            result.update(status='uploaded', id=plugin.id)
+        except (CloudifyClientError, requests.RequestException, IOError,
+                OSError) as e:
+            result.update(status='failed', error=str(e))
+        result['duration'] = time.time() - started
+
+    utils.run_concurrently(_upload_one, to_upload, concurrency)
+    return results
+
+
+def _validate_one(plugin_path):
+    result = {'plugin': plugin_path,
+              'package_name': None,
+              'package_version': None,
+              'distribution': None,
+              'status': None,
+              'id': None,
+              'duration': 0,
+              'error': None}
+    try:
+        with open(plugin_path) as f:
+            package = validate(f)
+    except (CloudifyCliError, IOError, OSError) as e:
+        result.update(status='failed', error=str(e))
+        return result
+    result.update(
+        package_name=package.get('package_name'),
+        package_version=package.get('package_version'),
+        distribution=package.get('build_server_os_properties', {})
+        .get('distribution'))
+    return result
+
+
+def _plugin_key(package_name, package_version, distribution):
+    return package_name, package_version, (distribution or '').lower()
+
+
+def _format_upload_result(result):
+    row = dict(result)
+    if result['status'] == 'uploaded':
+        row['duration'] = '{0:.2f}s'.format(result['duration'])
+    else:
+        row['duration'] = ''
+    return row
+
+
 def download(plugin_id,
-             output):
+             output,
+             sha256=None):
     logger = get_logger()
     rest_host = utils.get_rest_host()
     logger.info('Downloading plugin \'{0}\' from management server {1}...'
                 .format(plugin_id, rest_host))
     client = utils.get_rest_client(rest_host)
-    target_file = client.plugins.download(plugin_id, output)
-    logger.info('Plugin downloaded as {0}'.format(target_file))
+    result = downloads.download(
+        client,
+        '/plugins/{0}/archive'.format(plugin_id),
+        output,
+        expected_sha256=sha256,
+        progress_handler=downloads.log_progress(logger))
+    logger.info('Plugin downloaded as {0} ({1})'
+                .format(result.path, result))
 
 
 fields = ['id', 'package_name', 'package_version', 'supported_platform',
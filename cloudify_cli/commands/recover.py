@@ -32,7 +32,8 @@ def recover(force,
             task_retries,
             task_retry_interval,
             task_thread_pool_size,
-            snapshot_path):
+            snapshot_path,
+            bandwidth_limit=None):
     logger = get_logger()
     if not force:
         msg = ("This action requires additional "
@@ -90,9 +91,11 @@ def recover(force,
     settings = utils.load_cloudify_working_dir_settings()
     provider_context = settings.get_provider_context()
     bs.read_manager_deployment_dump_if_needed(
-        provider_context.get('cloudify', {}).get('manager_deployment'))
+        provider_context.get('cloudify', {}).get('manager_deployment'),
+        key_filename=key_path)
     bs.recover(task_retries=task_retries,
                task_retry_interval=task_retry_interval,
                task_thread_pool_size=task_thread_pool_size,
-               snapshot_path=snapshot_path)
+               snapshot_path=snapshot_path,
+               bandwidth_limit=bandwidth_limit)
     logger.info('Manager recovered successfully')
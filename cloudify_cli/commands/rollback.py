@@ -20,6 +20,7 @@ import json
 from cloudify_cli import utils
 from cloudify_cli import common
 from cloudify_cli import exceptions
+from cloudify_cli import execution_timing
 from cloudify_cli.logger import get_logger
 from cloudify_cli.commands.upgrade import update_inputs
 from cloudify_cli.commands.upgrade import put_workflow_state_file
@@ -31,7 +32,8 @@ def rollback(blueprint_path,
              inputs,
              install_plugins,
              task_retries,
-             task_retry_interval):
+             task_retry_interval,
+             timing_report=None):
 
     logger = get_logger()
     management_ip = utils.get_management_server_ip()
@@ -57,13 +59,14 @@ def rollback(blueprint_path,
                             port=inputs['ssh_port'])
 
     logger.info('Executing Manager rollback...')
-    try:
-        env.execute('install',
-                    task_retries=task_retries,
-                    task_retry_interval=task_retry_interval)
-    except Exception as e:
-        msg = 'Failed to rollback Manager upgrade. Error: {0}'.format(e)
-        raise exceptions.CloudifyCliError(msg)
+    with execution_timing.timing_report(timing_report):
+        try:
+            env.execute('install',
+                        task_retries=task_retries,
+                        task_retry_interval=task_retry_interval)
+        except Exception as e:
+            msg = 'Failed to rollback Manager upgrade. Error: {0}'.format(e)
+            raise exceptions.CloudifyCliError(msg)
 
     logger.info('Rollback complete. Management server is up at {0}'
                 .format(inputs['public_ip']))
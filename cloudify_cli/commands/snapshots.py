@@ -18,6 +18,8 @@ Handles all commands that start with 'cfy snapshots'
 """
 
 from cloudify_cli import utils
+from cloudify_cli import uploads
+from cloudify_cli import downloads
 from cloudify_cli.logger import get_logger
 from cloudify_cli.utils import print_table
 
@@ -57,25 +59,36 @@ def delete(snapshot_id):
     logger.info('Snapshot deleted successfully')
 
 
-def upload(snapshot_path, snapshot_id):
+def upload(snapshot_path, snapshot_id, bandwidth_limit=None):
     logger = get_logger()
     rest_host = utils.get_rest_host()
     logger.info("Uploading snapshot '{0}' to management server {1}"
                 .format(snapshot_path.name, rest_host))
     client = utils.get_rest_client(rest_host)
-    snapshot = client.snapshots.upload(snapshot_path.name, snapshot_id)
-    logger.info("Snapshot uploaded. The snapshot's id is {0}".format(
-        snapshot.id))
+    snapshot, result = uploads.upload_snapshot(
+        client,
+        snapshot_path.name,
+        snapshot_id,
+        bandwidth_limit=bandwidth_limit,
+        progress_handler=downloads.log_progress(logger, 'Uploaded'))
+    logger.info("Snapshot uploaded ({0}). The snapshot's id is {1}".format(
+        result, snapshot.id))
 
 
-def download(snapshot_id, output):
+def download(snapshot_id, output, sha256=None):
     logger = get_logger()
     rest_host = utils.get_rest_host()
     logger.info("Downloading snapshot '{0}'... [manager={1}]".format(
         snapshot_id, rest_host))
     client = utils.get_rest_client(rest_host)
-    target_file = client.snapshots.download(snapshot_id, output)
-    logger.info('Snapshot downloaded as {0}'.format(target_file))
+    result = downloads.download(
+        client,
+        '/snapshots/{0}/archive'.format(snapshot_id),
+        output,
+        expected_sha256=sha256,
+        progress_handler=downloads.log_progress(logger))
+    logger.info('Snapshot downloaded as {0} ({1})'
+                .format(result.path, result))
 
 
 def ls(sort_by=None, descending=False):
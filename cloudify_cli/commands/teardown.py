@@ -21,12 +21,13 @@ from cloudify_rest_client.exceptions import CloudifyClientError
 
 from cloudify_cli import utils
 from cloudify_cli import exceptions
+from cloudify_cli import execution_timing
 from cloudify_cli.commands.use import use
 from cloudify_cli.logger import get_logger
 from cloudify_cli.bootstrap import bootstrap as bs
 
 
-def teardown(force, ignore_deployments):
+def teardown(force, ignore_deployments, timing_report=None):
 
     _validate_force(force)
 
@@ -56,7 +57,7 @@ def teardown(force, ignore_deployments):
                 "directory you initially bootstrapped from, or from the last "
                 "directory a `cfy use` command was executed on this manager.")
         else:
-            _do_teardown()
+            _do_teardown(timing_report)
     else:
         # make sure we don't teardown the manager if there are running
         # deployments, unless the user explicitly specified it.
@@ -67,7 +68,7 @@ def teardown(force, ignore_deployments):
         _update_local_provider_context(management_ip)
 
         # execute teardown
-        _do_teardown()
+        _do_teardown(timing_report)
 
 
 def _update_local_provider_context(management_ip):
@@ -116,13 +117,14 @@ def _validate_force(force):
             "command should be executed.")
 
 
-def _do_teardown():
+def _do_teardown(timing_report=None):
     # reload settings since the provider context maybe changed
     settings = utils.load_cloudify_working_dir_settings()
     provider_context = settings.get_provider_context()
     bs.read_manager_deployment_dump_if_needed(
         provider_context.get('cloudify', {}).get('manager_deployment'))
-    bs.teardown()
+    with execution_timing.timing_report(timing_report):
+        bs.teardown()
     # cleaning relevant data from working directory settings
     with utils.update_wd_settings() as wd_settings:
         # wd_settings.set_provider_context(provider_context)
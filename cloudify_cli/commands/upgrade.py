@@ -26,6 +26,7 @@ from cloudify_cli import ssh
 from cloudify_cli import utils
 from cloudify_cli import common
 from cloudify_cli import exceptions
+from cloudify_cli import execution_timing
 from cloudify_cli.logger import get_logger
 from cloudify_cli.commands import maintenance
 from cloudify_cli.bootstrap import bootstrap as bs
@@ -45,7 +46,8 @@ def upgrade(validate_only,
             install_plugins,
             task_retries,
             task_retry_interval,
-            task_thread_pool_size):
+            task_thread_pool_size,
+            timing_report=None):
 
     logger = get_logger()
     management_ip = utils.get_management_server_ip()
@@ -62,66 +64,70 @@ def upgrade(validate_only,
                                       install_plugins=install_plugins,
                                       name=env_name,
                                       inputs=json.dumps(inputs))
+    task_thread_pool_size = common.task_thread_pool_size(
+        env.plan, task_thread_pool_size)
     logger.info('Upgrading manager...')
     put_workflow_state_file(is_upgrade=True,
                             key_filename=inputs['ssh_key_filename'],
                             user=inputs['ssh_user'],
                             port=inputs['ssh_port'])
-    if not skip_validations:
-        logger.info('Executing upgrade validations...')
-        env.execute(workflow='execute_operation',
-                    parameters={'operation':
-                                'cloudify.interfaces.validation.creation'},
-                    task_retries=task_retries,
-                    task_retry_interval=task_retry_interval,
-                    task_thread_pool_size=task_thread_pool_size)
-        logger.info('Upgrade validation completed successfully')
-
-    if not validate_only:
-        try:
-            logger.info('Executing manager upgrade...')
-            env.execute('install',
+    with execution_timing.timing_report(timing_report):
+        if not skip_validations:
+            logger.info('Executing upgrade validations...')
+            env.execute(workflow='execute_operation',
+                        parameters={'operation':
+                                    'cloudify.interfaces.validation.creation'},
                         task_retries=task_retries,
                         task_retry_interval=task_retry_interval,
                         task_thread_pool_size=task_thread_pool_size)
-        except Exception as e:
-            msg = 'Upgrade failed! ({0})'.format(e)
-            error = exceptions.CloudifyCliError(msg)
-            error.possible_solutions = [
-                "Rerun upgrade: `cfy upgrade`",
-                "Execute rollback: `cfy rollback`"
-            ]
-            raise error
-
-        manager_node = next(node for node in env.storage.get_nodes()
-                            if node.id == 'manager_configuration')
-        upload_resources = \
-            manager_node.properties['cloudify'].get('upload_resources', {})
-        dsl_resources = upload_resources.get('dsl_resources', ())
-        if dsl_resources:
-            fetch_timeout = upload_resources.get('parameters', {}) \
-                .get('fetch_timeout', 30)
-            fabric_env = bs.build_fabric_env(management_ip,
-                                             inputs['ssh_user'],
-                                             inputs['ssh_key_filename'],
-                                             manager_port=inputs['ssh_port'])
-            temp_dir = tempfile.mkdtemp()
+            logger.info('Upgrade validation completed successfully')
+
+        if not validate_only:
             try:
-                logger.info('Uploading dsl resources...')
-                bs.upload_dsl_resources(dsl_resources,
-                                        temp_dir=temp_dir,
-                                        fabric_env=fabric_env,
-                                        retries=task_retries,
-                                        wait_interval=task_retry_interval,
-                                        timeout=fetch_timeout)
-            finally:
-                shutil.rmtree(temp_dir, ignore_errors=True)
-
-        plugin_resources = upload_resources.get('plugin_resources', ())
-        if plugin_resources:
-            logger.warn('Plugins upload is not supported for upgrade. Plugins '
-                        '{0} will not be uploaded'
-                        .format(plugin_resources))
+                logger.info('Executing manager upgrade...')
+                env.execute('install',
+                            task_retries=task_retries,
+                            task_retry_interval=task_retry_interval,
+                            task_thread_pool_size=task_thread_pool_size)
+            except Exception as e:
+                msg = 'Upgrade failed! ({0})'.format(e)
+                error = exceptions.CloudifyCliError(msg)
+                error.possible_solutions = [
+                    "Rerun upgrade: `cfy upgrade`",
+                    "Execute rollback: `cfy rollback`"
+                ]
+                raise error
+
+            manager_node = next(node for node in env.storage.get_nodes()
+                                if node.id == 'manager_configuration')
+            upload_resources = \
+                manager_node.properties['cloudify'].get('upload_resources', {})
+            dsl_resources = upload_resources.get('dsl_resources', ())
+            if dsl_resources:
+                fetch_timeout = upload_resources.get('parameters', {}) \
+                    .get('fetch_timeout', 30)
+                fabric_env = bs.build_fabric_env(
+                    management_ip,
+                    inputs['ssh_user'],
+                    inputs['ssh_key_filename'],
+                    manager_port=inputs['ssh_port'])
+                temp_dir = tempfile.mkdtemp()
+                try:
+                    logger.info('Uploading dsl resources...')
+                    bs.upload_dsl_resources(dsl_resources,
+                                            temp_dir=temp_dir,
+                                            fabric_env=fabric_env,
+                                            retries=task_retries,
+                                            wait_interval=task_retry_interval,
+                                            timeout=fetch_timeout)
+                finally:
+                    shutil.rmtree(temp_dir, ignore_errors=True)
+
+            plugin_resources = upload_resources.get('plugin_resources', ())
+            if plugin_resources:
+                logger.warn('Plugins upload is not supported for upgrade. '
+                            'Plugins {0} will not be uploaded'
+                            .format(plugin_resources))
 
     logger.info('Upgrade complete')
     logger.info('Manager is up at {0}'.format(
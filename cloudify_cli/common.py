@@ -16,16 +16,24 @@
 
 import os
 import sys
+import json
+import hashlib
+import collections
+import multiprocessing
 import tempfile
 
 from cloudify.workflows import local
 from cloudify.utils import LocalCommandRunner
-from dsl_parser.parser import parse_from_path
+from cloudify_rest_client.nodes import Node
+from cloudify_rest_client.node_instances import NodeInstance
+from dsl_parser import tasks as dsl_tasks
 from dsl_parser import constants as dsl_constants
 
 from cloudify_cli import utils
 from cloudify_cli import constants
+from cloudify_cli import plan_cache
 from cloudify_cli import exceptions
+from cloudify_cli import wheel_cache
 from cloudify_cli.logger import get_logger
 
 
@@ -34,30 +42,172 @@ def initialize_blueprint(blueprint_path,
                          storage,
                          install_plugins=False,
                          inputs=None,
-                         resolver=None):
+                         resolver=None,
+                         runtime_state=None):
     if install_plugins:
         install_blueprint_plugins(
-            blueprint_path=blueprint_path
+            blueprint_path=blueprint_path,
+            resolver=resolver
         )
 
     config = utils.CloudifyConfig()
     inputs = utils.inputs_to_dict(inputs, 'inputs')
-    return local.init_env(
+    plan = plan_cache.parse_blueprint(
+        blueprint_path,
+        resolver=resolver,
+        validate_version=config.validate_definitions_version)
+    return _PlannedEnvironment(
+        plan=dsl_tasks.prepare_deployment_plan(plan, inputs=inputs),
         blueprint_path=blueprint_path,
         name=name,
-        inputs=inputs,
-        storage=storage,
+        storage=storage or local.InMemoryStorage(),
         ignored_modules=constants.IGNORED_LOCAL_WORKFLOW_MODULES,
         provider_context=config.local_provider_context,
-        resolver=resolver,
-        validate_version=config.validate_definitions_version)
+        runtime_state=runtime_state)
+
+
+def environment_fingerprint(blueprint_path, inputs=None, resolver=None):
+    """Return the digests of everything a local environment is initialized
+    from: the blueprint and its imports, the inputs, the plugins and the
+    provider context
+
+    `inputs` are the already parsed inputs (see `utils.inputs_to_dict`).
+    """
+    config = utils.CloudifyConfig()
+    return {
+        'blueprint': plan_cache.blueprint_fingerprint(
+            blueprint_path,
+            resolver=resolver,
+            validate_version=config.validate_definitions_version),
+        'inputs': _json_digest(inputs or {}),
+        'plugins': _json_digest(sorted(create_requirements(
+            blueprint_path, resolver=resolver))),
+        'provider_context': _json_digest(config.local_provider_context)
+    }
+
+
+def _json_digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True)).hexdigest()
+
+
+def task_thread_pool_size(plan, requested=None):
+    """Return the size of the thread pool to execute a local workflow's
+    tasks in
+
+    :param requested: a number of threads, `auto`, or None for the
+                      configured default (see `task_thread_pool_size` in
+                      the CLI configuration)
+
+    `auto` sizes the pool after the widest layer of the plan's node
+    instance graph: node instances the same number of relationships away
+    from instances without relationships may be operated on at once. The
+    size is capped at the configured `max_task_thread_pool_size`, or at a
+    number of threads per CPU.
+    """
+    config = utils.CloudifyConfig() if utils.is_initialized() else None
+    if requested is None:
+        requested = config.task_thread_pool_size if config \
+            else constants.DEFAULT_TASK_THREAD_POOL_SIZE
+    if requested != constants.AUTO_TASK_THREAD_POOL_SIZE:
+        return int(requested)
+    limit = config and config.max_task_thread_pool_size or \
+        multiprocessing.cpu_count() * \
+        constants.AUTO_TASK_THREAD_POOL_SIZE_PER_CPU
+    width = graph_width(plan['node_instances'])
+    size = max(1, min(width, limit))
+    get_logger().debug('Executing tasks in a pool of {0} threads (the '
+                       'widest layer of the blueprint has {1} node '
+                       'instances; the limit is {2})'
+                       .format(size, width, limit))
+    return size
 
 
-def install_blueprint_plugins(blueprint_path):
+def graph_width(node_instances):
+    """Return the number of node instances in the widest layer of the
+    node instance graph (see `task_thread_pool_size`)
+    """
+    # layers by the longest chain of relationships leading to an instance,
+    # in topological order (a relationship's target comes first)
+    targets = dict((instance['id'],
+                    set(relationship['target_id'] for relationship
+                        in instance.get('relationships') or [])) for
+                   instance in node_instances)
+    sources = dict((instance_id, []) for instance_id in targets)
+    for instance_id, instance_targets in targets.items():
+        for target_id in instance_targets:
+            sources.setdefault(target_id, []).append(instance_id)
+    pending = dict((instance_id, len(instance_targets))
+                   for instance_id, instance_targets in targets.items())
+    layers = dict((instance_id, 0) for instance_id, count in pending.items()
+                  if count == 0)
+    ready = list(layers)
+    while ready:
+        instance_id = ready.pop()
+        for source_id in sources.get(instance_id, []):
+            layers[source_id] = max(layers.get(source_id, 0),
+                                    layers[instance_id] + 1)
+            pending[source_id] -= 1
+            if pending[source_id] == 0:
+                ready.append(source_id)
+    widths = collections.Counter(layers.values())
+    return max(widths.values()) if widths else 0
+
+
+class _PlannedEnvironment(local._Environment):
+    """A local environment, initialized with an already prepared plan
+    rather than parsing its blueprint again (see `plan_cache`)
+
+    `local._Environment` parses the blueprint in a module level function
+    (`local._parse_plan`) rather than a method, so this follows that
+    function past its parsing: nodes and node instances are prepared with
+    `local._prepare_nodes_and_instances` of the pinned
+    cloudify-plugins-common version. `test_plan_cache` checks that the
+    result matches `local.init_env`'s.
+
+    :param runtime_state: the runtime state of a previous environment to
+                          carry over (see `blueprint_watch.RuntimeState`)
+    """
+
+    def __init__(self, plan, blueprint_path, name, storage,
+                 ignored_modules=None, provider_context=None,
+                 runtime_state=None):
+        if local.dsl_parser is None:
+            # the same error local.init_env raises
+            raise ImportError('cloudify-dsl-parser must be installed to '
+                              'execute local workflows. '
+                              '(e.g. "pip install cloudify-dsl-parser") '
+                              '[{0}]'.format(local._import_error))
+        self.storage = storage
+        self.storage.env = self
+        if runtime_state is not None:
+            runtime_state.rename_node_instances(plan)
+        nodes = [Node(node) for node in plan['nodes']]
+        node_instances = [NodeInstance(instance)
+                          for instance in plan['node_instances']]
+        local._prepare_nodes_and_instances(nodes, node_instances,
+                                           ignored_modules)
+        if runtime_state is not None:
+            runtime_state.restore_node_instances(node_instances)
+        storage.init(
+            name=name,
+            plan=plan,
+            nodes=nodes,
+            node_instances=node_instances,
+            blueprint_path=blueprint_path,
+            provider_context=provider_context)
+
+
+def install_blueprint_plugins(blueprint_path, resolver=None):
 
     requirements = create_requirements(
-        blueprint_path=blueprint_path
+        blueprint_path=blueprint_path,
+        resolver=resolver
     )
+    installed = _installed_requirements(blueprint_path, resolver=resolver)
+    if installed:
+        get_logger().info('{0} plugins are already installed: {1}'.format(
+            len(installed), ', '.join(sorted(installed))))
+        requirements -= installed
 
     if requirements:
         # validate we are inside a virtual env
@@ -66,6 +216,14 @@ def install_blueprint_plugins(blueprint_path):
                 'You must be running inside a '
                 'virtualenv to install blueprint plugins')
 
+        cache = wheel_cache.get_wheel_cache()
+        if cache is not None:
+            # sources that can't be built into wheels are left to pip
+            requirements = wheel_cache.install_plugins(
+                cache, sorted(requirements))
+        if not requirements:
+            return
+
         runner = LocalCommandRunner(get_logger())
         # dump the requirements to a file
         # and let pip install it.
@@ -80,9 +238,32 @@ def install_blueprint_plugins(blueprint_path):
         get_logger().debug('There are no plugins to install')
 
 
-def create_requirements(blueprint_path):
+def create_requirements(blueprint_path, resolver=None):
+    return set(_plugins_by_requirement(blueprint_path, resolver=resolver))
+
+
+def _installed_requirements(blueprint_path, resolver=None):
+    """Return the requirements of the blueprint's plugins that declare
+    their package (`package_name` and `package_version`), and whose
+    package is already installed
+    """
+    installed = set()
+    for requirement, plugin in _plugins_by_requirement(
+            blueprint_path, resolver=resolver).items():
+        package_name = plugin.get(dsl_constants.PLUGIN_PACKAGE_NAME)
+        package_version = plugin.get(dsl_constants.PLUGIN_PACKAGE_VERSION)
+        if package_name and package_version and \
+                wheel_cache.is_installed(package_name, package_version):
+            installed.add(requirement)
+    return installed
+
+
+def _plugins_by_requirement(blueprint_path, resolver=None):
 
-    parsed_dsl = parse_from_path(dsl_file_path=blueprint_path)
+    parsed_dsl = plan_cache.parse_blueprint(
+        blueprint_path,
+        resolver=resolver or utils.get_import_resolver(),
+        validate_version=utils.is_validate_definitions_version())
 
     requirements = _plugins_to_requirements(
         blueprint_path=blueprint_path,
@@ -104,7 +285,7 @@ def create_requirements(blueprint_path):
 
 def _plugins_to_requirements(blueprint_path, plugins):
 
-    sources = set()
+    sources = {}
     for plugin in plugins:
         if plugin[dsl_constants.PLUGIN_INSTALL_KEY]:
             source = plugin[
@@ -114,14 +295,14 @@ def _plugins_to_requirements(blueprint_path, plugins):
                 continue
             if '://' in source:
                 # URL
-                sources.add(source)
+                sources[source] = plugin
             else:
                 # Local plugin (should reside under the 'plugins' dir)
                 plugin_path = os.path.join(
                     os.path.abspath(os.path.dirname(blueprint_path)),
                     'plugins',
                     source)
-                sources.add(plugin_path)
+                sources[plugin_path] = plugin
     return sources
 
 
@@ -19,15 +19,22 @@ import os
 import argparse
 
 from cloudify_cli import utils
+from cloudify_cli import events_stats
+from cloudify_cli import local_storage
+from cloudify_cli import simulation
+from cloudify_cli import execution_timing
 from cloudify_cli import commands as cfy
 from cloudify_cli.config import completion_utils
 from cloudify_cli.config.argument_utils import remove_type
 from cloudify_cli.config.argument_utils import make_required
 from cloudify_cli.config.argument_utils import make_optional
 from cloudify_cli.config.argument_utils import remove_completer
+from cloudify_cli.execution_events_fetcher import LOG_LEVELS
 
 from cloudify_cli.constants import DEFAULT_TIMEOUT
 from cloudify_cli.constants import DEFAULT_REST_PORT
+from cloudify_cli.constants import DEFAULT_CONCURRENCY
+from cloudify_cli.constants import DEFAULT_LOCAL_STORAGE
 from cloudify_cli.constants import DEFAULT_BLUEPRINT_PATH
 from cloudify_cli.constants import DEFAULT_INSTALL_WORKFLOW
 from cloudify_cli.constants import DEFAULT_UNINSTALL_WORKFLOW
@@ -208,6 +215,58 @@ def install_plugins_argument():
     }
 
 
+def offline_argument():
+    return {
+        'dest': 'offline',
+        'action': 'store_true',
+        'help': 'Only use remote imports already in the imports cache '
+                '(see `cfy imports prefetch`)'
+    }
+
+
+def local_storage_argument():
+    return {
+        'dest': 'storage',
+        'choices': local_storage.STORAGE_TYPES,
+        'help': 'Where to keep the local environment: a SQLite database '
+                '(sqlite), a directory of files (file) or memory, for the '
+                'current command only (memory). (default: the storage of '
+                'the existing environment, or {0})'
+                .format(DEFAULT_LOCAL_STORAGE)
+    }
+
+
+def timing_report_argument():
+    return {
+        'dest': 'timing_report',
+        'nargs': '?',
+        'const': execution_timing.DEFAULT_TIMING_REPORT_PATH,
+        'metavar': 'JSON_PATH',
+        'help': 'Report the slowest tasks, the tasks by operation and the '
+                'critical path of the executed workflows, and write the '
+                'timing of every task to JSON_PATH (default: {0})'
+                .format(execution_timing.DEFAULT_TIMING_REPORT_PATH)
+    }
+
+
+def bandwidth_limit_argument():
+    return {
+        'dest': 'bandwidth_limit',
+        'metavar': 'RATE',
+        'type': utils.parse_size,
+        'help': 'Cap the upload rate, in bytes a second (e.g. 512K, 10M)'
+    }
+
+
+def sha256_argument():
+    return {
+        'dest': 'sha256',
+        'metavar': 'DIGEST',
+        'help': 'The expected SHA256 digest of the downloaded file; the '
+                'download fails if it does not match'
+    }
+
+
 def task_retries_argument(default_value):
     return {
         'dest': 'task_retries',
@@ -229,9 +288,12 @@ def task_retry_interval_argument(default_value):
 def task_thread_pool_size_argument():
     return {
         'dest': 'task_thread_pool_size',
-        'default': DEFAULT_TASK_THREAD_POOL_SIZE,
-        'type': int,
-        'help': 'The size of the thread pool to execute tasks in'
+        'type': utils.parse_task_thread_pool_size,
+        'metavar': 'SIZE',
+        'help': 'The size of the thread pool to execute tasks in, or auto '
+                'to size it after the blueprint\'s node instance graph '
+                '(default: task_thread_pool_size in the configuration, '
+                'or {0})'.format(DEFAULT_TASK_THREAD_POOL_SIZE)
     }
 
 
@@ -253,6 +315,15 @@ def snapshot_id_argument(hlp):
     }
 
 
+def concurrency_argument(hlp):
+    return {
+        'dest': 'concurrency',
+        'type': int,
+        'default': DEFAULT_CONCURRENCY,
+        'help': hlp
+    }
+
+
 def auto_generate_ids_argument():
     return {
         'dest': 'auto_generate_ids',
@@ -395,6 +466,27 @@ def parser_config():
                         'help': 'Upload a Cloudify plugin to the Manager',
                         'handler': cfy.plugins.upload
                     },
+                    'upload-many': {
+                        'arguments': {
+                            '-p,--plugin-path': {
+                                'metavar': 'PLUGIN_PATH',
+                                'dest': 'plugin_path',
+                                'nargs': '+',
+                                'required': True,
+                                'help': 'The paths of the plugins (`.wgn` '
+                                        'files) to upload, or of '
+                                        'directories containing them',
+                                'completer':
+                                    completion_utils.yaml_files_completer
+                            },
+                            '--concurrency': concurrency_argument(
+                                'The maximal number of plugins validated '
+                                'and uploaded at a time')
+                        },
+                        'help': 'Upload many Cloudify plugins to the '
+                                'Manager, skipping those already uploaded',
+                        'handler': cfy.plugins.upload_many
+                    },
                     'get': {
                         'arguments': {
                             '-p,--plugin-id': plugin_id_argument(
@@ -411,7 +503,8 @@ def parser_config():
                                 'help': 'The local path of the downloaded plugin',
                                 'dest': 'output',
 
-                            }
+                            },
+                            '--sha256': sha256_argument()
                         },
                         'help': 'Download a plugin from the Manager',
                         'handler': cfy.plugins.download
@@ -451,6 +544,37 @@ def parser_config():
                         'help': 'Upload a blueprint to the Manager',
                         'handler': cfy.blueprints.upload
                     },
+                    'upload-many': {
+                        'arguments': {
+                            '-l,--blueprints-location': {
+                                'dest': 'blueprints_location',
+                                'required': True,
+                                'help': 'A directory whose subdirectories '
+                                        'are blueprints (their names are '
+                                        'used as the blueprint IDs), or a '
+                                        'YAML manifest mapping blueprint '
+                                        'IDs to blueprint paths',
+                                'completer':
+                                    completion_utils.yaml_files_completer
+                            },
+                            '-n,--blueprint-filename': {
+                                'dest': 'blueprint_filename',
+                                'help': "The name of the blueprints' main "
+                                        "blueprint file, when uploading "
+                                        "from a directory (default: {0})"
+                                        .format(DEFAULT_BLUEPRINT_PATH)
+                            },
+                            '--validate': validate_blueprint_argument(),
+                            '--concurrency': concurrency_argument(
+                                hlp='The number of blueprints to upload '
+                                    'in parallel (default: {0})'
+                                    .format(DEFAULT_CONCURRENCY))
+                        },
+                        'help': 'Upload many blueprints to the Manager. '
+                                'Blueprints already uploaded, and unchanged '
+                                'since, are skipped',
+                        'handler': cfy.blueprints.upload_many
+                    },
                     'publish-archive': {
                         'arguments': {
                             '-l,--archive-location': archive_location_argument(),
@@ -471,7 +595,8 @@ def parser_config():
                             '-o,--output': {
                                 'help': 'The local path of the downloaded blueprint',
                                 'dest': 'output',
-                            }
+                            },
+                            '--sha256': sha256_argument()
                         },
                         'help': 'Download a blueprint from the Manager',
                         'handler': cfy.blueprints.download
@@ -493,10 +618,28 @@ def parser_config():
                     },
                     'validate': {
                         'arguments': {
-                            '-p,--blueprint-path':
-                                manager_blueprint_path_argument(),
+                            '-p,--blueprint-path': {
+                                'metavar': 'BLUEPRINT_FILE',
+                                'dest': 'blueprint_path',
+                                'nargs': '+',
+                                'required': True,
+                                'help': 'The paths of the blueprints to '
+                                        'validate. Can be provided as '
+                                        'wildcard based paths '
+                                        '(*/blueprint.yaml, etc..)',
+                                'completer':
+                                    completion_utils.yaml_files_completer
+                            },
+                            '--offline': offline_argument(),
+                            '--concurrency': {
+                                'dest': 'concurrency',
+                                'type': int,
+                                'help': 'The number of blueprints to '
+                                        'validate in parallel (default: '
+                                        'the number of CPUs)'
+                            }
                         },
-                        'help': 'Validate a blueprint',
+                        'help': 'Validate one or more blueprints',
                         'handler': cfy.blueprints.validate
                     },
                     'get': {
@@ -549,7 +692,8 @@ def parser_config():
                                 'help': "The local path of the snapshot to upload",
                                 'completer': completion_utils.yaml_files_completer
                             },
-                            '-s,--snapshot-id': remove_completer(snapshot_id_argument('The ID of the snapshot'))
+                            '-s,--snapshot-id': remove_completer(snapshot_id_argument('The ID of the snapshot')),
+                            '--bandwidth-limit': bandwidth_limit_argument()
                         },
                         'help': 'Upload a snapshot to the Manager',
                         'handler': cfy.snapshots.upload
@@ -561,7 +705,8 @@ def parser_config():
                                 'help': 'The local path of the downloaded snapshot',
                                 'dest': 'output',
 
-                            }
+                            },
+                            '--sha256': sha256_argument()
                         },
                         'help': 'Download a snapshot from the Manager',
                         'handler': cfy.snapshots.download
@@ -738,24 +883,140 @@ def parser_config():
                     }
                 }
             },
+            'imports': {
+                'help': "Handle the imports cache",
+                'sub_commands': {
+                    'prefetch': {
+                        'arguments': {
+                            '-p,--blueprint-path':
+                                manager_blueprint_path_argument()
+                        },
+                        'help': "Fetch a blueprint's remote imports into the "
+                                "imports cache, so it can be used offline",
+                        'handler': cfy.imports.prefetch
+                    }
+                }
+            },
             'events': {
                 'help': "Handle events",
                 'sub_commands': {
                     'list': {
                         'arguments': {
                             '-l,--include-logs': include_logs_argument(),
-                            '-e,--execution-id': execution_id_argument(
-                                hlp='The ID of the execution to list events for'
-                            ),
+                            '_mutually_exclusive': [{
+                                '-e,--execution-id': make_optional(
+                                    execution_id_argument(
+                                        hlp='The ID of the execution to list '
+                                            'events for'
+                                    )
+                                ),
+                                '-d,--deployment-id': deployment_id_argument(
+                                    hlp='List the events of all the '
+                                        'executions of this deployment, '
+                                        'ordered by their timestamp'
+                                )
+                            }],
                             '--tail': {
                                 'dest': 'tail',
                                 'action': 'store_true',
-                                'help': 'Tail the events of the specified execution until it ends'
+                                'help': 'Tail the events of the specified '
+                                        'execution until it ends. With '
+                                        '--deployment-id, tail the events of '
+                                        'all the deployment\'s executions, '
+                                        'including ones started later on'
                             },
-                            '--json': json_events_argument()
+                            '--json': json_events_argument(),
+                            '--level': {
+                                'dest': 'level',
+                                'choices': LOG_LEVELS,
+                                'help': 'Only show logs of this level or '
+                                        'above (implies --include-logs)'
+                            },
+                            '--event-type': {
+                                'dest': 'event_types',
+                                'action': 'append',
+                                'help': 'Only show events of this type (e.g. '
+                                        'task_failed). This argument can be '
+                                        'used multiple times'
+                            },
+                            '--node-id': {
+                                'dest': 'node_id',
+                                'help': 'Only show events and logs of this node'
+                            },
+                            '--operation': {
+                                'dest': 'operation',
+                                'help': 'Only show events and logs of this '
+                                        'operation (e.g. '
+                                        'cloudify.interfaces.lifecycle.create, '
+                                        'or just create)'
+                            },
+                            '--since': {
+                                'dest': 'since',
+                                'help': 'Only show events and logs created '
+                                        'at or after this UTC time '
+                                        '(e.g. "2016-01-31 13:30:00")'
+                            },
+                            '--until': {
+                                'dest': 'until',
+                                'help': 'Only show events and logs created '
+                                        'at or before this UTC time'
+                            }
                         },
                         'help': 'Display events for different executions',
                         'handler': cfy.events.ls
+                    },
+                    'stats': {
+                        'arguments': {
+                            '-e,--execution-id': execution_id_argument(
+                                hlp='The ID of the execution to analyze'
+                            ),
+                            '--group-by': {
+                                'dest': 'group_by',
+                                'choices': events_stats.GROUP_BY_TYPES,
+                                'help': 'Only show task timings aggregated '
+                                        'by this (default: show all)'
+                            },
+                            '--json': {
+                                'dest': 'json_output',
+                                'action': 'store_true',
+                                'help': 'Output the statistics in JSON format'
+                            }
+                        },
+                        'help': 'Show task timing statistics of an execution',
+                        'handler': cfy.events.stats
+                    },
+                    'export': {
+                        'arguments': {
+                            '_mutually_exclusive': [{
+                                '-e,--execution-id': {
+                                    'dest': 'execution_ids',
+                                    'action': 'append',
+                                    'help': 'The ID of an execution to export '
+                                            'events for. This argument can be '
+                                            'used multiple times',
+                                    'completer': completion_utils.objects_args_completer_maker('executions')
+                                },
+                                '-d,--deployment-id': deployment_id_argument(
+                                    hlp='Export events of all the executions '
+                                        'of this deployment'
+                                )
+                            }],
+                            '-o,--output': {
+                                'dest': 'output',
+                                'help': 'The directory to write the exported '
+                                        'events to (default: cwd). Each '
+                                        'execution is exported to a gzipped '
+                                        'NDJSON file, which is resumed if the '
+                                        'export is run again'
+                            },
+                            '-l,--include-logs': include_logs_argument(),
+                            '--concurrency': concurrency_argument(
+                                hlp='The maximal number of executions to '
+                                    'export in parallel'
+                            )
+                        },
+                        'help': 'Export the events of executions to files',
+                        'handler': cfy.events.export
                     }
                 }
             },
@@ -961,10 +1222,59 @@ def parser_config():
                             '--task-retry-interval':
                                 task_retry_interval_argument(1),
                             '--task-thread-pool-size':
-                                task_thread_pool_size_argument()
+                                task_thread_pool_size_argument(),
+                            '--storage': local_storage_argument(),
+                            '--timing-report': timing_report_argument()
                         },
                         'handler': cfy.local.install
                     },
+                    'run': {
+                        'help': 'Initialize an environment, execute '
+                                'workflows on it and display its outputs, '
+                                'keeping it in memory only (unless '
+                                '--persist is given)',
+                        'arguments': {
+                            '-p,--blueprint-path':
+                                make_optional(
+                                        local_blueprint_path_argument(
+                                                hlp="The path to the application's "
+                                                    "blueprint file. (default: "
+                                                    "{0})".format(DEFAULT_BLUEPRINT_PATH)
+                                        )
+                                ),
+                            '-i,--inputs':
+                                inputs_argument('Inputs for the deployment ({0}). '
+                                                'This argument can be used multiple times'
+                                                .format(FORMAT_INPUT_AS_YAML_OR_DICT)
+                                                ),
+                            '--install-plugins': install_plugins_argument(),
+                            '-w,--workflow': {
+                                'metavar': 'WORKFLOW',
+                                'dest': 'workflow_ids',
+                                'action': 'append',
+                                'help': 'A workflow to execute. This argument '
+                                        'can be used multiple times, to '
+                                        'execute workflows in sequence '
+                                        '(default: {0})'
+                                        .format(DEFAULT_INSTALL_WORKFLOW)
+                            },
+                            '--task-retries': task_retries_argument(0),
+                            '--task-retry-interval':
+                                task_retry_interval_argument(1),
+                            '--task-thread-pool-size':
+                                task_thread_pool_size_argument(),
+                            '--persist': {
+                                'dest': 'persist',
+                                'action': 'store_true',
+                                'help': 'Keep the environment in the current '
+                                        'working directory, as `cfy local '
+                                        'init` does'
+                            },
+                            '--storage': local_storage_argument(),
+                            '--timing-report': timing_report_argument()
+                        },
+                        'handler': cfy.local.run
+                    },
                     'uninstall': {
                         'help': 'Uninstall an application',
                         'arguments': {
@@ -981,7 +1291,8 @@ def parser_config():
                             '--task-retry-interval':
                                 task_retry_interval_argument(1),
                             '--task-thread-pool-size':
-                                task_thread_pool_size_argument()
+                                task_thread_pool_size_argument(),
+                            '--timing-report': timing_report_argument()
                         },
                         'handler': cfy.local.uninstall
                     },
@@ -998,10 +1309,27 @@ def parser_config():
                                         'This argument can be used multiple times'
                                         .format(FORMAT_INPUT_AS_YAML_OR_DICT)
                                 ),
-                            '--install-plugins': install_plugins_argument()
+                            '--install-plugins': install_plugins_argument(),
+                            '--offline': offline_argument(),
+                            '--storage': local_storage_argument(),
+                            '--watch': {
+                                'dest': 'watch',
+                                'action': 'store_true',
+                                'help': 'Keep watching the blueprint and the '
+                                        'local files it imports, and '
+                                        'initialize the environment again '
+                                        'whenever they change, keeping the '
+                                        'runtime state of unchanged nodes'
+                            }
                         },
                         'handler': cfy.local.init
                     },
+                    'migrate-storage': {
+                        'help': 'Move the local environment from file '
+                                'storage to sqlite storage, keeping its state',
+                        'arguments': {},
+                        'handler': cfy.local.migrate_storage
+                    },
                     'install-plugins': {
                         'help': 'Install the necessary plugins for a given blueprint',
                         'arguments': {
@@ -1042,7 +1370,32 @@ def parser_config():
                             '--task-retry-interval':
                                 task_retry_interval_argument(1),
                             '--task-thread-pool-size':
-                                task_thread_pool_size_argument()
+                                task_thread_pool_size_argument(),
+                            '--timing-report': timing_report_argument(),
+                            '--simulate': {
+                                'dest': 'simulate',
+                                'action': 'store_true',
+                                'help': 'Execute the workflow\'s task graph '
+                                        'without executing its operations, '
+                                        'on a copy of the environment, and '
+                                        'report the scheduling throughput'
+                            },
+                            '--simulate-duration': {
+                                'dest': 'simulate_duration',
+                                'metavar': 'SECONDS',
+                                'type': float,
+                                'default': simulation.DEFAULT_OPERATION_DURATION,
+                                'help': 'The duration of simulated operations '
+                                        '(default: {0})'.format(
+                                            simulation.DEFAULT_OPERATION_DURATION)
+                            },
+                            '--simulate-durations-from': {
+                                'dest': 'simulate_durations_from',
+                                'metavar': 'TIMING_REPORT',
+                                'help': 'Sample the durations of simulated '
+                                        'operations from the tasks of a '
+                                        'timing report (see --timing-report)'
+                            }
                         },
                         'handler': cfy.local.execute
                     },
@@ -1057,6 +1410,13 @@ def parser_config():
                             '--node-id': {
                                 'dest': 'node_id',
                                 'help': 'Display node-instances only for this node'
+                            },
+                            '--fields': {
+                                'dest': 'fields',
+                                'nargs': '+',
+                                'metavar': 'FIELD',
+                                'help': 'Display only these runtime properties '
+                                        'of the node-instances'
                             }
                         },
                         'handler': cfy.local.instances
@@ -1150,7 +1510,8 @@ def parser_config():
                     '--task-retries': task_retries_argument(5),
                     '--task-retry-interval': task_retry_interval_argument(30),
                     '--task-thread-pool-size':
-                        task_thread_pool_size_argument()
+                        task_thread_pool_size_argument(),
+                    '--timing-report': timing_report_argument()
                 },
                 'handler': cfy.bootstrap
             },
@@ -1180,7 +1541,8 @@ def parser_config():
                     '--task-retries': task_retries_argument(5),
                     '--task-retry-interval': task_retry_interval_argument(30),
                     '--task-thread-pool-size':
-                        task_thread_pool_size_argument()
+                        task_thread_pool_size_argument(),
+                    '--timing-report': timing_report_argument()
                 },
                 'handler': cfy.upgrade.upgrade
             },
@@ -1197,7 +1559,8 @@ def parser_config():
                     },
                     '--install-plugins': install_plugins_argument(),
                     '--task-retries': task_retries_argument(5),
-                    '--task-retry-interval': task_retry_interval_argument(30)
+                    '--task-retry-interval': task_retry_interval_argument(30),
+                    '--timing-report': timing_report_argument()
                 },
                 'handler': cfy.rollback.rollback
             },
@@ -1211,7 +1574,8 @@ def parser_config():
                         'existing deployments on the Manager',
                     },
                     '-f,--force': force_argument(
-                            hlp='Force teardown. This flag is mandatory',)
+                            hlp='Force teardown. This flag is mandatory',),
+                    '--timing-report': timing_report_argument()
                 },
                 'handler': cfy.teardown
             },
@@ -1229,7 +1593,8 @@ def parser_config():
                         'dest': 'snapshot_path',
                         'type': argparse.FileType(),
                         'help': 'The local path to the snapshot'
-                    }
+                    },
+                    '--bandwidth-limit': bandwidth_limit_argument()
                 },
                 'handler': cfy.recover
             },
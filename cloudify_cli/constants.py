@@ -23,6 +23,12 @@ DEFAULT_INPUTS_PATH_FOR_INSTALL_COMMAND = 'inputs.yaml'
 DEFAULT_PARAMETERS = None
 DEFAULT_TIMEOUT = 900
 DEFAULT_TASK_THREAD_POOL_SIZE = 1
+AUTO_TASK_THREAD_POOL_SIZE = 'auto'
+AUTO_TASK_THREAD_POOL_SIZE_PER_CPU = 4
+DEFAULT_CONCURRENCY = 4
+DEFAULT_EVENTS_CACHE_MAX_SIZE_MB = 100
+DEFAULT_IMPORT_CACHE_TTL = 3600
+DEFAULT_LOCAL_STORAGE = 'file'
 DEFAULT_INSTALL_WORKFLOW = 'install'
 DEFAULT_UNINSTALL_WORKFLOW = 'uninstall'
 
@@ -0,0 +1,362 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+"""
+Resumable downloads of archives (blueprints, plugins, snapshots) from the
+manager.
+
+A download is streamed to `<output>.part`, and is only renamed to its
+final name once complete. If it's interrupted, it's resumed with HTTP
+Range requests, both within a run (up to `DOWNLOAD_ATTEMPTS` times) and
+across runs, using the `<output>.part.json` state file kept next to it.
+Large files are fetched in parallel ranged chunks when the manager
+supports ranges.
+
+The SHA256 of a file downloaded sequentially is computed while it's
+written; the chunks of a parallel download arrive out of order, so it's
+computed once they're all written.
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+
+import requests
+
+from cloudify_cli import utils
+from cloudify_cli.constants import DEFAULT_CONCURRENCY
+from cloudify_cli.exceptions import CloudifyCliError
+
+
+DOWNLOAD_ATTEMPTS = 5
+RETRY_MAX_WAIT = 30
+PARALLEL_MIN_SIZE = 64 * 1024 * 1024
+PARALLEL_CHUNK_SIZE = 16 * 1024 * 1024
+READ_SIZE = 64 * 1024
+PROGRESS_INTERVAL = 5
+PART_FILE_SUFFIX = '.part'
+STATE_FILE_SUFFIX = '.part.json'
+
+_CONTENT_DISPOSITION_FILENAME = re.compile(r'filename="?([^";]+)"?')
+
+
+class DownloadResult(object):
+
+    def __init__(self, path, size, sha256, elapsed, resumed_size):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.elapsed = elapsed
+        # the number of bytes downloaded by a previous run
+        self.resumed_size = resumed_size
+
+    def __str__(self):
+        downloaded = self.size - self.resumed_size
+        throughput = downloaded / self.elapsed if self.elapsed else 0
+        description = '{0} in {1:.2f} seconds ({2}/s)'.format(
+            utils.format_size(self.size),
+            self.elapsed,
+            utils.format_size(throughput))
+        if self.resumed_size:
+            description += ', resumed after {0}'.format(
+                utils.format_size(self.resumed_size))
+        return '{0}; sha256: {1}'.format(description, self.sha256)
+
+
+class _Interrupted(Exception):
+    """The response ended before all of the requested bytes were read"""
+
+
+class Progress(object):
+    """Counts the bytes transferred, and periodically reports them to a
+    progress handler
+    """
+
+    def __init__(self, total, progress_handler, done=0):
+        self.total = total
+        self.done = done
+        self._handler = progress_handler
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self._reported = self._started
+
+    def add(self, size):
+        with self._lock:
+            self.done += size
+            now = time.time()
+            if self._handler and now - self._reported >= PROGRESS_INTERVAL:
+                self._reported = now
+                self._handler(self.done, self.total, now - self._started)
+
+
+def log_progress(logger, action='Downloaded'):
+    """Return a progress handler logging the progress with `logger`"""
+    def _log(done, total, elapsed):
+        message = '{0} {1}'.format(action, utils.format_size(done))
+        if total:
+            message += ' of {0} ({1}%)'.format(utils.format_size(total),
+                                               done * 100 / total)
+        if elapsed:
+            message += ', {0}/s'.format(utils.format_size(done / elapsed))
+        logger.info(message)
+    return _log
+
+
+def download(client, uri, output_file=None, expected_sha256=None,
+             concurrency=DEFAULT_CONCURRENCY, progress_handler=None):
+    """Download `uri` from the manager `client` is connected to
+
+    :param output_file: the path to download to; if omitted, the file name
+                        the manager suggests is used
+    :param expected_sha256: if given, the download fails unless the
+                            downloaded file's SHA256 matches it
+    :param concurrency: the number of ranged chunks downloaded in parallel
+    :param progress_handler: called with the number of bytes downloaded,
+                             the total size (or None) and the elapsed time
+    :return: a DownloadResult
+    """
+    return _Download(client, uri, output_file, expected_sha256,
+                     concurrency, progress_handler).run()
+
+
+class _Download(object):
+
+    def __init__(self, client, uri, output_file, expected_sha256,
+                 concurrency, progress_handler):
+        self._http_client = client._client
+        self._url = '{0}{1}'.format(self._http_client.url, uri)
+        self._output_file = output_file
+        self._expected_sha256 = expected_sha256
+        self._concurrency = concurrency
+        self._progress_handler = progress_handler
+        self._session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=max(1, concurrency))
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        self._state_lock = threading.Lock()
+
+    def run(self):
+        started = time.time()
+        size, accepts_ranges, validator, filename = self._probe()
+        output_file = self._output_file or filename
+        if not output_file:
+            raise CloudifyCliError(
+                'Cannot determine the name of the downloaded file; '
+                'please provide an output path')
+        if os.path.exists(output_file):
+            raise OSError("Output file '{0}' already exists"
+                          .format(output_file))
+        self._part_path = output_file + PART_FILE_SUFFIX
+        self._state_path = output_file + STATE_FILE_SUFFIX
+        self._state = self._load_state(size, validator, accepts_ranges)
+
+        if accepts_ranges and size >= PARALLEL_MIN_SIZE and \
+                self._concurrency > 1:
+            resumed_size, sha256 = self._download_in_chunks(size)
+        else:
+            resumed_size, sha256 = self._download_sequentially(
+                size, accepts_ranges)
+
+        if self._expected_sha256 and \
+                sha256 != self._expected_sha256.lower():
+            utils.remove_if_exists(self._part_path)
+            utils.remove_if_exists(self._state_path)
+            raise CloudifyCliError(
+                'Downloaded file checksum mismatch: expected sha256 {0}, '
+                'got {1}'.format(self._expected_sha256, sha256))
+        os.rename(self._part_path, output_file)
+        utils.remove_if_exists(self._state_path)
+        return DownloadResult(output_file,
+                              os.path.getsize(output_file),
+                              sha256,
+                              time.time() - started,
+                              resumed_size)
+
+    def _request(self, method, headers=None, stream=True):
+        total_headers = self._http_client.headers.copy()
+        total_headers.update(headers or {})
+        response = getattr(self._session, method)(
+            self._url,
+            headers=total_headers,
+            params=self._http_client.query_params,
+            stream=stream,
+            verify=self._http_client.get_request_verify())
+        if response.status_code >= 400:
+            # raises the same errors the REST client does
+            self._http_client._raise_client_error(response, self._url)
+        return response
+
+    def _probe(self):
+        """Return the size, range support, validator and suggested file
+        name of the downloaded file
+        """
+        response = self._request('head', stream=False)
+        headers = response.headers
+        size = headers.get('Content-Length')
+        size = int(size) if size and size.isdigit() else None
+        accepts_ranges = size is not None and \
+            headers.get('Accept-Ranges', '').lower() == 'bytes'
+        validator = headers.get('ETag') or headers.get('Last-Modified')
+        match = _CONTENT_DISPOSITION_FILENAME.search(
+            headers.get('Content-Disposition', ''))
+        filename = os.path.basename(match.group(1)) if match else None
+        return size, accepts_ranges, validator, filename
+
+    def _load_state(self, size, validator, accepts_ranges):
+        state = {'url': self._url,
+                 'size': size,
+                 'validator': validator,
+                 'chunks': []}
+        try:
+            with open(self._state_path) as f:
+                stored_state = json.load(f)
+        except (IOError, OSError, ValueError):
+            stored_state = None
+        # a partial download is only resumed if it's of the same file
+        if not accepts_ranges or not validator or stored_state is None or \
+                any(stored_state.get(key) != state[key]
+                    for key in ['url', 'size', 'validator']):
+            utils.remove_if_exists(self._part_path)
+            stored_state = state
+        self._dump_state(stored_state)
+        return stored_state
+
+    def _dump_state(self, state):
+        with open(self._state_path, 'w') as f:
+            json.dump(state, f)
+
+    def _download_sequentially(self, size, accepts_ranges):
+        sha256 = hashlib.sha256()
+        resumed_size = 0
+        if os.path.isfile(self._part_path):
+            # the already downloaded part is hashed, so that the rest is
+            # hashed as it's downloaded
+            with open(self._part_path, 'rb') as f:
+                for data in iter(lambda: f.read(READ_SIZE), ''):
+                    sha256.update(data)
+                    resumed_size += len(data)
+        progress = Progress(size, self._progress_handler, resumed_size)
+        with open(self._part_path, 'ab') as f:
+            for attempt in range(1, DOWNLOAD_ATTEMPTS + 1):
+                offset = f.tell()
+                if size is not None and offset >= size:
+                    break
+                try:
+                    if offset and accepts_ranges:
+                        response = self._request(
+                            'get', {'Range': 'bytes={0}-'.format(offset)})
+                    else:
+                        response = self._request('get')
+                    if response.status_code != 206 and offset:
+                        # the whole file is sent, so it's downloaded anew
+                        f.seek(0)
+                        f.truncate()
+                        sha256 = hashlib.sha256()
+                        progress.add(-offset)
+                    self._read_response(response, f, progress, sha256)
+                    if size is not None and f.tell() < size:
+                        raise _Interrupted()
+                    break
+                except (_Interrupted, requests.RequestException):
+                    f.flush()
+                    if attempt == DOWNLOAD_ATTEMPTS:
+                        raise CloudifyCliError(
+                            'Download interrupted after {0} attempts, at '
+                            '{1}; run the command again to resume it'
+                            .format(attempt, utils.format_size(f.tell())))
+                    wait_before_retry(attempt)
+        return resumed_size, sha256.hexdigest()
+
+    def _download_in_chunks(self, size):
+        chunks = [(start, min(start + PARALLEL_CHUNK_SIZE, size) - 1)
+                  for start in range(0, size, PARALLEL_CHUNK_SIZE)]
+        done = set(self._state['chunks'])
+        if not os.path.isfile(self._part_path):
+            done.clear()
+            with open(self._part_path, 'wb') as f:
+                f.truncate(size)
+        resumed_size = sum(end - start + 1
+                           for index, (start, end) in enumerate(chunks)
+                           if index in done)
+        progress = Progress(size, self._progress_handler, resumed_size)
+
+        def _download_chunk(index):
+            start, end = chunks[index]
+            self._download_chunk(start, end, progress)
+            with self._state_lock:
+                self._state['chunks'].append(index)
+                self._dump_state(self._state)
+
+        utils.run_concurrently(
+            _download_chunk,
+            [index for index in range(len(chunks)) if index not in done],
+            self._concurrency)
+
+        sha256 = hashlib.sha256()
+        with open(self._part_path, 'rb') as f:
+            for data in iter(lambda: f.read(READ_SIZE), ''):
+                sha256.update(data)
+        return resumed_size, sha256.hexdigest()
+
+    def _download_chunk(self, start, end, progress):
+        offset = start
+        with open(self._part_path, 'r+b') as f:
+            for attempt in range(1, DOWNLOAD_ATTEMPTS + 1):
+                f.seek(offset)
+                try:
+                    response = self._request(
+                        'get', {'Range': 'bytes={0}-{1}'.format(offset, end)})
+                    if response.status_code != 206:
+                        raise CloudifyCliError(
+                            'The manager ignored a ranged request for {0}'
+                            .format(self._url))
+                    self._read_response(response, f, progress,
+                                        limit=end - offset + 1)
+                    offset = f.tell()
+                    if offset <= end:
+                        raise _Interrupted()
+                    return
+                except (_Interrupted, requests.RequestException):
+                    offset = f.tell()
+                    if attempt == DOWNLOAD_ATTEMPTS:
+                        raise CloudifyCliError(
+                            'Download interrupted after {0} attempts; run '
+                            'the command again to resume it'.format(attempt))
+                    wait_before_retry(attempt)
+
+    @staticmethod
+    def _read_response(response, f, progress, sha256=None, limit=None):
+        try:
+            for data in response.iter_content(READ_SIZE):
+                if limit is not None:
+                    data = data[:limit]
+                    limit -= len(data)
+                f.write(data)
+                if sha256 is not None:
+                    sha256.update(data)
+                progress.add(len(data))
+                if limit == 0:
+                    break
+        finally:
+            response.close()
+
+
+def wait_before_retry(attempt):
+    """Back off exponentially before retrying a failed transfer"""
+    time.sleep(min(2 ** attempt, RETRY_MAX_WAIT))
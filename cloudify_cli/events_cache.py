@@ -0,0 +1,183 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+"""
+A local, on-disk cache of execution events.
+
+Events of every execution are kept in an NDJSON file under
+`.cloudify/events-cache/<manager>/`, next to a small metadata file holding
+the number of cached events and the size of the events file. Once an
+execution has ended and its workflow-end event was cached, its entry is
+marked immutable and the manager is no longer queried for it.
+"""
+
+import os
+import re
+import json
+
+from cloudify_cli import utils
+from cloudify_cli.execution_events_fetcher import WORKFLOW_END_TYPES
+
+
+EVENTS_CACHE_DIR_NAME = 'events-cache'
+EVENTS_FILE_SUFFIX = '.ndjson'
+METADATA_FILE_SUFFIX = '.json'
+
+
+class ExecutionEventsCache(object):
+    """The cached events of a single execution
+
+    Events fetched with and without logs are cached separately, as their
+    offsets differ.
+    """
+
+    def __init__(self, cache_dir, execution_id, include_logs=False):
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        name = _safe_name(execution_id)
+        if include_logs:
+            name += '-logs'
+        self._events_path = os.path.join(cache_dir, name + EVENTS_FILE_SUFFIX)
+        self._metadata_path = os.path.join(cache_dir,
+                                           name + METADATA_FILE_SUFFIX)
+        self._metadata = self._load_metadata()
+
+    @property
+    def count(self):
+        return self._metadata['count']
+
+    @property
+    def immutable(self):
+        return self._metadata['immutable']
+
+    @property
+    def end_log_received(self):
+        return self._metadata['end_log_received']
+
+    def iter_events(self, from_event=0):
+        """Yield the cached events, starting at offset `from_event`"""
+        if not self.count or from_event >= self.count:
+            return
+        self._touch()
+        with open(self._events_path) as f:
+            for index, line in enumerate(f):
+                if index >= self.count:
+                    break
+                if index >= from_event:
+                    yield json.loads(line)
+
+    def append(self, offset, events):
+        """Cache `events`, which were fetched starting at `offset`
+
+        Events which do not directly follow the cached ones are ignored,
+        so the cache never has gaps.
+        """
+        if self.immutable or not events or offset != self.count:
+            return
+        with open(self._events_path, 'ab') as f:
+            for event in events:
+                f.write(json.dumps(event))
+                f.write('\n')
+        self._metadata['count'] += len(events)
+        self._metadata['size'] = os.path.getsize(self._events_path)
+        if any(event.get('event_type') in WORKFLOW_END_TYPES
+               for event in events if isinstance(event, dict)):
+            self._metadata['end_log_received'] = True
+        self._dump_metadata()
+
+    def mark_immutable(self):
+        self._metadata['immutable'] = True
+        self._dump_metadata()
+
+    def _load_metadata(self):
+        metadata = {'count': 0,
+                    'size': 0,
+                    'end_log_received': False,
+                    'immutable': False}
+        try:
+            with open(self._metadata_path) as f:
+                stored_metadata = json.load(f)
+            events_size = os.path.getsize(self._events_path)
+        except (IOError, OSError, ValueError):
+            # a missing or corrupted entry is simply rebuilt
+            utils.remove_if_exists(self._events_path)
+            return metadata
+        if events_size < stored_metadata['size']:
+            utils.remove_if_exists(self._events_path)
+            return metadata
+        # drop events written after the metadata was last dumped
+        with open(self._events_path, 'r+b') as f:
+            f.truncate(stored_metadata['size'])
+        metadata.update(stored_metadata)
+        return metadata
+
+    def _dump_metadata(self):
+        with open(self._metadata_path, 'w') as f:
+            json.dump(self._metadata, f)
+
+    def _touch(self):
+        # the events file's mtime is what the LRU eviction goes by
+        if os.path.isfile(self._events_path):
+            os.utime(self._events_path, None)
+
+
+def get_execution_events_cache(manager, execution_id, include_logs=False):
+    """Return the events cache of an execution on `manager`
+
+    Returns None if the working directory isn't initialized or if the
+    events cache is disabled in its configuration.
+    """
+    if not utils.is_initialized():
+        return None
+    max_size = utils.CloudifyConfig().events_cache_max_size
+    if not max_size:
+        return None
+    cache_root = _cache_root()
+    evict(cache_root, max_size)
+    return ExecutionEventsCache(os.path.join(cache_root, _safe_name(manager)),
+                                execution_id,
+                                include_logs=include_logs)
+
+
+def evict(cache_root, max_size):
+    """Remove the least recently used entries until the cache's size is
+    no more than `max_size` bytes
+    """
+    entries = []
+    for dirpath, _, filenames in os.walk(cache_root):
+        for filename in filenames:
+            if not filename.endswith(EVENTS_FILE_SUFFIX):
+                continue
+            path = os.path.join(dirpath, filename)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_size <= max_size:
+            break
+        metadata_path = \
+            path[:-len(EVENTS_FILE_SUFFIX)] + METADATA_FILE_SUFFIX
+        utils.remove_if_exists(metadata_path)
+        utils.remove_if_exists(path)
+        total_size -= size
+
+
+def _cache_root():
+    return os.path.join(utils.get_init_path(), EVENTS_CACHE_DIR_NAME)
+
+
+def _safe_name(name):
+    return re.sub(r'[^\w.-]', '_', str(name))
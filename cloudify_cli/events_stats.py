@@ -0,0 +1,301 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+"""
+Timing statistics of an execution, computed from its task events.
+
+Events are consumed in batches, as handed out by `ExecutionEventsFetcher`,
+and are expected to be sorted by their timestamp. Only a fixed amount of
+state is kept for every task that is still running, plus one aggregate per
+node, node instance and operation.
+"""
+
+import re
+from datetime import datetime
+
+
+TASK_SENDING = 'sending_task'
+TASK_STARTED = 'task_started'
+TASK_SUCCEEDED = 'task_succeeded'
+TASK_FAILED = 'task_failed'
+TASK_RESCHEDULED = 'task_rescheduled'
+TASK_END_TYPES = {TASK_SUCCEEDED, TASK_FAILED, TASK_RESCHEDULED}
+
+GROUP_BY_NODE = 'node'
+GROUP_BY_NODE_INSTANCE = 'node_instance'
+GROUP_BY_OPERATION = 'operation'
+GROUP_BY_TYPES = [GROUP_BY_NODE, GROUP_BY_NODE_INSTANCE, GROUP_BY_OPERATION]
+
+_TIMESTAMP_FORMATS = ['%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S',
+                      '%Y-%m-%d %H:%M', '%Y-%m-%d']
+_TIMEZONE_SUFFIX = re.compile(r'(Z|[+-]\d\d:?\d\d)$')
+_EPOCH = datetime(1970, 1, 1)
+
+
+def parse_event_timestamp(event):
+    """Return the event's timestamp as seconds since the epoch (UTC)"""
+    return parse_timestamp(event.get('@timestamp') or event.get('timestamp'))
+
+
+def parse_timestamp(timestamp):
+    """Return a '%Y-%m-%d %H:%M:%S.%f' (or ISO 8601) UTC timestamp as
+    seconds since the epoch, or None if it can't be parsed
+    """
+    if not timestamp:
+        return None
+    timestamp = _TIMEZONE_SUFFIX.sub('', timestamp.strip())
+    timestamp = timestamp.replace('T', ' ')
+    for timestamp_format in _TIMESTAMP_FORMATS:
+        try:
+            parsed = datetime.strptime(timestamp, timestamp_format)
+        except ValueError:
+            continue
+        return (parsed - _EPOCH).total_seconds()
+    return None
+
+
+class _OpenTask(object):
+
+    __slots__ = ['target', 'operation', 'sent', 'started', 'previous']
+
+    def __init__(self, target, operation, sent, previous):
+        self.target = target
+        self.operation = operation
+        self.sent = sent
+        self.started = None
+        self.previous = previous
+
+
+class _PathStep(object):
+    """A finished task on a chain of tasks that ran one after the other"""
+
+    __slots__ = ['target', 'operation', 'status', 'start', 'end', 'previous']
+
+    def __init__(self, target, operation, status, start, end, previous):
+        self.target = target
+        self.operation = operation
+        self.status = status
+        self.start = start
+        self.end = end
+        self.previous = previous
+
+
+class _Aggregate(object):
+
+    __slots__ = ['tasks', 'succeeded', 'failed', 'retries', 'duration',
+                 'max_duration', 'queue_delay']
+
+    def __init__(self):
+        self.tasks = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.retries = 0
+        self.duration = 0.0
+        self.max_duration = 0.0
+        self.queue_delay = 0.0
+
+    def add(self, event_type, duration, queue_delay):
+        self.tasks += 1
+        if event_type == TASK_SUCCEEDED:
+            self.succeeded += 1
+        elif event_type == TASK_FAILED:
+            self.failed += 1
+        else:
+            self.retries += 1
+        self.duration += duration
+        self.max_duration = max(self.max_duration, duration)
+        self.queue_delay += queue_delay
+
+    def to_dict(self):
+        return {
+            'tasks': self.tasks,
+            'succeeded': self.succeeded,
+            'failed': self.failed,
+            'retries': self.retries,
+            'duration': round(self.duration, 3),
+            'max_duration': round(self.max_duration, 3),
+            'avg_queue_delay':
+                round(self.queue_delay / self.tasks, 3) if self.tasks else 0
+        }
+
+
+class ExecutionEventsStats(object):
+    """An events handler that aggregates task timings of an execution
+
+    Every task attempt (a retried operation has several) is measured from
+    its `task_started` event to its `task_succeeded`, `task_failed` or
+    `task_rescheduled` event, and its queueing delay from its
+    `sending_task` event to its `task_started` event.
+
+    The critical path is approximated from the events alone: a task is
+    considered to have waited for the task that finished last before it
+    was sent, and the path is followed back from the task that finished
+    last.
+    """
+
+    def __init__(self, keep_tasks=False):
+        """
+        :param keep_tasks: also keep a record of every finished task
+                           attempt (see `tasks`), rather than only the
+                           aggregates
+        """
+        self._open_tasks = {}
+        self._tasks = [] if keep_tasks else None
+        self._aggregates = dict((group_by, {}) for group_by in GROUP_BY_TYPES)
+        self._last_finished = None
+        self.first_timestamp = None
+        self.last_timestamp = None
+        self.events_count = 0
+
+    def __call__(self, events):
+        for event in events:
+            self.process_event(event)
+
+    def process_event(self, event):
+        self.events_count += 1
+        timestamp = parse_event_timestamp(event)
+        if timestamp is None:
+            return
+        if self.first_timestamp is None:
+            self.first_timestamp = timestamp
+        self.last_timestamp = timestamp
+
+        event_type = event.get('event_type')
+        if event_type not in TASK_END_TYPES and \
+                event_type not in (TASK_SENDING, TASK_STARTED):
+            return
+        context = event.get('context') or {}
+        task_key = self._task_key(context)
+
+        if event_type == TASK_SENDING:
+            self._open_tasks[task_key] = _OpenTask(
+                target=self._target(context),
+                operation=context.get('operation'),
+                sent=timestamp,
+                previous=self._last_finished)
+            return
+
+        task = self._open_tasks.get(task_key)
+        if task is None:
+            # the task was sent before the first processed event
+            task = _OpenTask(target=self._target(context),
+                             operation=context.get('operation'),
+                             sent=timestamp,
+                             previous=self._last_finished)
+            self._open_tasks[task_key] = task
+        if event_type == TASK_STARTED:
+            task.started = timestamp
+            return
+
+        del self._open_tasks[task_key]
+        started = task.started if task.started is not None else task.sent
+        duration = max(timestamp - started, 0)
+        queue_delay = max(started - task.sent, 0)
+        node, node_instance = task.target
+        for group_by, key in [(GROUP_BY_NODE, node),
+                              (GROUP_BY_NODE_INSTANCE, node_instance),
+                              (GROUP_BY_OPERATION, task.operation)]:
+            aggregates = self._aggregates[group_by]
+            if key not in aggregates:
+                aggregates[key] = _Aggregate()
+            aggregates[key].add(event_type, duration, queue_delay)
+
+        step = _PathStep(target=node_instance,
+                         operation=task.operation,
+                         status=event_type,
+                         start=task.sent,
+                         end=timestamp,
+                         previous=task.previous)
+        if self._last_finished is None or \
+                step.end >= self._last_finished.end:
+            self._last_finished = step
+        if self._tasks is not None:
+            self._tasks.append(step)
+
+    @property
+    def open_tasks_count(self):
+        return len(self._open_tasks)
+
+    def aggregates(self, group_by):
+        """Return the aggregates of `group_by`, the longest running first"""
+        rows = []
+        for key, aggregate in self._aggregates[group_by].iteritems():
+            row = aggregate.to_dict()
+            row[group_by] = key
+            rows.append(row)
+        return sorted(rows, key=lambda row: row['duration'], reverse=True)
+
+    def tasks(self):
+        """Return the finished task attempts, in the order they were sent
+        (only if tasks are kept)
+        """
+        return [self._step_to_dict(step) for step in
+                sorted(self._tasks or [], key=lambda step: step.start)]
+
+    def critical_path(self):
+        """Return the steps of the critical path, in the order they ran"""
+        steps = []
+        step = self._last_finished
+        while step is not None:
+            steps.append(self._step_to_dict(step))
+            step = step.previous
+        steps.reverse()
+        return steps
+
+    def _step_to_dict(self, step):
+        return {
+            'node_instance': step.target,
+            'operation': step.operation,
+            'status': step.status,
+            'start': round(step.start - self.first_timestamp, 3),
+            'duration': round(step.end - step.start, 3)
+        }
+
+    def to_dict(self):
+        if self.first_timestamp is None:
+            wall_time = 0
+        else:
+            wall_time = round(self.last_timestamp - self.first_timestamp, 3)
+        result = {
+            'events': self.events_count,
+            'wall_time': wall_time,
+            'open_tasks': self.open_tasks_count,
+            'critical_path': self.critical_path(),
+            GROUP_BY_NODE: self.aggregates(GROUP_BY_NODE),
+            GROUP_BY_NODE_INSTANCE: self.aggregates(GROUP_BY_NODE_INSTANCE),
+            GROUP_BY_OPERATION: self.aggregates(GROUP_BY_OPERATION)
+        }
+        if self._tasks is not None:
+            result['tasks'] = self.tasks()
+        return result
+
+    @staticmethod
+    def _task_key(context):
+        task_id = context.get('task_id')
+        if task_id:
+            return task_id
+        node_instance = context.get('node_id') or '{0}->{1}'.format(
+            context.get('source_id'), context.get('target_id'))
+        return node_instance, context.get('operation')
+
+    @staticmethod
+    def _target(context):
+        """Return the (node, node instance) a task runs on
+
+        Relationship operations are attributed to their source.
+        """
+        if context.get('node_id'):
+            return context.get('node_name'), context['node_id']
+        return context.get('source_name'), context.get('source_id')
@@ -12,29 +12,163 @@
 #    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #    * See the License for the specific language governing permissions and
 #    * limitations under the License.
+import sys
 import time
-from cloudify_cli.exceptions import ExecutionTimeoutError, \
-    EventProcessingTimeoutError
+import heapq
+import Queue
+import threading
+from datetime import datetime
+from itertools import islice
+
+from cloudify_cli import utils
+from cloudify_cli.constants import DEFAULT_CONCURRENCY
+from cloudify_cli.events_stats import parse_timestamp, parse_event_timestamp
+from cloudify_cli.exceptions import CloudifyCliError, \
+    ExecutionTimeoutError, EventProcessingTimeoutError
 from cloudify_rest_client.executions import Execution
 
 
 WAIT_FOR_EXECUTION_SLEEP_INTERVAL = 3
 WORKFLOW_END_TYPES = {u'workflow_succeeded', u'workflow_failed',
                       u'workflow_cancelled'}
+# the number of fetched batches buffered per execution while merging
+MERGE_BUFFER_BATCHES = 2
+LOG_LEVELS = ['debug', 'info', 'warning', 'error', 'critical']
+
+
+class EventsFilter(object):
+    """Selects events and logs by their level, type, node, operation and
+    timestamp
+
+    Every given criterion must match. The criteria are sent along with the
+    events query, so that the manager only returns the matching records,
+    and are applied again to the returned records, in case the manager
+    ignored any of them.
+
+    :param level: only log records of this level or above are selected
+                  (events have no level)
+    :param event_types: only events of these types are selected (logs
+                        have no type)
+    :param node_id: the ID of the node the records relate to
+    :param operation: the operation the records relate to; either its full
+                      name or only its last part (e.g. 'create')
+    :param since: the earliest timestamp (UTC) of the records
+    :param until: the latest timestamp (UTC) of the records
+    """
+
+    def __init__(self, level=None, event_types=None, node_id=None,
+                 operation=None, since=None, until=None):
+        if level and event_types:
+            raise CloudifyCliError(
+                'A level can only be specified for logs, and event types '
+                'only for events, so the two can\'t be used together')
+        if level and level.lower() not in LOG_LEVELS:
+            raise CloudifyCliError('Unknown log level: {0} (expected one of '
+                                   '{1})'.format(level, LOG_LEVELS))
+        self._levels = LOG_LEVELS[LOG_LEVELS.index(level.lower()):] \
+            if level else None
+        self._event_types = event_types
+        self._node_id = node_id
+        self._operation = operation
+        self._since = self._parse_time(since)
+        self._until = self._parse_time(until)
+
+    @staticmethod
+    def _parse_time(timestamp):
+        if timestamp is None:
+            return None
+        parsed = parse_timestamp(timestamp)
+        if parsed is None:
+            raise CloudifyCliError(
+                'Invalid timestamp: {0} (expected a UTC timestamp such as '
+                '2016-01-31 13:30:00)'.format(timestamp))
+        return parsed
+
+    @property
+    def is_empty(self):
+        return not any([self._levels, self._event_types, self._node_id,
+                        self._operation]) and \
+            self._since is None and self._until is None
+
+    @property
+    def include_logs(self):
+        """Whether logs must be fetched for the filter to match anything"""
+        return bool(self._levels)
+
+    def query_params(self):
+        """Return the keyword arguments to pass to `events.list`"""
+        params = {}
+        if self._levels:
+            params['level'] = self._levels
+        if self._event_types:
+            params['event_type'] = self._event_types
+        if self._node_id:
+            params['context.node_name'] = self._node_id
+        if self._operation and '.' in self._operation:
+            params['context.operation'] = self._operation
+        if self._since is not None:
+            params['from_datetime'] = \
+                datetime.utcfromtimestamp(self._since).isoformat()
+        if self._until is not None:
+            params['to_datetime'] = \
+                datetime.utcfromtimestamp(self._until).isoformat()
+        return params
+
+    def matches(self, event):
+        context = event.get('context') or {}
+        if self._levels and \
+                (event.get('level') or '').lower() not in self._levels:
+            return False
+        if self._event_types and \
+                event.get('event_type') not in self._event_types:
+            return False
+        if self._node_id and context.get('node_name') != self._node_id:
+            return False
+        if self._operation:
+            operation = context.get('operation') or ''
+            if self._operation not in (operation,
+                                       operation.split('.')[-1]):
+                return False
+        if self._since is not None or self._until is not None:
+            timestamp = parse_event_timestamp(event)
+            if timestamp is None:
+                return False
+            if self._since is not None and timestamp < self._since:
+                return False
+            if self._until is not None and timestamp > self._until:
+                return False
+        return True
+
+    def wrap(self, events_handler):
+        """Return an events handler which passes on only matching events"""
+        def filtered_events_handler(events):
+            events = [event for event in events if self.matches(event)]
+            self.matched_count += len(events)
+            if events and events_handler:
+                events_handler(events)
+        self.matched_count = 0
+        return filtered_events_handler
 
 
 class ExecutionEventsFetcher(object):
 
     def __init__(self, client, execution_id, batch_size=100,
-                 include_logs=False):
+                 include_logs=False, from_event=0, events_cache=None,
+                 events_filter=None):
         self._client = client
         self._execution_id = execution_id
         self._batch_size = batch_size
-        self._from_event = 0
+        # from_event allows resuming a previous fetch (e.g. an interrupted
+        # export) without fetching the already processed events again
+        self._from_event = from_event
         self._include_logs = include_logs
+        self._events_cache = events_cache
+        self._query_params = \
+            events_filter.query_params() if events_filter else {}
         # make sure execution exists before proceeding
         # a 404 will be raised otherwise
-        self._client.executions.get(execution_id)
+        execution = self._client.executions.get(execution_id)
+        self._execution_ended = execution.status in Execution.END_STATES
 
     def _fetch_and_process_events_batch(self, events_handler=None):
         events = self._fetch_events_batch()
@@ -43,19 +177,47 @@ class ExecutionEventsFetcher(object):
 
         return len(events)
 
+    @property
+    def from_event(self):
+        """The offset of the next event to be fetched"""
+        return self._from_event
+
     def _fetch_events_batch(self):
         events = self._client.events.list(
             execution_id=self._execution_id,
             _offset=self._from_event,
             _size=self._batch_size,
             include_logs=self._include_logs,
-            sort='@timestamp').items
+            sort='@timestamp',
+            **self._query_params).items
+        if self._events_cache is not None:
+            self._events_cache.append(self._from_event, events)
         self._from_event += len(events)
         return events
 
+    def _process_cached_events(self, events_handler=None):
+        cached_events = self._events_cache.iter_events(self._from_event)
+        total_events_count = 0
+        while True:
+            events = list(islice(cached_events, self._batch_size))
+            if not events:
+                break
+            self._from_event += len(events)
+            total_events_count += len(events)
+            if events_handler:
+                events_handler(events)
+        return total_events_count
+
     def fetch_and_process_events(self, events_handler=None, timeout=60):
         total_events_count = 0
 
+        # serve whatever is already cached locally, and only go to the
+        # manager for events that follow it
+        if self._events_cache is not None:
+            total_events_count += self._process_cached_events(events_handler)
+            if self._events_cache.immutable:
+                return total_events_count
+
         # timeout can be None (never time out), for example when tail is used
         if timeout is not None:
             deadline = time.time() + timeout
@@ -75,6 +237,11 @@ class ExecutionEventsFetcher(object):
                 # this means these are the last events found so far
                 break
 
+        # events of an ended execution won't change anymore
+        if self._events_cache is not None and self._execution_ended and \
+                self._events_cache.end_log_received:
+            self._events_cache.mark_immutable()
+
         return total_events_count
 
 
@@ -116,11 +283,204 @@ class EventsWatcher(object):
         return event.get('event_type') in WORKFLOW_END_TYPES
 
 
+def event_sort_key(event):
+    return event.get('@timestamp') or event.get('timestamp') or ''
+
+
+def merge_events(events_iterables):
+    """Merge iterables of events, each sorted by timestamp, into a single
+    iterator of events sorted by timestamp
+    """
+    def decorated(index, events):
+        for seq, event in enumerate(events):
+            # index and seq keep the merge stable and make sure the events
+            # themselves are never compared
+            yield event_sort_key(event), index, seq, event
+
+    merged = heapq.merge(*[decorated(index, events)
+                           for index, events in enumerate(events_iterables)])
+    for _, _, _, event in merged:
+        yield event
+
+
+class _ExecutionEventsProducer(object):
+    """Fetches the events of an execution in a background thread
+
+    No more than `MERGE_BUFFER_BATCHES` fetched batches are buffered, so a
+    consumer that falls behind holds back the fetching rather than letting
+    events pile up in memory.
+    """
+
+    _END = object()
+
+    def __init__(self, events_fetcher, events_handler=None):
+        self._events_fetcher = events_fetcher
+        self._events_handler = events_handler
+        self._queue = Queue.Queue(maxsize=MERGE_BUFFER_BATCHES)
+        self._thread = threading.Thread(target=self._produce)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _produce(self):
+        try:
+            self._events_fetcher.fetch_and_process_events(
+                events_handler=self._put, timeout=None)
+        except BaseException:
+            self._queue.put(sys.exc_info())
+        self._queue.put(self._END)
+
+    def _put(self, events):
+        if self._events_handler:
+            self._events_handler(events)
+        self._queue.put(events)
+
+    def __iter__(self):
+        while True:
+            # waiting with a timeout keeps the main thread responsive
+            # to KeyboardInterrupt
+            try:
+                item = self._queue.get(
+                    timeout=WAIT_FOR_EXECUTION_SLEEP_INTERVAL)
+            except Queue.Empty:
+                continue
+            if item is self._END:
+                return
+            if isinstance(item, tuple):
+                tpe, value, tb = item
+                raise tpe, value, tb
+            for event in item:
+                yield event
+
+
+class DeploymentEventsFetcher(object):
+    """Fetches the events of all the executions of a deployment as a single
+    stream, ordered by timestamp
+
+    The events of every execution are fetched concurrently and k-way merged
+    by their timestamp.
+
+    :param events_cache_getter: an optional function, returning the events
+                                cache to use for an execution ID
+    :param events_filter: an optional EventsFilter, whose criteria are
+                          sent along with the events queries
+    """
+
+    def __init__(self, client, deployment_id, batch_size=100,
+                 include_logs=False, events_cache_getter=None,
+                 events_filter=None):
+        self._client = client
+        self._deployment_id = deployment_id
+        self._batch_size = batch_size
+        self._include_logs = include_logs
+        self._events_cache_getter = events_cache_getter
+        self._events_filter = events_filter
+        # execution ID -> (events fetcher, events watcher)
+        self._executions = {}
+        self._ended_executions = set()
+        # make sure deployment exists before proceeding
+        # a 404 will be raised otherwise
+        self._list_executions()
+
+    def _list_executions(self):
+        return self._client.executions.list(
+            deployment_id=self._deployment_id,
+            include_system_workflows=True)
+
+    def _add_new_executions(self):
+        for execution in self._list_executions():
+            if execution.id in self._executions:
+                continue
+            events_cache = None
+            if self._events_cache_getter:
+                events_cache = self._events_cache_getter(execution.id)
+            events_fetcher = ExecutionEventsFetcher(
+                self._client,
+                execution.id,
+                batch_size=self._batch_size,
+                include_logs=self._include_logs,
+                events_cache=events_cache,
+                events_filter=self._events_filter)
+            self._executions[execution.id] = (events_fetcher, EventsWatcher())
+
+    def _process_merged(self, events_iterables, events_handler):
+        total_events_count = 0
+        merged = merge_events(events_iterables)
+        while True:
+            events = list(islice(merged, self._batch_size))
+            if not events:
+                return total_events_count
+            total_events_count += len(events)
+            if events_handler:
+                events_handler(events)
+
+    def fetch_and_process_events(self, events_handler=None):
+        """Fetch and process the events of the deployment's executions
+        created until now
+        """
+        self._add_new_executions()
+        producers = [_ExecutionEventsProducer(events_fetcher, events_watcher)
+                     for events_fetcher, events_watcher
+                     in self._executions.itervalues()]
+        return self._process_merged(producers, events_handler)
+
+    def tail(self, events_handler=None, concurrency=DEFAULT_CONCURRENCY):
+        """Process the deployment's events until interrupted, picking up
+        executions as they start
+
+        After the events created until now are processed, the executions
+        are polled for new events every few seconds. The events polled in
+        each round are merged by their timestamp.
+        """
+        total_events_count = self.fetch_and_process_events(events_handler)
+        while True:
+            time.sleep(WAIT_FOR_EXECUTION_SLEEP_INTERVAL)
+            self._add_new_executions()
+            active_execution_ids = [
+                execution_id for execution_id in self._executions
+                if execution_id not in self._ended_executions]
+            new_events = utils.run_concurrently(
+                self._fetch_new_events,
+                active_execution_ids,
+                concurrency)
+            total_events_count += self._process_merged(new_events,
+                                                       events_handler)
+
+    def _fetch_new_events(self, execution_id):
+        events_fetcher, events_watcher = self._executions[execution_id]
+        # the status is checked before fetching, so that once the execution
+        # has ended, the fetch below is guaranteed to get all of its events
+        execution = self._client.executions.get(execution_id)
+        if execution.status == Execution.PENDING:
+            return []
+        new_events = []
+
+        def collect(events):
+            events_watcher(events)
+            new_events.extend(events)
+
+        events_fetcher.fetch_and_process_events(events_handler=collect,
+                                                timeout=None)
+        if execution.status in Execution.END_STATES and (
+                events_watcher.end_log_received or
+                not _end_log_expected(self._events_filter)):
+            self._ended_executions.add(execution_id)
+        return new_events
+
+
+def _end_log_expected(events_filter):
+    # when the events are filtered, the workflow-end event might never be
+    # returned, so the events fetched after the execution has ended are
+    # taken to be the last ones
+    return events_filter is None or events_filter.is_empty
+
+
 def wait_for_execution(client,
                        execution,
                        events_handler=None,
                        include_logs=False,
-                       timeout=900):
+                       timeout=900,
+                       events_cache=None,
+                       events_filter=None):
 
     # if execution already ended - return without waiting
     if execution.status in Execution.END_STATES:
@@ -130,7 +490,10 @@ def wait_for_execution(client,
         deadline = time.time() + timeout
 
     events_fetcher = ExecutionEventsFetcher(client, execution.id,
-                                            include_logs=include_logs)
+                                            include_logs=include_logs,
+                                            events_cache=events_cache,
+                                            events_filter=events_filter)
+    end_log_expected = _end_log_expected(events_filter)
 
     # Poll for execution status and execution logs, until execution ends
     # and we receive an event of type in WORKFLOW_END_TYPES
@@ -157,7 +520,8 @@ def wait_for_execution(client,
             events_fetcher.fetch_and_process_events(
                 events_handler=events_watcher, timeout=timeout)
 
-        if execution_ended and events_watcher.end_log_received:
+        if execution_ended and (events_watcher.end_log_received or
+                                not end_log_expected):
             break
 
         time.sleep(WAIT_FOR_EXECUTION_SLEEP_INTERVAL)
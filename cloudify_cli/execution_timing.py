@@ -0,0 +1,118 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+"""
+Timing reports of local workflow executions (`--timing-report`).
+
+The task events local workflows write out are also passed to an
+`events_stats.ExecutionEventsStats`, which keeps every task attempt. Once
+the executions are over (or have failed), the slowest tasks, the tasks by
+operation and the critical path are printed, and the raw data is written
+to a JSON file.
+"""
+
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+from cloudify import logs
+
+from cloudify_cli import utils
+from cloudify_cli import events_stats
+from cloudify_cli.logger import get_logger
+
+
+DEFAULT_TIMING_REPORT_PATH = 'timing-report.json'
+SLOWEST_TASKS_COUNT = 10
+
+
+@contextmanager
+def capture_local_events(handler):
+    """Pass every event of the local workflows executed in the block to
+    `handler`, besides writing it out as usual
+    """
+    original_event_out = logs.stdout_event_out
+    # tasks run in a thread pool
+    lock = threading.Lock()
+
+    def event_out(event):
+        # timestamps the event, too
+        original_event_out(event)
+        with lock:
+            handler(event)
+
+    logs.stdout_event_out = event_out
+    try:
+        yield
+    finally:
+        logs.stdout_event_out = original_event_out
+
+
+@contextmanager
+def timing_report(output_path):
+    """Report the timing of the local workflows executed in the block,
+    writing the raw data to `output_path` (nothing is done if it's None)
+    """
+    if output_path is None:
+        yield
+        return
+    stats = events_stats.ExecutionEventsStats(keep_tasks=True)
+    started = time.time()
+    try:
+        with capture_local_events(stats.process_event):
+            yield
+    finally:
+        report = _build_report(stats, time.time() - started)
+        with open(output_path, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        _print_report(report)
+        get_logger().info('Timing report written to {0}'.format(output_path))
+
+
+def _build_report(stats, wall_time):
+    report = stats.to_dict()
+    # the events' wall time only spans from the first event to the last
+    report['wall_time'] = round(wall_time, 3)
+    report['task_time'] = round(sum(
+        aggregate['duration'] for aggregate
+        in report[events_stats.GROUP_BY_OPERATION]), 3)
+    report['retries'] = sum(
+        aggregate['retries'] for aggregate
+        in report[events_stats.GROUP_BY_OPERATION])
+    return report
+
+
+def _print_report(report):
+    logger = get_logger()
+    slowest_tasks = sorted(report['tasks'],
+                           key=lambda task: task['duration'],
+                           reverse=True)[:SLOWEST_TASKS_COUNT]
+    task_columns = ['start', 'duration', 'node_instance', 'operation',
+                    'status']
+    pt = utils.table(task_columns, data=slowest_tasks)
+    utils.print_table('Slowest tasks:', pt)
+    pt = utils.table([events_stats.GROUP_BY_OPERATION, 'tasks', 'retries',
+                      'failed', 'duration', 'max_duration'],
+                     data=report[events_stats.GROUP_BY_OPERATION])
+    utils.print_table('Tasks by operation:', pt)
+    pt = utils.table(task_columns, data=report['critical_path'])
+    utils.print_table('Critical path:', pt)
+    logger.info('Wall time: {0}s, summed task time: {1}s, task attempts: '
+                '{2}, retries: {3}'
+                .format(report['wall_time'],
+                        report['task_time'],
+                        len(report['tasks']),
+                        report['retries']))
@@ -0,0 +1,277 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+"""
+A local mirror of remote DSL imports (e.g. types and plugin YAMLs).
+
+Imports fetched over HTTP are kept under `.cloudify/imports-cache/`, along
+with their ETag and Last-Modified headers. A cached import is served as is
+for `import_cache_ttl` seconds after it was last validated, and is then
+revalidated with a conditional request. In offline mode, imports are only
+served from the cache.
+"""
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+
+import requests
+from retrying import retry, RetryError
+from dsl_parser.exceptions import DSLParsingLogicException
+from dsl_parser.import_resolver.abstract_import_resolver import \
+    AbstractImportResolver, read_import, DEFAULT_REQUEST_TIMEOUT
+from dsl_parser.import_resolver.default_import_resolver import \
+    DefaultImportResolver
+
+from cloudify_cli import utils
+from cloudify_cli.exceptions import CloudifyCliError
+
+
+IMPORTS_CACHE_DIR_NAME = 'imports-cache'
+CONTENT_FILE_SUFFIX = '.yaml'
+METADATA_FILE_SUFFIX = '.json'
+FETCH_ATTEMPTS = 3
+
+STATUS_CACHED = 'cached'
+STATUS_FETCHED = 'fetched'
+STATUS_NOT_MODIFIED = 'not modified'
+STATUS_STALE = 'stale (fetch failed)'
+
+
+def resolver_fingerprint(resolver):
+    """Return a string identifying the configuration of `resolver`"""
+    # resolvers are configured through their attributes (e.g. the default
+    # resolver's rules), so these identify the resolved imports
+    return '{0}.{1}:{2}'.format(type(resolver).__module__,
+                                type(resolver).__name__,
+                                json.dumps(vars(resolver),
+                                           sort_keys=True,
+                                           default=repr))
+
+
+def _is_remote(import_url):
+    return import_url.split(':')[0] in ['http', 'https', 'ftp']
+
+
+class _FetchError(Exception):
+    pass
+
+
+class CachingImportResolver(AbstractImportResolver):
+    """Serves remote imports from a local cache, delegating the rest to
+    another resolver
+
+    :param resolver: the resolver remote imports are otherwise fetched
+                     with (by default, a rule-less DefaultImportResolver)
+    :param cache_dir: the directory the cached imports are kept in
+    :param ttl: the number of seconds a cached import is served for
+                without being revalidated
+    :param offline: only serve imports from the cache
+    :param refresh: revalidate every cached import, regardless of `ttl`
+    """
+
+    def __init__(self, resolver, cache_dir, ttl=0, offline=False,
+                 refresh=False):
+        self.resolver = resolver or DefaultImportResolver()
+        self._cache_dir = cache_dir
+        self._ttl = ttl
+        self._offline = offline
+        self._refresh = refresh
+        self._namespace = resolver_fingerprint(self.resolver)
+        # (import url, status, size) of every remote import served
+        self.served = []
+
+    def resolve(self, import_url):
+        return self._resolve_remote(import_url)
+
+    def fetch_import(self, import_url):
+        if not _is_remote(import_url):
+            return self.resolver.fetch_import(import_url)
+        return self._resolve_remote(import_url)
+
+    def _resolve_remote(self, import_url):
+        entry = self._load_entry(import_url)
+        if entry is not None and (self._offline or (
+                not self._refresh and
+                time.time() - entry['validated_at'] < self._ttl)):
+            return self._served(import_url, STATUS_CACHED, entry['content'])
+        if self._offline:
+            ex = DSLParsingLogicException(
+                13, "Import failed: {0} isn't cached, and can't be fetched "
+                    "in offline mode (run `cfy imports prefetch` first)"
+                    .format(import_url))
+            ex.failed_import = import_url
+            raise ex
+
+        try:
+            entry, status = self._fetch(import_url, entry)
+        except DSLParsingLogicException:
+            if entry is None:
+                raise
+            # better a stale import than none at all
+            return self._served(import_url, STATUS_STALE, entry['content'])
+        entry['validated_at'] = time.time()
+        self._dump_entry(import_url, entry)
+        return self._served(import_url, status, entry['content'])
+
+    def _served(self, import_url, status, content):
+        self.served.append((import_url, status, len(content)))
+        return content
+
+    def _fetch(self, import_url, entry):
+        if type(self.resolver).resolve != DefaultImportResolver.resolve:
+            # a custom resolver is trusted to fetch the import its own way,
+            # so it can't be revalidated
+            return {'source': import_url,
+                    'content': self.resolver.resolve(import_url)}, \
+                STATUS_FETCHED
+
+        failed_urls = {}
+        for url in self._candidate_urls(import_url):
+            try:
+                return self._fetch_url(url, entry)
+            except (_FetchError, DSLParsingLogicException) as e:
+                failed_urls[url] = str(e)
+        ex = DSLParsingLogicException(
+            13, 'Import failed: Unable to open import url {0}; {1}'
+                .format(import_url, failed_urls))
+        ex.failed_import = import_url
+        raise ex
+
+    def _candidate_urls(self, import_url):
+        """The urls the default resolver would try, in the same order"""
+        urls = []
+        for rule in self.resolver.rules:
+            prefix, replacement = rule.items()[0]
+            if import_url.startswith(prefix):
+                urls.append(replacement + import_url[len(prefix):])
+        urls.append(import_url)
+        return [url for index, url in enumerate(urls)
+                if url not in urls[:index]]
+
+    def _fetch_url(self, url, entry):
+        if not url.startswith(('http:', 'https:')):
+            return {'source': url, 'content': read_import(url)}, \
+                STATUS_FETCHED
+
+        headers = {}
+        if entry is not None and entry['source'] == url:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        response = _get(url, headers)
+        if response.status_code == 304 and headers:
+            return entry, STATUS_NOT_MODIFIED
+        if not 200 <= response.status_code < 300:
+            raise _FetchError('status code: {0}'.format(
+                response.status_code))
+        return {'source': url,
+                'content': response.text,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified')}, \
+            STATUS_FETCHED
+
+    def _entry_path(self, import_url):
+        key = hashlib.sha256(
+            '{0}\0{1}'.format(self._namespace, import_url)).hexdigest()
+        return os.path.join(self._cache_dir, key)
+
+    def _load_entry(self, import_url):
+        entry_path = self._entry_path(import_url)
+        try:
+            with open(entry_path + METADATA_FILE_SUFFIX) as f:
+                entry = json.load(f)
+            with open(entry_path + CONTENT_FILE_SUFFIX, 'rb') as f:
+                entry['content'] = f.read().decode('utf-8')
+        except (IOError, OSError, ValueError):
+            return None
+        return entry
+
+    def _dump_entry(self, import_url, entry):
+        if not os.path.isdir(self._cache_dir):
+            os.makedirs(self._cache_dir)
+        entry_path = self._entry_path(import_url)
+        metadata = dict((key, value) for key, value in entry.iteritems()
+                        if key != 'content')
+        metadata['url'] = import_url
+        content = entry['content']
+        if isinstance(content, unicode):
+            content = content.encode('utf-8')
+        # the cache may be shared by several processes (e.g. when
+        # validating blueprints in parallel), so files are replaced
+        # atomically, and the content is written first, so that metadata
+        # is never found next to partially written content
+        self._write(entry_path + CONTENT_FILE_SUFFIX, content)
+        self._write(entry_path + METADATA_FILE_SUFFIX, json.dumps(metadata))
+
+    def _write(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self._cache_dir)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        # os.rename can't replace an existing file on windows
+        if os.name == 'nt' and os.path.exists(path):
+            os.remove(path)
+        os.rename(tmp_path, path)
+
+
+def _is_recoverable_error(e):
+    return isinstance(e, (requests.ConnectionError, requests.Timeout))
+
+
+def _is_internal_error(response):
+    return response.status_code >= 500
+
+
+@retry(stop_max_attempt_number=FETCH_ATTEMPTS,
+       wait_fixed=1000,
+       retry_on_exception=_is_recoverable_error,
+       retry_on_result=_is_internal_error)
+def _get_with_retries(url, headers):
+    return requests.get(url, headers=headers, timeout=DEFAULT_REQUEST_TIMEOUT)
+
+
+def _get(url, headers):
+    try:
+        return _get_with_retries(url, headers)
+    except requests.RequestException as e:
+        raise _FetchError(str(e))
+    except RetryError as e:
+        raise _FetchError('status code: {0}'.format(
+            e.last_attempt.value.status_code))
+
+
+def get_caching_resolver(resolver=None, offline=False, refresh=False):
+    """Return `resolver`, wrapped with the working directory's imports cache
+
+    If the working directory isn't initialized, there's no cache, and
+    `resolver` is returned as is.
+    """
+    if isinstance(resolver, CachingImportResolver):
+        return resolver
+    if not utils.is_initialized():
+        if offline or refresh:
+            raise CloudifyCliError(
+                'The imports cache is kept in the working directory, which '
+                'is not initialized (run `cfy init` first)')
+        return resolver
+    return CachingImportResolver(
+        resolver,
+        cache_dir=os.path.join(utils.get_init_path(), IMPORTS_CACHE_DIR_NAME),
+        ttl=utils.CloudifyConfig().import_cache_ttl,
+        offline=offline,
+        refresh=refresh)
@@ -0,0 +1,348 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+"""
+Storage backends of local workflow environments.
+
+Besides the `file` and `memory` storages of `cloudify.workflows.local`,
+environments may be kept in a SQLite database (the `sqlite` storage):
+node instances are indexed by their node, every update is a transaction,
+and loading an environment doesn't read its node instances.
+
+Like FileStorage, a SQLiteStorage keeps an environment under
+`<storage_dir>/<name>/`, along with a copy of the blueprint's directory.
+"""
+
+import os
+import json
+import shutil
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from cloudify.workflows import local
+from cloudify_rest_client.nodes import Node
+from cloudify_rest_client.node_instances import NodeInstance
+
+from cloudify_cli.exceptions import CloudifyCliError
+
+
+STORAGE_SQLITE = 'sqlite'
+STORAGE_FILE = 'file'
+STORAGE_MEMORY = 'memory'
+STORAGE_TYPES = [STORAGE_SQLITE, STORAGE_FILE, STORAGE_MEMORY]
+
+DATABASE_FILE_NAME = 'storage.sqlite'
+# FileStorage's data file
+FILE_STORAGE_DATA_FILE_NAME = 'data'
+
+_SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS data '
+    '(key TEXT PRIMARY KEY, value TEXT NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS node_instances '
+    '(id TEXT PRIMARY KEY, node_id TEXT NOT NULL, '
+    'version INTEGER NOT NULL, instance TEXT NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS node_instances_node_id '
+    'ON node_instances (node_id)'
+]
+# seconds to wait for another process's transaction to end
+_BUSY_TIMEOUT = 60
+
+
+class SQLiteStorage(local._Storage):
+
+    def __init__(self, storage_dir):
+        super(SQLiteStorage, self).__init__()
+        self._root_storage_dir = storage_dir
+        self._storage_dir = None
+        self._workdir = None
+        self._blueprint_path = None
+        # a connection per thread, as workflow tasks run in a thread pool
+        self._connections = threading.local()
+
+    def init(self, name, plan, nodes, node_instances, blueprint_path,
+             provider_context):
+        storage_dir = os.path.join(self._root_storage_dir, name)
+        os.makedirs(storage_dir)
+        os.mkdir(os.path.join(storage_dir, 'workdir'))
+        self._storage_dir = storage_dir
+        resources_root = os.path.join(storage_dir, 'resources')
+
+        def ignore(src, names):
+            return names if os.path.abspath(resources_root) == src \
+                else set()
+        shutil.copytree(os.path.dirname(os.path.abspath(blueprint_path)),
+                        resources_root, ignore=ignore)
+
+        with self._transaction() as connection:
+            for statement in _SCHEMA:
+                connection.execute(statement)
+            connection.executemany(
+                'INSERT INTO data (key, value) VALUES (?, ?)',
+                [(key, json.dumps(value)) for key, value in [
+                    ('plan', plan),
+                    ('nodes', nodes),
+                    ('blueprint_filename',
+                     os.path.basename(os.path.abspath(blueprint_path))),
+                    ('provider_context', provider_context or {}),
+                    ('payload', {})]])
+            connection.executemany(
+                'INSERT INTO node_instances (id, node_id, version, instance) '
+                'VALUES (?, ?, ?, ?)',
+                [(instance.id, instance.node_id, instance.version,
+                  json.dumps(instance)) for instance in node_instances])
+        self.load(name)
+
+    def load(self, name):
+        self.name = name
+        self._storage_dir = os.path.join(self._root_storage_dir, name)
+        if not os.path.isfile(self._database_path()):
+            raise CloudifyCliError('{0} is not a SQLite local storage'
+                                   .format(self._storage_dir))
+        self._workdir = os.path.join(self._storage_dir, 'workdir')
+        self.resources_root = os.path.join(self._storage_dir, 'resources')
+        data = dict(
+            (key, json.loads(value)) for key, value in self._connection()
+            .execute('SELECT key, value FROM data WHERE key != ?',
+                     ('payload',)))
+        self.plan = data['plan']
+        self._blueprint_path = os.path.join(self.resources_root,
+                                            data['blueprint_filename'])
+        self._provider_context = data['provider_context']
+        self._init_locks_and_nodes([Node(node) for node in data['nodes']])
+
+    @contextmanager
+    def payload(self):
+        with self._transaction() as connection:
+            payload = json.loads(connection.execute(
+                'SELECT value FROM data WHERE key = ?',
+                ('payload',)).fetchone()[0])
+            yield payload
+            connection.execute('UPDATE data SET value = ? WHERE key = ?',
+                               (json.dumps(payload), 'payload'))
+
+    def get_blueprint_path(self):
+        return self._blueprint_path
+
+    def update_node_instance(self,
+                             node_instance_id,
+                             version,
+                             runtime_properties=None,
+                             state=None):
+        # the version check and the update are a single transaction, so
+        # they're safe across processes as well as threads
+        with self._lock(node_instance_id), self._transaction():
+            super(SQLiteStorage, self).update_node_instance(
+                node_instance_id, version, runtime_properties, state)
+
+    def _load_instance(self, node_instance_id):
+        row = self._connection().execute(
+            'SELECT instance FROM node_instances WHERE id = ?',
+            (node_instance_id,)).fetchone()
+        return NodeInstance(json.loads(row[0])) if row else None
+
+    def _store_instance(self, node_instance):
+        self._connection().execute(
+            'UPDATE node_instances SET version = ?, instance = ? '
+            'WHERE id = ?',
+            (node_instance.version, json.dumps(node_instance),
+             node_instance.id))
+
+    def get_node_instances(self, node_id=None):
+        return list(self.iter_node_instances(node_id=node_id))
+
+    def iter_node_instances(self, node_id=None):
+        """Yield node instances as they're read from the database"""
+        if node_id:
+            rows = self._connection().execute(
+                'SELECT instance FROM node_instances WHERE node_id = ? '
+                'ORDER BY id', (node_id,))
+        else:
+            rows = self._connection().execute(
+                'SELECT instance FROM node_instances ORDER BY id')
+        for instance, in rows:
+            yield NodeInstance(json.loads(instance))
+
+    def _instance_ids(self):
+        return [instance_id for instance_id, in self._connection().execute(
+            'SELECT id FROM node_instances')]
+
+    def get_workdir(self):
+        return self._workdir
+
+    def close(self):
+        """Close the current thread's connection to the database"""
+        connection = getattr(self._connections, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._connections.connection = None
+
+    def _database_path(self):
+        return os.path.join(self._storage_dir, DATABASE_FILE_NAME)
+
+    def _connection(self):
+        connection = getattr(self._connections, 'connection', None)
+        if connection is None:
+            # transactions are managed explicitly (see `_transaction`)
+            connection = sqlite3.connect(self._database_path(),
+                                         timeout=_BUSY_TIMEOUT,
+                                         isolation_level=None)
+            self._connections.connection = connection
+            self._connections.depth = 0
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        """Run the enclosed statements in a single transaction of the
+        current thread's connection (nested transactions join the outer
+        one)
+        """
+        connection = self._connection()
+        if self._connections.depth:
+            self._connections.depth += 1
+            try:
+                yield connection
+            finally:
+                self._connections.depth -= 1
+            return
+        connection.execute('BEGIN IMMEDIATE')
+        self._connections.depth = 1
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        else:
+            connection.execute('COMMIT')
+        finally:
+            self._connections.depth = 0
+
+
+def iter_node_instances(storage, node_id=None):
+    """Yield the node instances kept in `storage` one at a time (only
+    those of the node `node_id`, if given)
+
+    SQLite storages look instances up by their indexed node. File storages
+    only read the files of instances named after the node, as instance ids
+    are the node id followed by a suffix.
+    """
+    if isinstance(storage, SQLiteStorage):
+        return storage.iter_node_instances(node_id=node_id)
+    if isinstance(storage, local.FileStorage):
+        instance_ids = sorted(storage._instance_ids())
+        if node_id:
+            instance_ids = [instance_id for instance_id in instance_ids
+                            if instance_id.startswith(node_id + '_')]
+        # another node's id may also start with `node_id`
+        return (instance for instance in
+                (storage.get_node_instance(instance_id)
+                 for instance_id in instance_ids)
+                if not node_id or instance.node_id == node_id)
+    return iter(storage.get_node_instances(node_id=node_id))
+
+
+def storage_type(storage_dir, name):
+    """Return the type of the storage an environment is kept in, or None
+    if there's no such environment
+    """
+    environment_dir = os.path.join(storage_dir, name)
+    if os.path.isfile(os.path.join(environment_dir, DATABASE_FILE_NAME)):
+        return STORAGE_SQLITE
+    if os.path.isfile(os.path.join(environment_dir,
+                                   FILE_STORAGE_DATA_FILE_NAME)):
+        return STORAGE_FILE
+    return None
+
+
+def create_storage(storage_type, storage_dir):
+    """Return a new (uninitialized) storage of `storage_type`"""
+    if storage_type == STORAGE_SQLITE:
+        return SQLiteStorage(storage_dir=storage_dir)
+    if storage_type == STORAGE_FILE:
+        return local.FileStorage(storage_dir=storage_dir)
+    if storage_type == STORAGE_MEMORY:
+        return local.InMemoryStorage()
+    raise CloudifyCliError('Unknown storage type: {0} (expected one of {1})'
+                           .format(storage_type, ', '.join(STORAGE_TYPES)))
+
+
+def load_storage(storage_dir, name):
+    """Return a storage for loading the environment kept in `storage_dir`,
+    whatever its type (None if there's no such environment)
+    """
+    existing_type = storage_type(storage_dir, name)
+    if existing_type is None:
+        return None
+    return create_storage(existing_type, storage_dir)
+
+
+def migrate_file_storage(storage_dir, name):
+    """Convert an environment kept in a FileStorage to a SQLiteStorage,
+    keeping its runtime state, resources and work directory
+    """
+    if storage_type(storage_dir, name) != STORAGE_FILE:
+        raise CloudifyCliError('{0} is not a file local storage'
+                               .format(os.path.join(storage_dir, name)))
+    file_storage = local.FileStorage(storage_dir=storage_dir)
+    file_storage.load(name)
+    environment_dir = os.path.join(storage_dir, name)
+    # built aside, and swapped in once complete
+    migrated_dir = os.path.join(storage_dir, '.{0}.migrating'.format(name))
+    if os.path.isdir(migrated_dir):
+        shutil.rmtree(migrated_dir)
+    os.makedirs(migrated_dir)
+    try:
+        sqlite_storage = SQLiteStorage(storage_dir=migrated_dir)
+        sqlite_storage.init(
+            name=name,
+            plan=file_storage.plan,
+            nodes=file_storage.get_nodes(),
+            node_instances=file_storage.get_node_instances(),
+            blueprint_path=file_storage.get_blueprint_path(),
+            provider_context=file_storage.get_provider_context())
+        with file_storage.payload() as payload, \
+                sqlite_storage.payload() as migrated_payload:
+            migrated_payload.update(payload)
+        sqlite_storage.close()
+        migrated_environment_dir = os.path.join(migrated_dir, name)
+        workdir = os.path.join(environment_dir, 'workdir')
+        if os.path.isdir(workdir):
+            shutil.rmtree(os.path.join(migrated_environment_dir, 'workdir'))
+            shutil.copytree(workdir,
+                            os.path.join(migrated_environment_dir, 'workdir'))
+        replace_directory(environment_dir, migrated_environment_dir)
+    finally:
+        shutil.rmtree(migrated_dir, ignore_errors=True)
+
+
+def replace_directory(path, new_path):
+    """Replace the directory at `path` with the one at `new_path`
+
+    The directory at `path` is renamed aside before the new one is renamed
+    into its place, and only deleted after that, so it's never lost: it's
+    renamed back if the new directory can't be renamed into place.
+    """
+    replaced_path = os.path.join(
+        os.path.dirname(path),
+        '.{0}.replaced'.format(os.path.basename(path)))
+    if os.path.isdir(replaced_path):
+        shutil.rmtree(replaced_path)
+    os.rename(path, replaced_path)
+    try:
+        os.rename(new_path, path)
+    except BaseException:
+        os.rename(replaced_path, path)
+        raise
+    shutil.rmtree(replaced_path)
@@ -0,0 +1,219 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+"""
+A content-addressed cache of parsed blueprints.
+
+A parsed blueprint is identified by the path and content of its main file,
+the import resolver's configuration, whether the definitions version is
+validated and the DSL parser's version, plus the content of every import
+it resolved. Parsed blueprints are kept in memory (and, when the working
+directory is initialized, under `.cloudify/plan-cache/`), and are reused
+as long as none of their imports has changed: the recorded digests of the
+imports are checked again on every use, so a long running process (e.g.
+`cfy local init --watch`) sees imports that changed meanwhile.
+
+Inputs aren't part of the key, as they're only applied to the parsed
+plan when the deployment plan is prepared.
+"""
+
+import os
+import copy
+import hashlib
+import cPickle
+
+import pkg_resources
+from dsl_parser.parser import parse_from_path
+from dsl_parser.import_resolver.abstract_import_resolver import \
+    AbstractImportResolver
+from dsl_parser.import_resolver.default_import_resolver import \
+    DefaultImportResolver
+
+from cloudify_cli import utils
+from cloudify_cli import import_cache
+
+
+PLAN_CACHE_DIR_NAME = 'plan-cache'
+PLAN_FILE_SUFFIX = '.pickle'
+
+# cache key -> (imports, parsed plan)
+_plans = {}
+
+
+class _RecordingImportResolver(AbstractImportResolver):
+    """Delegates to another resolver, recording the digest of every import
+    it fetches
+    """
+
+    def __init__(self, resolver):
+        self._resolver = resolver
+        self.imports = []
+
+    def resolve(self, import_url):
+        return self._resolver.resolve(import_url)
+
+    def fetch_import(self, import_url):
+        content = self._resolver.fetch_import(import_url)
+        self.imports.append((import_url, _digest(content)))
+        return content
+
+
+def parse_blueprint(blueprint_path, resolver=None, validate_version=True):
+    """Parse a blueprint, or return its cached parsed plan
+
+    Remote imports are fetched through the working directory's imports
+    cache (see `import_cache`). The returned plan is a copy, so it may be
+    modified by the caller.
+    """
+    _, _, plan = _get(blueprint_path, resolver, validate_version)
+    return copy.deepcopy(plan)
+
+
+def blueprint_fingerprint(blueprint_path, resolver=None,
+                          validate_version=True):
+    """Return a digest of a blueprint, its parsing configuration and the
+    content of all of its imports
+
+    The blueprint is parsed (or its cached plan is revalidated) to find its
+    imports, so parsing it right after is served from memory.
+    """
+    key, imports, _ = _get(blueprint_path, resolver, validate_version)
+    fingerprint = hashlib.sha256(key)
+    for import_url, digest in imports:
+        fingerprint.update('\0')
+        fingerprint.update(_digest(import_url))
+        fingerprint.update('\0')
+        fingerprint.update(digest)
+    return fingerprint.hexdigest()
+
+
+def blueprint_imports(blueprint_path, resolver=None, validate_version=True):
+    """Return the URLs of the imports of a blueprint (parsing it, or
+    revalidating its cached plan)
+    """
+    _, imports, _ = _get(blueprint_path, resolver, validate_version)
+    return [import_url for import_url, digest in imports]
+
+
+def _get(blueprint_path, resolver, validate_version):
+    """Return the cache key, imports and (shared, not copied) parsed plan
+    of a blueprint
+    """
+    resolver = import_cache.get_caching_resolver(
+        resolver or DefaultImportResolver())
+    if isinstance(resolver, import_cache.CachingImportResolver):
+        key = _cache_key(blueprint_path, resolver.resolver, validate_version)
+    else:
+        key = _cache_key(blueprint_path, resolver, validate_version)
+    cached = _plans.get(key)
+    if cached is not None and not _imports_unchanged(cached[0], resolver):
+        cached = None
+    if cached is None:
+        cached = _load(key, resolver)
+        if cached is None:
+            recording_resolver = _RecordingImportResolver(resolver)
+            plan = parse_from_path(dsl_file_path=blueprint_path,
+                                   resolver=recording_resolver,
+                                   validate_version=validate_version)
+            cached = (recording_resolver.imports, plan)
+            _dump(key, cached)
+        _plans[key] = cached
+    imports, plan = _plans[key]
+    return key, imports, plan
+
+
+def _cache_key(blueprint_path, resolver, validate_version):
+    with open(blueprint_path, 'rb') as f:
+        blueprint_digest = _digest(f.read())
+    key = hashlib.sha256()
+    # imports are resolved relative to the blueprint's location
+    for part in [os.path.abspath(blueprint_path),
+                 blueprint_digest,
+                 import_cache.resolver_fingerprint(resolver),
+                 str(bool(validate_version)),
+                 _parser_version()]:
+        key.update(part)
+        key.update('\0')
+    return key.hexdigest()
+
+
+def _parser_version():
+    try:
+        return pkg_resources.get_distribution('cloudify-dsl-parser').version
+    except pkg_resources.DistributionNotFound:
+        return ''
+
+
+def _digest(content):
+    if isinstance(content, unicode):
+        content = content.encode('utf-8')
+    return hashlib.sha256(content).hexdigest()
+
+
+def _imports_unchanged(imports, resolver):
+    for import_url, digest in imports:
+        try:
+            if _digest(resolver.fetch_import(import_url)) != digest:
+                return False
+        except Exception:
+            return False
+    return True
+
+
+def _plan_path(key):
+    if not utils.is_initialized():
+        return None
+    if not utils.CloudifyConfig().blueprint_plan_cache:
+        return None
+    return os.path.join(utils.get_init_path(),
+                        PLAN_CACHE_DIR_NAME,
+                        key + PLAN_FILE_SUFFIX)
+
+
+def _load(key, resolver):
+    plan_path = _plan_path(key)
+    if plan_path is None or not os.path.isfile(plan_path):
+        return None
+    try:
+        with open(plan_path, 'rb') as f:
+            cached = cPickle.load(f)
+    except Exception:
+        # a corrupted entry is simply parsed again
+        return None
+    imports, _ = cached
+    if not _imports_unchanged(imports, resolver):
+        return None
+    return cached
+
+
+def _dump(key, cached):
+    plan_path = _plan_path(key)
+    if plan_path is None:
+        return
+    plan_dir = os.path.dirname(plan_path)
+    if not os.path.isdir(plan_dir):
+        os.makedirs(plan_dir)
+    tmp_path = plan_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        cPickle.dump(cached, f, cPickle.HIGHEST_PROTOCOL)
+    # os.rename can't replace an existing file on windows
+    if os.name == 'nt' and os.path.exists(plan_path):
+        os.remove(plan_path)
+    os.rename(tmp_path, plan_path)
+
+
+def clear():
+    """Forget the plans parsed by this process"""
+    _plans.clear()
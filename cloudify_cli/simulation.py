@@ -0,0 +1,136 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+"""
+Simulated executions of local workflows (`cfy local execute --simulate`).
+
+The workflow runs as usual, building and executing its real task graph,
+but every operation is replaced by a stub that only sleeps: for a fixed
+duration, or for a duration sampled from the tasks of the same operation
+in a timing report (see `execution_timing`). The workflow runs on an in
+memory copy of the environment, so the environment itself is left as is.
+"""
+
+import json
+import time
+import random
+import threading
+from contextlib import contextmanager
+
+from cloudify import dispatch
+from cloudify.workflows import local
+
+from cloudify_cli import common
+from cloudify_cli.logger import get_logger
+from cloudify_cli.events_stats import TASK_SUCCEEDED
+
+
+DEFAULT_OPERATION_DURATION = 0.1
+
+
+class Durations(object):
+    """The durations of simulated operations
+
+    :param duration: the duration (in seconds) of operations that don't
+                     have sampled durations
+    :param timing_report_path: a timing report to sample the durations of
+                               operations from (by their name)
+    """
+
+    def __init__(self, duration=DEFAULT_OPERATION_DURATION,
+                 timing_report_path=None):
+        self._duration = duration
+        self._samples = {}
+        if timing_report_path:
+            with open(timing_report_path) as f:
+                tasks = json.load(f).get('tasks', [])
+            for task in tasks:
+                if task['status'] == TASK_SUCCEEDED:
+                    self._samples.setdefault(task['operation'], []).append(
+                        task['duration'])
+
+    def __call__(self, operation):
+        samples = self._samples.get(operation)
+        return random.choice(samples) if samples else self._duration
+
+
+class _SimulatedEnvironment(local._Environment):
+    """An in memory copy of a local environment"""
+
+    def __init__(self, env):
+        self.storage = local.InMemoryStorage()
+        self.storage.env = self
+        self.storage.init(
+            name=env.name,
+            plan=env.plan,
+            nodes=env.storage.get_nodes(),
+            node_instances=env.storage.get_node_instances(),
+            # only used to locate the resources, which are set below
+            blueprint_path=env.storage.resources_root,
+            provider_context=env.storage.get_provider_context())
+        self.storage.resources_root = env.storage.resources_root
+
+
+@contextmanager
+def _simulated_operations(durations, operations):
+    """Have every operation executed in the block sleep for its duration,
+    and append the name of each to `operations`
+    """
+    lock = threading.Lock()
+    operation_handler_cls = dispatch.TASK_HANDLERS['operation']
+
+    class SimulatedOperationHandler(operation_handler_cls):
+
+        @property
+        def func(self):
+            if not self._func:
+                operation = self.cloudify_context['operation']['name']
+                with lock:
+                    operations.append(operation)
+
+                def simulated_operation(*args, **kwargs):
+                    time.sleep(durations(operation))
+                self._func = simulated_operation
+            return self._func
+
+    dispatch.TASK_HANDLERS['operation'] = SimulatedOperationHandler
+    try:
+        yield
+    finally:
+        dispatch.TASK_HANDLERS['operation'] = operation_handler_cls
+
+
+def execute(env, durations, workflow, task_thread_pool_size, **kwargs):
+    """Simulate executing `workflow` on `env` (other keyword arguments
+    are passed to `env.execute`), and report its scheduling throughput
+    """
+    logger = get_logger()
+    simulated_env = _SimulatedEnvironment(env)
+    operations = []
+    logger.info("Simulating the '{0}' workflow, with a pool of {1} task "
+                "threads...".format(workflow, task_thread_pool_size))
+    started = time.time()
+    with _simulated_operations(durations, operations):
+        simulated_env.execute(workflow,
+                              task_thread_pool_size=task_thread_pool_size,
+                              **kwargs)
+    elapsed = time.time() - started
+    logger.info('Simulated {0} operations in {1:.2f} seconds ({2:.1f} '
+                'operations a second); the widest layer of the blueprint '
+                'has {3} node instances'.format(
+                    len(operations),
+                    elapsed,
+                    len(operations) / elapsed if elapsed else 0,
+                    common.graph_width(env.plan['node_instances'])))
@@ -17,10 +17,17 @@
 Tests all commands that start with 'cfy blueprints'
 """
 
+import os
+import shutil
+import tempfile
+
 import yaml
 from mock import MagicMock, patch
 
+from cloudify_rest_client.exceptions import CloudifyClientError
+
 from cloudify_cli import utils
+from cloudify_cli.commands import blueprints
 from cloudify_cli.tests import cli_runner
 from cloudify_cli.tests.commands.test_cli_command import CliCommandTest
 from cloudify_cli.tests.commands.test_cli_command import BLUEPRINTS_DIR
@@ -49,20 +56,20 @@ class BlueprintsTest(CliCommandTest):
         cli_runner.run_cli('cfy blueprints get -b a-blueprint-id')
 
     def test_blueprints_upload(self):
-        self.client.blueprints.upload = MagicMock()
+        self.client._client.put = MagicMock(return_value={'id': 'bp'})
         cli_runner.run_cli('cfy blueprints upload -p '
                            '{0}/helloworld/blueprint.yaml '
                            '-b my_blueprint_id'.format(BLUEPRINTS_DIR))
 
     def test_blueprints_upload_invalid(self):
-        self.client.blueprints.upload = MagicMock()
+        self.client._client.put = MagicMock(return_value={'id': 'bp'})
         cli_runner.run_cli('cfy blueprints upload -p '
                            '{0}/bad_blueprint/blueprint.yaml '
                            '-b my_blueprint_id'
                            .format(BLUEPRINTS_DIR))
 
     def test_blueprints_upload_invalid_validate(self):
-        self.client.blueprints.upload = MagicMock()
+        self.client._client.put = MagicMock(return_value={'id': 'bp'})
         self._assert_ex('cfy blueprints upload -p '
                         '{0}/bad_blueprint/blueprint.yaml '
                         '-b my_blueprint_id --validate'
@@ -112,6 +119,112 @@ class BlueprintsTest(CliCommandTest):
                         .format(BLUEPRINTS_DIR),
                         'Failed to validate blueprint')
 
+    def test_validate_many_blueprints(self):
+        cli_runner.run_cli('cfy blueprints validate --concurrency 2 '
+                           '-p {0}/helloworld/blueprint.yaml '
+                           '{0}/local/blueprint.yaml '
+                           '{0}/local/blueprint_with_plugins.yaml'
+                           .format(BLUEPRINTS_DIR))
+
+    def test_validate_many_blueprints_with_a_bad_one(self):
+        self._assert_ex('cfy blueprints validate '
+                        '-p {0}/helloworld/blueprint.yaml '
+                        '{0}/bad_blueprint/blueprint.yaml'
+                        .format(BLUEPRINTS_DIR),
+                        '1 of 2 blueprints failed validation')
+
+    def test_validate_blueprints_glob(self):
+        with patch('cloudify_cli.utils.run_in_processes',
+                   return_value=[]) as run_mock:
+            cli_runner.run_cli('cfy blueprints validate '
+                               '-p {0}/helloworld/blueprint.yaml '
+                               '{0}/local/blueprint_with*.yaml'
+                               .format(BLUEPRINTS_DIR))
+        paths = [path for path, _ in run_mock.call_args[0][1]]
+        self.assertEqual(
+            ['{0}/local/blueprint_with_plugins.yaml'.format(BLUEPRINTS_DIR),
+             '{0}/local/blueprint_without_plugins.yaml'.format(
+                 BLUEPRINTS_DIR)],
+            paths)
+
+    def test_validate_blueprints_glob_without_matches(self):
+        self._assert_ex('cfy blueprints validate '
+                        '-p {0}/*/no_such_blueprint.yaml'
+                        .format(BLUEPRINTS_DIR),
+                        'No blueprints match')
+
+    def _create_blueprints_dir(self, *names):
+        blueprints_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, blueprints_dir)
+        for name in names:
+            os.mkdir(os.path.join(blueprints_dir, name))
+            with open(os.path.join(blueprints_dir, name, 'blueprint.yaml'),
+                      'w') as f:
+                f.write(name)
+        return blueprints_dir
+
+    def _uploaded_ids(self):
+        return [call[0][0].split('/')[-1] for call in
+                self.client._client.put.call_args_list]
+
+    def test_upload_many(self):
+        blueprints_dir = self._create_blueprints_dir('bp1', 'bp2')
+        self.client._client.put = MagicMock(return_value={'id': 'bp'})
+        self.client.blueprints.get = MagicMock()
+        cli_runner.run_cli('cfy blueprints upload-many -l {0}'
+                           .format(blueprints_dir))
+        self.assertEqual(['bp1', 'bp2'], sorted(self._uploaded_ids()))
+
+        # unchanged blueprints aren't uploaded again
+        with open(os.path.join(blueprints_dir, 'bp2', 'blueprint.yaml'),
+                  'w') as f:
+            f.write('changed')
+        self.client._client.put.reset_mock()
+        cli_runner.run_cli('cfy blueprints upload-many -l {0}'
+                           .format(blueprints_dir))
+        self.assertEqual(['bp2'], self._uploaded_ids())
+
+    def test_upload_many_from_manifest(self):
+        blueprints_dir = self._create_blueprints_dir('bp1', 'bp2')
+        manifest_path = os.path.join(blueprints_dir, 'manifest.yaml')
+        with open(manifest_path, 'w') as f:
+            f.write(yaml.safe_dump({'first': 'bp1/blueprint.yaml',
+                                    'second': 'bp2/blueprint.yaml'}))
+        self.client._client.put = MagicMock(return_value={'id': 'bp'})
+        cli_runner.run_cli('cfy blueprints upload-many -l {0}'
+                           .format(manifest_path))
+        self.assertEqual(['first', 'second'], sorted(self._uploaded_ids()))
+
+    def test_upload_many_deleted_blueprint_is_uploaded_again(self):
+        blueprints_dir = self._create_blueprints_dir('bp1')
+        self.client._client.put = MagicMock(return_value={'id': 'bp'})
+        cli_runner.run_cli('cfy blueprints upload-many -l {0}'
+                           .format(blueprints_dir))
+        self.client.blueprints.get = MagicMock(
+            side_effect=CloudifyClientError('not found', status_code=404))
+        cli_runner.run_cli('cfy blueprints upload-many -l {0}'
+                           .format(blueprints_dir))
+        self.assertEqual(['bp1', 'bp1'], self._uploaded_ids())
+
+    def test_upload_many_with_a_failed_upload(self):
+        blueprints_dir = self._create_blueprints_dir('bp1', 'bp2')
+        self.client._client.put = MagicMock(
+            side_effect=[{'id': 'bp1'}, CloudifyClientError('conflict')])
+        self._assert_ex('cfy blueprints upload-many -l {0} --concurrency 1'
+                        .format(blueprints_dir),
+                        '1 of 2 blueprints failed to upload')
+
+    def test_uploaded_blueprint_is_found(self):
+        blueprint_path = '{0}/helloworld/blueprint.yaml'.format(
+            BLUEPRINTS_DIR)
+        self.client._client.put = MagicMock(return_value={'id': 'bp'})
+        self.client.blueprints.get = MagicMock()
+        self.assertIsNone(blueprints.find_uploaded(blueprint_path))
+        cli_runner.run_cli('cfy blueprints upload -p {0} -b my_blueprint_id'
+                           .format(blueprint_path))
+        self.assertEqual('my_blueprint_id',
+                         blueprints.find_uploaded(blueprint_path))
+
     def test_blueprint_inputs(self):
 
         BLUEPRINT_ID = 'a-blueprint-id'
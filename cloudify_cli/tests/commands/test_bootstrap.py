@@ -35,6 +35,7 @@ class BootstrapTest(CliCommandTest):
         blueprint_path = '{0}/local/{1}.yaml'\
                          .format(BLUEPRINTS_DIR,
                                  'blueprint_with_plugins')
+        kwargs = {'blueprint_path': blueprint_path, 'resolver': mock.ANY}
         with mock.patch('cloudify_cli.bootstrap.bootstrap.'
                         'validate_manager_deployment_size'):
             self.assert_method_called(
@@ -42,7 +43,7 @@ class BootstrapTest(CliCommandTest):
                             .format(blueprint_path),
                 module=common,
                 function_name='install_blueprint_plugins',
-                kwargs={'blueprint_path': blueprint_path})
+                kwargs=kwargs)
 
     def test_bootstrap_no_validations_install_plugins(self):
 
@@ -56,7 +57,8 @@ class BootstrapTest(CliCommandTest):
             .format(blueprint_path),
             module=common,
             function_name='install_blueprint_plugins',
-            kwargs={'blueprint_path': blueprint_path}
+            kwargs={'blueprint_path': blueprint_path,
+                    'resolver': mock.ANY}
         )
 
     def test_bootstrap_no_validations_add_ignore_bootstrap_validations(self):
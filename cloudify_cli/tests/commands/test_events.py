@@ -17,8 +17,12 @@
 Tests all commands that start with 'cfy events'
 """
 
+import os
 import json
+import gzip
 import time
+import shutil
+import tempfile
 from StringIO import StringIO
 
 from mock import patch
@@ -26,7 +30,9 @@ from mock import patch
 from cloudify_rest_client.executions import Execution
 
 from cloudify_cli.tests import cli_runner
+from cloudify_cli.commands import events as events_command
 from cloudify_cli.tests.commands.test_cli_command import CliCommandTest
+from cloudify_cli.tests.commands.test_cli_command import TEST_WORK_DIR
 from cloudify_cli.tests.resources.mocks.mock_list_response \
     import MockListResponse
 
@@ -149,3 +155,197 @@ class EventsTest(CliCommandTest):
             cli_runner.run_cli(
                 'cfy events list --execution-id execution-id {}'.format(flag))
         return stdout.getvalue()
+
+    def test_events_deployment(self):
+        executions_events = {
+            'install': [{'@timestamp': '2016-01-01T00:00:00.000Z',
+                         'event_name': 'install_event'},
+                        {'@timestamp': '2016-01-01T00:00:02.000Z',
+                         'event_name': 'install_end_event'}],
+            'scale': [{'@timestamp': '2016-01-01T00:00:01.000Z',
+                       'event_name': 'scale_event'}]
+        }
+        self.client.executions.list = lambda **kwargs: [
+            Execution({'id': execution_id})
+            for execution_id in executions_events]
+        self.client.executions.get = lambda execution_id: Execution(
+            {'id': execution_id, 'status': Execution.TERMINATED})
+        self.client.events.list = \
+            lambda execution_id, **kwargs: MockListResponse(
+                executions_events[execution_id][kwargs['_offset']:],
+                len(executions_events[execution_id]))
+        stdout = StringIO()
+        with patch('sys.stdout', stdout):
+            cli_runner.run_cli(
+                'cfy events list --deployment-id deployment-id --json')
+        self.assertEqual(
+            ['install_event', 'scale_event', 'install_end_event'],
+            [json.loads(line)['event_name']
+             for line in stdout.getvalue().splitlines()
+             if line.startswith('{')])
+
+    def test_events_filter(self):
+        events = [
+            {'event_name': 'create_failed', 'event_type': 'task_failed',
+             'context': {'operation': 'cloudify.interfaces.lifecycle.create'}},
+            {'event_name': 'start_failed', 'event_type': 'task_failed',
+             'context': {'operation': 'cloudify.interfaces.lifecycle.start'}},
+            {'event_name': 'create_succeeded', 'event_type': 'task_succeeded',
+             'context': {'operation': 'cloudify.interfaces.lifecycle.create'}}
+        ]
+        list_kwargs = []
+
+        def mock_events_list(**kwargs):
+            # the filters are ignored, as if the manager didn't support them
+            list_kwargs.append(kwargs)
+            return MockListResponse(events[kwargs['_offset']:], len(events))
+
+        self.client.executions.get = self._mock_executions_get
+        self.client.events.list = mock_events_list
+        stdout = StringIO()
+        with patch('sys.stdout', stdout):
+            cli_runner.run_cli('cfy events list --execution-id execution-id '
+                               '--event-type task_failed --operation create '
+                               '--json')
+        output = stdout.getvalue()
+        self.assertIn('create_failed', output)
+        self.assertNotIn('start_failed', output)
+        self.assertNotIn('create_succeeded', output)
+        self.assertEqual(['task_failed'], list_kwargs[0]['event_type'])
+
+
+class EventsStatsTest(CliCommandTest):
+
+    def setUp(self):
+        super(EventsStatsTest, self).setUp()
+        self._create_cosmo_wd_settings()
+        self.events = [
+            self._task_event(0, 'sending_task', 'create'),
+            self._task_event(1, 'task_started', 'create'),
+            self._task_event(3, 'task_succeeded', 'create'),
+            {'@timestamp': '2016-01-01T00:00:04.000Z',
+             'event_type': 'workflow_succeeded',
+             'context': {}}
+        ]
+        self.client.executions.get = lambda execution_id: Execution(
+            {'id': execution_id, 'status': Execution.TERMINATED})
+        self.client.events.list = lambda **kwargs: MockListResponse(
+            self.events[kwargs['_offset']:], len(self.events))
+
+    def _task_event(self, seconds, event_type, operation):
+        return {'@timestamp': '2016-01-01T00:00:0{0}.000Z'.format(seconds),
+                'event_type': event_type,
+                'context': {'task_id': 'task_id',
+                            'node_id': 'vm_1',
+                            'node_name': 'vm',
+                            'operation': operation}}
+
+    def test_stats(self):
+        stdout = StringIO()
+        with patch('sys.stdout', stdout):
+            cli_runner.run_cli('cfy events stats -e execution_id')
+        output = stdout.getvalue()
+        self.assertIn('Tasks by node instance:', output)
+        self.assertIn('Critical path:', output)
+        self.assertIn('wall time: 4.0s', output)
+
+    def test_stats_json(self):
+        stdout = StringIO()
+        with patch('sys.stdout', stdout):
+            cli_runner.run_cli('cfy events stats -e execution_id '
+                               '--group-by node --json')
+        stats = json.loads(stdout.getvalue())
+        self.assertNotIn('operation', stats)
+        [node] = stats['node']
+        self.assertEqual('vm', node['node'])
+        self.assertEqual(2, node['duration'])
+        self.assertEqual(1, node['avg_queue_delay'])
+
+
+class EventsExportTest(CliCommandTest):
+
+    def setUp(self):
+        super(EventsExportTest, self).setUp()
+        self._create_cosmo_wd_settings()
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir)
+        self.events = [{'id': i, 'event_type': 'task_succeeded'}
+                       for i in range(10)]
+        self.events.append({'id': 10, 'event_type': 'workflow_succeeded'})
+        self.requested_offsets = []
+        self.client.executions.get = lambda execution_id: Execution(
+            {'id': execution_id, 'status': Execution.TERMINATED})
+        self.client.events.list = self._mock_events_list
+
+    def _mock_events_list(self, **kwargs):
+        from_event = kwargs.get('_offset', 0)
+        batch_size = kwargs.get('_size', 100)
+        self.requested_offsets.append(from_event)
+        return MockListResponse(
+            self.events[from_event:from_event + batch_size], len(self.events))
+
+    def _read_exported(self, execution_id):
+        path = os.path.join(self.output_dir, execution_id +
+                            events_command.EXPORT_FILE_SUFFIX)
+        with gzip.open(path) as f:
+            return [json.loads(line) for line in f]
+
+    def _read_checkpoint(self, execution_id):
+        path = os.path.join(
+            self.output_dir,
+            execution_id + events_command.EXPORT_FILE_SUFFIX +
+            events_command.EXPORT_CHECKPOINT_SUFFIX)
+        with open(path) as f:
+            return json.load(f)
+
+    def test_export(self):
+        cli_runner.run_cli('cfy events export -e exec1 -o {0}'
+                           .format(self.output_dir))
+        self.assertEqual(self.events, self._read_exported('exec1'))
+        checkpoint = self._read_checkpoint('exec1')
+        self.assertEqual(len(self.events), checkpoint['offset'])
+        self.assertTrue(checkpoint['completed'])
+
+    def test_export_to_cwd_by_default(self):
+        # the CLI's cwd is the test's work dir
+        self.output_dir = TEST_WORK_DIR
+        cli_runner.run_cli('cfy events export -e exec1')
+        self.assertEqual(self.events, self._read_exported('exec1'))
+
+    @patch('cloudify_cli.commands.events.EXPORT_BATCH_SIZE', 4)
+    def test_export_resumes_from_checkpoint(self):
+        # export the first batch only, then add some bytes which were
+        # written after the checkpoint
+        all_events = self.events
+        self.events = all_events[:4]
+        cli_runner.run_cli('cfy events export -e exec1 -o {0}'
+                           .format(self.output_dir))
+        self.assertFalse(self._read_checkpoint('exec1')['completed'])
+        events_path = os.path.join(self.output_dir,
+                                   'exec1' + events_command.EXPORT_FILE_SUFFIX)
+        with gzip.open(events_path, 'ab') as f:
+            f.write('{"id": "partial"}\n')
+
+        self.events = all_events
+        self.requested_offsets = []
+        cli_runner.run_cli('cfy events export -e exec1 -o {0}'
+                           .format(self.output_dir))
+        self.assertEqual(4, self.requested_offsets[0])
+        self.assertEqual(all_events, self._read_exported('exec1'))
+        self.assertTrue(self._read_checkpoint('exec1')['completed'])
+
+    def test_export_completed_execution_is_skipped(self):
+        cli_runner.run_cli('cfy events export -e exec1 -o {0}'
+                           .format(self.output_dir))
+        self.requested_offsets = []
+        cli_runner.run_cli('cfy events export -e exec1 -o {0}'
+                           .format(self.output_dir))
+        self.assertEqual([], self.requested_offsets)
+
+    def test_export_deployment(self):
+        self.client.executions.list = lambda **kwargs: [
+            Execution({'id': 'exec1'}), Execution({'id': 'exec2'})]
+        cli_runner.run_cli('cfy events export -d dep1 -o {0} '
+                           '--concurrency 2'.format(self.output_dir))
+        self.assertEqual(self.events, self._read_exported('exec1'))
+        self.assertEqual(self.events, self._read_exported('exec2'))
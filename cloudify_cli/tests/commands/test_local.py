@@ -26,7 +26,7 @@ import shutil
 
 import yaml
 import nose
-from mock import patch
+from mock import ANY, patch
 
 from dsl_parser import exceptions as parser_exceptions
 
@@ -42,6 +42,9 @@ from dsl_parser.constants import HOST_TYPE
 
 from cloudify_cli import utils
 from cloudify_cli import common
+from cloudify_cli import import_cache
+from cloudify_cli import simulation
+from cloudify_cli import local_storage
 from cloudify_cli.commands import local
 from cloudify_cli.tests import cli_runner
 from cloudify_cli.tests.commands.test_cli_command import CliCommandTest
@@ -50,7 +53,6 @@ from cloudify_cli.tests.commands.test_cli_command import \
      TEST_WORK_DIR)
 from cloudify_cli.constants import DEFAULT_BLUEPRINT_PATH
 from cloudify_cli.constants import DEFAULT_PARAMETERS
-from cloudify_cli.constants import DEFAULT_TASK_THREAD_POOL_SIZE
 from cloudify_cli.constants import DEFAULT_INSTALL_WORKFLOW
 from cloudify_cli.constants import DEFAULT_UNINSTALL_WORKFLOW
 from cloudify_cli.tests.commands import utils as test_utils
@@ -126,6 +128,285 @@ class LocalTest(CliCommandTest):
         output = cli_runner.run_cli('cfy local outputs')
         self.assertIn('"param": "default_param"', output)
 
+    def test_local_init_unchanged_keeps_environment(self):
+        self._local_init()
+        self._local_execute()
+        with patch('cloudify_cli.common.initialize_blueprint') as init_mock:
+            self._local_init()
+        self.assertFalse(init_mock.called)
+        # the environment's runtime state is kept
+        output = cli_runner.run_cli('cfy local outputs')
+        self.assertIn('"param": "default_param"', output)
+
+    def test_local_init_unchanged_offline_install_plugins(self):
+        self._local_init()
+        blueprint_path = '{0}/local/blueprint.yaml'.format(BLUEPRINTS_DIR)
+        with patch.object(common, 'install_blueprint_plugins') as mock:
+            cli_runner.run_cli('cfy local init --offline --install-plugins '
+                               '-p {0}'.format(blueprint_path))
+        resolver = mock.call_args[1]['resolver']
+        self.assertIsInstance(resolver, import_cache.CachingImportResolver)
+        self.assertTrue(resolver._offline)
+
+    def test_local_init_changed_inputs(self):
+        self._local_init()
+        self._local_execute()
+        with patch('cloudify_cli.plan_cache.parse_from_path') as parse_mock:
+            self._local_init(inputs=['input1=new_input1'])
+        self.assertFalse(parse_mock.called)
+        output = cli_runner.run_cli('cfy local outputs')
+        self.assertIn('"input1": "new_input1"', output)
+        self.assertIn('"param": null', output)
+
+    def test_local_sqlite_storage(self):
+        self._local_init(storage='sqlite')
+        self._local_execute()
+        output = cli_runner.run_cli('cfy local outputs')
+        self.assertIn('"param": "default_param"', output)
+        output = cli_runner.run_cli('cfy local instances --node-id node')
+        self.assertIn('"node_id": "node"', output)
+
+    def test_local_install_memory_storage(self):
+        blueprint_path = '{0}/local/blueprint.yaml'.format(BLUEPRINTS_DIR)
+        cli_runner.run_cli('cfy local install --storage memory -p {0} '
+                           '-w run_test_op_on_nodes'.format(blueprint_path))
+        self.assertFalse(os.path.exists(local._storage_dir()))
+        self._assert_ex('cfy local outputs',
+                        'has not been initialized with a blueprint')
+
+    def test_local_run(self):
+        blueprint_path = '{0}/local/blueprint.yaml'.format(BLUEPRINTS_DIR)
+        output = cli_runner.run_cli('cfy local run -p {0} '
+                                    '-w run_test_op_on_nodes'
+                                    .format(blueprint_path))
+        self.assertIn('"param": "default_param"', output)
+        self.assertFalse(os.path.exists(local._storage_dir()))
+
+    def test_local_run_keeps_initialized_environment(self):
+        self._local_init()
+        blueprint_path = '{0}/local/blueprint.yaml'.format(BLUEPRINTS_DIR)
+        cli_runner.run_cli('cfy local run -p {0} -w run_test_op_on_nodes'
+                           .format(blueprint_path))
+        output = cli_runner.run_cli('cfy local outputs')
+        self.assertIn('"param": null', output)
+
+    def test_local_run_persist(self):
+        blueprint_path = '{0}/local/blueprint.yaml'.format(BLUEPRINTS_DIR)
+        cli_runner.run_cli('cfy local run --persist -p {0} '
+                           '-w run_test_op_on_nodes'.format(blueprint_path))
+        output = cli_runner.run_cli('cfy local outputs')
+        self.assertIn('"param": "default_param"', output)
+
+    def test_local_init_watch(self):
+        blueprint_dir = os.path.join(TEST_WORK_DIR, 'watched')
+        os.mkdir(blueprint_dir)
+        blueprint_path = os.path.join(blueprint_dir, 'blueprint.yaml')
+        with open('{0}/local/blueprint.yaml'.format(BLUEPRINTS_DIR)) as f:
+            blueprint = yaml.safe_load(f)
+        with open(blueprint_path, 'w') as f:
+            yaml.safe_dump(blueprint, f)
+        cli_runner.run_cli('cfy local init -p {0}'.format(blueprint_path))
+        self._local_execute()
+
+        def write_invalid_blueprint():
+            with open(blueprint_path, 'a') as f:
+                f.write('node_templates: [\n')
+
+        def add_node():
+            blueprint['node_templates']['other_node'] = {'type': 'test_type'}
+            blueprint['outputs']['other_node'] = {
+                'value': {'get_attribute': ['other_node', 'param']}}
+            with open(blueprint_path, 'w') as f:
+                yaml.safe_dump(blueprint, f)
+
+        def interrupt():
+            raise KeyboardInterrupt()
+
+        changes = [write_invalid_blueprint, add_node, interrupt]
+        with patch('time.sleep', side_effect=lambda _: changes.pop(0)()):
+            output = cli_runner.run_cli(
+                'cfy local init --watch -p {0}'.format(blueprint_path))
+        self.assertIn('Invalid blueprint', output)
+        self.assertIn('Kept the runtime state of 1 of 2 nodes: node', output)
+        output = cli_runner.run_cli('cfy local outputs')
+        self.assertIn('"param": "default_param"', output)
+        self.assertIn('"other_node": null', output)
+
+    def test_local_init_watch_imports(self):
+        blueprint_dir = os.path.join(TEST_WORK_DIR, 'watched')
+        os.mkdir(blueprint_dir)
+        blueprint_path = os.path.join(blueprint_dir, 'blueprint.yaml')
+        types_path = os.path.join(blueprint_dir, 'types.yaml')
+        with open('{0}/local/blueprint.yaml'.format(BLUEPRINTS_DIR)) as f:
+            blueprint = yaml.safe_load(f)
+        types = {'node_types': blueprint.pop('node_types')}
+        blueprint['imports'] = ['types.yaml']
+        with open(blueprint_path, 'w') as f:
+            yaml.safe_dump(blueprint, f)
+        with open(types_path, 'w') as f:
+            yaml.safe_dump(types, f)
+        cli_runner.run_cli('cfy local init -p {0}'.format(blueprint_path))
+        self._local_execute()
+
+        def write_invalid_types():
+            with open(types_path, 'a') as f:
+                f.write('node_types: [\n')
+
+        def change_types():
+            types['node_types']['test_type'] = {
+                'properties': {'prop': {'default': 'value'}}}
+            with open(types_path, 'w') as f:
+                yaml.safe_dump(types, f)
+
+        def interrupt():
+            raise KeyboardInterrupt()
+
+        changes = [write_invalid_types, change_types, interrupt]
+        with patch('time.sleep', side_effect=lambda _: changes.pop(0)()):
+            output = cli_runner.run_cli(
+                'cfy local init --watch -p {0}'.format(blueprint_path))
+        self.assertIn('Watching 2 blueprint files', output)
+        self.assertIn('Invalid blueprint', output)
+        # the node's definition changed, so its runtime state is gone
+        self.assertIn('Kept the runtime state of 0 of 1 nodes', output)
+        self.assertIn('Initialized again', output)
+        output = cli_runner.run_cli('cfy local outputs')
+        self.assertIn('"param": null', output)
+
+    def test_local_init_watch_failed_swap(self):
+        blueprint_dir = os.path.join(TEST_WORK_DIR, 'watched')
+        os.mkdir(blueprint_dir)
+        blueprint_path = os.path.join(blueprint_dir, 'blueprint.yaml')
+        with open('{0}/local/blueprint.yaml'.format(BLUEPRINTS_DIR)) as f:
+            blueprint = yaml.safe_load(f)
+        with open(blueprint_path, 'w') as f:
+            yaml.safe_dump(blueprint, f)
+        cli_runner.run_cli('cfy local init -p {0}'.format(blueprint_path))
+        self._local_execute()
+
+        def add_node():
+            blueprint['node_templates']['other_node'] = {'type': 'test_type'}
+            with open(blueprint_path, 'w') as f:
+                yaml.safe_dump(blueprint, f)
+
+        def interrupt():
+            raise KeyboardInterrupt()
+
+        rename = os.rename
+
+        def failing_rename(src, dst):
+            if '.initializing' in src:
+                raise OSError('rename failed')
+            rename(src, dst)
+
+        changes = [add_node, interrupt]
+        with patch('time.sleep', side_effect=lambda _: changes.pop(0)()), \
+                patch('os.rename', side_effect=failing_rename):
+            output = cli_runner.run_cli(
+                'cfy local init --watch -p {0}'.format(blueprint_path))
+        self.assertIn('rename failed', output)
+        # the previous environment is left in place
+        output = cli_runner.run_cli('cfy local outputs')
+        self.assertIn('"param": "default_param"', output)
+
+    def test_local_init_watch_memory_storage(self):
+        blueprint_path = '{0}/local/blueprint.yaml'.format(BLUEPRINTS_DIR)
+        self._assert_ex('cfy local init --watch --storage memory -p {0}'
+                        .format(blueprint_path),
+                        'An environment kept in memory cannot be watched')
+
+    def test_local_init_migrates_storage(self):
+        self._local_init()
+        self._local_execute()
+        with patch('cloudify_cli.common.initialize_blueprint') as init_mock:
+            self._local_init(storage='sqlite')
+        self.assertFalse(init_mock.called)
+        self.assertEqual('sqlite', local_storage.storage_type(
+            local._storage_dir(), 'local'))
+        output = cli_runner.run_cli('cfy local outputs')
+        self.assertIn('"param": "default_param"', output)
+
+    def test_local_migrate_storage_without_environment(self):
+        self._init()
+        self._assert_ex('cfy local migrate-storage',
+                        'has no local environment kept in file storage')
+
+    def test_local_execute_auto_task_thread_pool_size(self):
+        self._local_init()
+        cli_runner.run_cli('cfy local execute -w run_test_op_on_nodes '
+                           '--task-thread-pool-size auto')
+        output = cli_runner.run_cli('cfy local outputs')
+        self.assertIn('"param": "default_param"', output)
+
+    def test_local_execute_timing_report(self):
+        self._local_init()
+        report_path = os.path.join(TEST_WORK_DIR, 'timing.json')
+        output = cli_runner.run_cli(
+            'cfy local execute -w run_test_op_on_nodes '
+            '--timing-report {0}'.format(report_path))
+        self.assertIn('Slowest tasks:', output)
+        self.assertIn('Critical path:', output)
+        with open(report_path) as f:
+            report = json.load(f)
+        self.assertEqual(['test.op'],
+                         [task['operation'] for task in report['tasks']])
+        self.assertEqual('task_succeeded', report['tasks'][0]['status'])
+        self.assertEqual(0, report['retries'])
+        self.assertLessEqual(report['task_time'], report['wall_time'])
+
+    def test_local_execute_simulate(self):
+        self._local_init()
+        with patch('cloudify_cli.tests.commands.test_local.mock_op') as op:
+            output = cli_runner.run_cli(
+                'cfy local execute -w run_test_op_on_nodes --simulate '
+                '--simulate-duration 0')
+        self.assertFalse(op.called)
+        self.assertIn('Simulated 1 operations', output)
+        # the environment is left as is
+        output = cli_runner.run_cli('cfy local outputs')
+        self.assertIn('"param": null', output)
+
+    def test_simulation_durations(self):
+        report_path = os.path.join(TEST_WORK_DIR, 'timing.json')
+        with open(report_path, 'w') as f:
+            json.dump({'tasks': [
+                {'operation': 'create', 'status': 'task_succeeded',
+                 'duration': 2.5},
+                {'operation': 'create', 'status': 'task_rescheduled',
+                 'duration': 7}]}, f)
+        durations = simulation.Durations(0.5, report_path)
+        self.assertEqual(2.5, durations('create'))
+        self.assertEqual(0.5, durations('start'))
+
+    def test_auto_task_thread_pool_size(self):
+        self._init()
+
+        def instance(instance_id, *target_ids):
+            return {'id': instance_id,
+                    'relationships': [{'target_id': target_id}
+                                      for target_id in target_ids]}
+        # a host with 3 applications, one of which has 2 dependants
+        plan = {'node_instances': [instance('host'),
+                                   instance('app_1', 'host'),
+                                   instance('app_2', 'host'),
+                                   instance('app_3', 'host', 'app_1'),
+                                   instance('db', 'app_1'),
+                                   instance('web', 'app_1', 'app_2'),
+                                   instance('lb', 'web')]}
+        self.assertEqual(3, common.task_thread_pool_size(plan, 'auto'))
+        self.assertEqual(5, common.task_thread_pool_size(plan, 5))
+        self.assertEqual(1, common.task_thread_pool_size(plan))
+        with patch('multiprocessing.cpu_count', return_value=1), \
+                patch('cloudify_cli.constants.'
+                      'AUTO_TASK_THREAD_POOL_SIZE_PER_CPU', 2):
+            self.assertEqual(2, common.task_thread_pool_size(plan, 'auto'))
+
+    def test_invalid_task_thread_pool_size(self):
+        self._local_init()
+        self.assertRaises(SystemExit, cli_runner.run_cli,
+                          'cfy local execute -w run_test_op_on_nodes '
+                          '--task-thread-pool-size 0')
+
     def test_local_provider_context(self):
         self._init()
         with open(utils.get_configuration_path()) as f:
@@ -167,9 +448,23 @@ class LocalTest(CliCommandTest):
                         .format(blueprint_path),
             module=common,
             function_name='install_blueprint_plugins',
-            kwargs={'blueprint_path': blueprint_path}
+            kwargs={'blueprint_path': blueprint_path, 'resolver': ANY}
         )
 
+    def test_local_init_offline_install_plugins(self):
+        blueprint_path = '{0}/local/{1}.yaml' \
+            .format(BLUEPRINTS_DIR,
+                    'blueprint_with_plugins')
+        with patch.object(common, 'install_blueprint_plugins') as mock:
+            # the blueprint's plugins aren't actually installed
+            self.assertRaises(ImportError,
+                              cli_runner.run_cli,
+                              'cfy local init --offline --install-plugins '
+                              '-p {0}'.format(blueprint_path))
+        resolver = mock.call_args[1]['resolver']
+        self.assertIsInstance(resolver, import_cache.CachingImportResolver)
+        self.assertTrue(resolver._offline)
+
     def test_empty_requirements(self):
         blueprint = 'blueprint_without_plugins'
         blueprint_path = '{0}/local/{1}.yaml'.format(BLUEPRINTS_DIR,
@@ -227,6 +522,13 @@ class LocalTest(CliCommandTest):
         output = cli_runner.run_cli('cfy local instances --node-id node')
         self.assertIn('"node_id": "node"', output)
 
+    def test_local_instances_fields(self):
+        self._local_init()
+        self._local_execute()
+        output = cli_runner.run_cli('cfy local instances --fields param')
+        self.assertIn('"param": "default_param"', output)
+        self.assertNotIn('"custom_param"', output)
+
     def test_local_instances_with_non_existing_node_id(self):
         self._local_init()
         self._local_execute()
@@ -332,6 +634,35 @@ class LocalTest(CliCommandTest):
             self.assertIn('pip install -r /tmp/requirements_',
                           e.message)
 
+    def test_install_plugins_already_installed(self):
+        import mock
+        # initialized, so there's a wheel cache
+        self._init()
+        blueprint_dir = os.path.join(TEST_WORK_DIR, 'installed_plugins')
+        os.mkdir(blueprint_dir)
+        blueprint_path = os.path.join(blueprint_dir, 'blueprint.yaml')
+        with open(blueprint_path, 'w') as f:
+            yaml.safe_dump({
+                'tosca_definitions_version': 'cloudify_dsl_1_2',
+                'plugins': {'installed_plugin': {
+                    'executor': 'central_deployment_agent',
+                    'source': 'http://host/mock.zip',
+                    'package_name': 'mock',
+                    'package_version': mock.__version__}},
+                'node_types': {'test_type': {}},
+                'node_templates': {'node': {
+                    'type': 'test_type',
+                    'interfaces': {'test': {
+                        'op': 'installed_plugin.mock.Mock'}}}}}, f)
+        # neither built nor installed, so no virtualenv is needed either
+        with patch('cloudify_cli.utils.is_virtual_env', return_value=False), \
+                patch('cloudify_cli.wheel_cache.WheelCache.build') as build:
+            output = cli_runner.run_cli('cfy local install-plugins -p {0}'
+                                        .format(blueprint_path))
+        self.assertFalse(build.called)
+        self.assertIn('1 plugins are already installed: '
+                      'http://host/mock.zip', output)
+
     def test_install_plugins_missing_windows_agent_installer(self):
         blueprint_path = '{0}/local/windows_installers_blueprint.yaml'\
             .format(BLUEPRINTS_DIR)
@@ -347,7 +678,8 @@ class LocalTest(CliCommandTest):
         local_init_mock.assert_called_with(
             blueprint_path=DEFAULT_BLUEPRINT_PATH,
             inputs=None,
-            install_plugins=False
+            install_plugins=False,
+            storage=None
         )
 
     @patch('cloudify_cli.commands.local.execute')
@@ -363,7 +695,8 @@ class LocalTest(CliCommandTest):
         local_init_mock.assert_called_with(
             blueprint_path='blueprint_path.yaml',
             inputs=["key=value"],
-            install_plugins=True
+            install_plugins=True,
+            storage=None
         )
 
     @patch('cloudify_cli.commands.local.init')
@@ -380,7 +713,8 @@ class LocalTest(CliCommandTest):
             allow_custom_parameters=False,
             task_retries=0,
             task_retry_interval=1,
-            task_thread_pool_size=DEFAULT_TASK_THREAD_POOL_SIZE
+            task_thread_pool_size=None,
+            timing_report=None
         )
 
     @patch('cloudify_cli.commands.local.init')
@@ -403,7 +737,8 @@ class LocalTest(CliCommandTest):
                                               allow_custom_parameters=True,
                                               task_retries=14,
                                               task_retry_interval=7,
-                                              task_thread_pool_size=87
+                                              task_thread_pool_size=87,
+                                              timing_report=None
                                               )
 
     @patch('cloudify_cli.commands.local.execute')
@@ -420,7 +755,8 @@ class LocalTest(CliCommandTest):
             allow_custom_parameters=False,
             task_retries=0,
             task_retry_interval=1,
-            task_thread_pool_size=DEFAULT_TASK_THREAD_POOL_SIZE)
+            task_thread_pool_size=None,
+            timing_report=None)
 
     @patch('cloudify_cli.commands.local.execute')
     def test_uninstall_command_execute_custom_arguments(self,
@@ -442,7 +778,8 @@ class LocalTest(CliCommandTest):
             allow_custom_parameters=True,
             task_retries=14,
             task_retry_interval=7,
-            task_thread_pool_size=87)
+            task_thread_pool_size=87,
+            timing_report=None)
 
     def test_uninstall_command_removes_local_storage_dir(self):
 
@@ -541,13 +878,16 @@ class LocalTest(CliCommandTest):
     def _local_init(self,
                     inputs=None,
                     blueprint='blueprint',
-                    install_plugins=False):
+                    install_plugins=False,
+                    storage=None):
 
         blueprint_path = '{0}/local/{1}.yaml'.format(BLUEPRINTS_DIR,
                                                      blueprint)
         flags = '--install-plugins' if install_plugins else ''
         command = 'cfy local init {0} -p {1}'.format(flags,
                                                      blueprint_path)
+        if storage:
+            command += ' --storage {0}'.format(storage)
         inputs = inputs or []
         for inputs_instance in inputs:
             command += ' -i {0}'.format(inputs_instance)
@@ -16,13 +16,17 @@
 """
 Tests all commands that start with 'cfy plugins'
 """
-import tarfile
 import os
+import json
+import tarfile
 import tempfile
 import shutil
+from io import BytesIO
 
-from mock import MagicMock
+from mock import MagicMock, patch
 
+from cloudify_cli.commands import plugins
+from cloudify_cli.exceptions import CloudifyCliError
 from cloudify_cli.tests import cli_runner
 from cloudify_cli.tests.commands.test_cli_command import CliCommandTest
 from cloudify_rest_client.plugins import Plugin
@@ -72,9 +76,115 @@ class PluginsTest(CliCommandTest):
         finally:
             shutil.rmtree(plugin_dest, ignore_errors=True)
 
-    def test_plugins_download(self):
-        self.client.plugins.download = MagicMock(return_value='some_file')
+    @patch('cloudify_cli.downloads.download')
+    def test_plugins_download(self, download_mock):
         cli_runner.run_cli('cfy plugins download -p a-plugin-id')
+        self.assertEqual('/plugins/a-plugin-id/archive',
+                         download_mock.call_args[0][1])
+
+    @patch('cloudify_cli.downloads.download')
+    def test_plugins_download_sha256(self, download_mock):
+        cli_runner.run_cli('cfy plugins download -p a-plugin-id --sha256 abc')
+        self.assertEqual('abc',
+                         download_mock.call_args[1]['expected_sha256'])
+
+    def _make_plugin(self, member_names, package_json='{"package_name": "p"}'):
+        plugin_dest = os.path.join(self.plugin_dir, 'plugin.wgn')
+        with tarfile.open(plugin_dest, 'w:gz') as tar:
+            for name in member_names:
+                content = package_json if name.endswith('package.json') \
+                    else name
+                info = tarfile.TarInfo(name)
+                info.size = len(content)
+                tar.addfile(info, BytesIO(content))
+        return open(plugin_dest)
+
+    def test_plugins_validate_stops_at_package_json(self):
+        self.plugin_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.plugin_dir)
+        plugin = self._make_plugin(
+            ['p', 'p/package.json'] +
+            ['p/wheels/{0}.whl'.format(i) for i in range(100)])
+        with patch('cloudify_cli.commands.plugins.tarfile.TarFile.next',
+                   side_effect=tarfile.TarFile.next, autospec=True) as next_:
+            self.assertEqual({'package_name': 'p'}, plugins.validate(plugin))
+        # only the members up to package.json are read
+        self.assertLess(next_.call_count, 10)
+
+    def test_plugins_validate_reports_wheels(self):
+        self.plugin_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.plugin_dir)
+        plugin = self._make_plugin(
+            ['p', 'p/package.json', 'p/wheels/a.whl', 'p/wheels/b.whl'],
+            json.dumps({'package_name': 'p', 'package_version': '1.0',
+                        'wheels': ['a.whl', 'b.whl']}))
+        with patch('cloudify_cli.commands.plugins.get_logger') as logger:
+            plugins.validate(plugin)
+        message = logger.return_value.info.call_args[0][0]
+        self.assertIn('(p 1.0, ', message)
+        self.assertIn(', 2 wheels)', message)
+
+    def test_plugins_validate_missing_package_json(self):
+        self.plugin_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.plugin_dir)
+        plugin = self._make_plugin(['p', 'p/wheels/a.whl', 'q/package.json'])
+        self.assertRaisesRegexp(CloudifyCliError, 'package.json was not found',
+                                plugins.validate, plugin)
+
+    def test_plugins_validate_bad_package_json(self):
+        self.plugin_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.plugin_dir)
+        plugin = self._make_plugin(['p', 'p/package.json'], '{')
+        self.assertRaisesRegexp(CloudifyCliError, 'unable to read',
+                                plugins.validate, plugin)
+
+    def _make_wagon(self, name, version, distribution='centos'):
+        package = {'package_name': name,
+                   'package_version': version,
+                   'build_server_os_properties': {
+                       'distribution': distribution}}
+        temp_folder = os.path.join(tempfile.mkdtemp(), name)
+        self.addCleanup(shutil.rmtree, os.path.dirname(temp_folder))
+        os.mkdir(temp_folder)
+        with open(os.path.join(temp_folder, 'package.json'), 'w') as f:
+            f.write(json.dumps(package))
+        _make_tarfile(os.path.join(self.plugin_dir, '{0}-{1}.wgn'
+                                   .format(name, version)),
+                      temp_folder, 'w:gz')
+
+    def test_plugins_upload_many(self):
+        self.plugin_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.plugin_dir)
+        self._make_wagon('a', '1.0')
+        self._make_wagon('b', '1.0')
+        self._make_wagon('c', '1.0')
+        self.client.plugins.list = MagicMock(return_value=[
+            Plugin({'id': 'existing', 'package_name': 'b',
+                    'package_version': '1.0', 'distribution': 'Centos'})])
+        self.client.plugins.upload = MagicMock(
+            side_effect=lambda path: Plugin({'id': os.path.basename(path)}))
+        cli_runner.run_cli('cfy plugins upload-many -p {0} --concurrency 2'
+                           .format(self.plugin_dir))
+        self.assertEqual(1, self.client.plugins.list.call_count)
+        self.assertEqual(
+            ['a-1.0.wgn', 'c-1.0.wgn'],
+            sorted(os.path.basename(call[0][0]) for call
+                   in self.client.plugins.upload.call_args_list))
+
+    def test_plugins_upload_many_failure(self):
+        self.plugin_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.plugin_dir)
+        self._make_wagon('a', '1.0')
+        not_a_plugin = os.path.join(self.plugin_dir, 'b.wgn')
+        with open(not_a_plugin, 'w') as f:
+            f.write('not a plugin')
+        self.client.plugins.list = MagicMock(return_value=[])
+        self.client.plugins.upload = MagicMock(
+            return_value=Plugin({'id': 'a'}))
+        self._assert_ex('cfy plugins upload-many -p {0}'
+                        .format(self.plugin_dir),
+                        '1 of 2 plugins failed to upload')
+        self.assertEqual(1, self.client.plugins.upload.call_count)
 
     def make_sample_plugin(self, plugin_dest):
         temp_folder = tempfile.mkdtemp()
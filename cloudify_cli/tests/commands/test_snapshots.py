@@ -17,7 +17,7 @@
 Tests all commands that start with 'cfy snapshots'
 """
 
-from mock import MagicMock
+from mock import MagicMock, patch
 from cloudify_cli.tests import cli_runner
 from cloudify_cli.tests.commands.test_cli_command import CliCommandTest
 from cloudify_cli.tests.commands.test_cli_command import SNAPSHOTS_DIR
@@ -40,11 +40,21 @@ class SnapshotsTest(CliCommandTest):
         cli_runner.run_cli('cfy snapshots delete -s a-snapshot-id')
 
     def test_snapshots_upload(self):
-        self.client.snapshots.upload = MagicMock(
-            return_value=Snapshot({'id': 'some_id'}))
+        self.client._client.put = MagicMock(return_value={'id': 'some_id'})
         cli_runner.run_cli('cfy snapshots upload -p '
                            '{0}/snapshot.zip '
                            '-s my_snapshot_id'.format(SNAPSHOTS_DIR))
+        self.assertEqual('/snapshots/my_snapshot_id/archive',
+                         self.client._client.put.call_args[0][0])
+
+    @patch('cloudify_cli.uploads.upload_snapshot')
+    def test_snapshots_upload_bandwidth_limit(self, upload_mock):
+        upload_mock.return_value = (Snapshot({'id': 'some_id'}), MagicMock())
+        cli_runner.run_cli('cfy snapshots upload -p '
+                           '{0}/snapshot.zip -s my_snapshot_id '
+                           '--bandwidth-limit 1.5M'.format(SNAPSHOTS_DIR))
+        self.assertEqual(1572864,
+                         upload_mock.call_args[1]['bandwidth_limit'])
 
     def test_snapshots_create(self):
         self.client.snapshots.create = MagicMock(
@@ -57,6 +67,15 @@ class SnapshotsTest(CliCommandTest):
         cli_runner.run_cli('cfy snapshots restore -s a-snapshot-id'
                            '--without-deployments-workers')
 
-    def test_snapshots_download(self):
-        self.client.snapshots.download = MagicMock(return_value='some_file')
+    @patch('cloudify_cli.downloads.download')
+    def test_snapshots_download(self, download_mock):
         cli_runner.run_cli('cfy snapshots download -s a-snapshot-id')
+        self.assertEqual('/snapshots/a-snapshot-id/archive',
+                         download_mock.call_args[0][1])
+
+    @patch('cloudify_cli.downloads.download')
+    def test_snapshots_download_sha256(self, download_mock):
+        cli_runner.run_cli('cfy snapshots download -s a-snapshot-id '
+                           '--sha256 abc')
+        self.assertEqual('abc',
+                         download_mock.call_args[1]['expected_sha256'])
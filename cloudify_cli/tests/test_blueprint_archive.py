@@ -0,0 +1,121 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+from io import BytesIO
+
+from mock import MagicMock
+
+from cloudify_rest_client.client import CloudifyClient
+
+from cloudify_cli import blueprint_archive
+from cloudify_cli import blueprints_ledger
+from cloudify_cli.blueprint_archive import IgnoreRules, ArchiveStats
+
+
+class IgnoreRulesTest(unittest.TestCase):
+
+    def test_name_patterns_match_at_any_depth(self):
+        rules = IgnoreRules(['*.pyc', '# a comment', ''])
+        self.assertTrue(rules.ignored('a.pyc', False))
+        self.assertTrue(rules.ignored('scripts/a.pyc', False))
+        self.assertFalse(rules.ignored('scripts/a.py', False))
+
+    def test_path_patterns_are_anchored(self):
+        rules = IgnoreRules(['/build', 'tests/*.log'])
+        self.assertTrue(rules.ignored('build', True))
+        self.assertFalse(rules.ignored('scripts/build', True))
+        self.assertTrue(rules.ignored('tests/run.log', False))
+        self.assertFalse(rules.ignored('other/tests/run.log', False))
+
+    def test_directory_patterns(self):
+        rules = IgnoreRules(['venv/'])
+        self.assertTrue(rules.ignored('venv', True))
+        self.assertFalse(rules.ignored('venv', False))
+
+
+class BlueprintArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.blueprint_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.blueprint_dir)
+        for path in ['blueprint.yaml', 'scripts/install.sh',
+                     'scripts/install.pyc', '.git/HEAD', 'venv/bin/python']:
+            self._write(path, path)
+        self._write('.cfyignore', '*.pyc\nvenv/\n')
+        self.blueprint_path = os.path.join(self.blueprint_dir,
+                                           'blueprint.yaml')
+
+    def _write(self, path, content):
+        path = os.path.join(self.blueprint_dir, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def _members(self, chunks):
+        with tarfile.open(fileobj=BytesIO(''.join(chunks)),
+                          mode='r:gz') as tar:
+            return sorted(member.name for member in tar.getmembers()
+                          if member.isfile())
+
+    def test_ignored_files_are_left_out(self):
+        stats = ArchiveStats()
+        chunks = list(blueprint_archive.stream_blueprint_archive(
+            self.blueprint_path, stats))
+        self.assertEqual(['blueprint/.cfyignore',
+                          'blueprint/blueprint.yaml',
+                          'blueprint/scripts/install.sh'],
+                         self._members(chunks))
+        self.assertEqual(3, stats.files)
+        self.assertEqual(3, stats.ignored)
+        self.assertEqual(sum(len(chunk) for chunk in chunks), stats.size)
+
+    def test_upload_streams_the_archive(self):
+        uploaded = []
+
+        def put(uri, data, **kwargs):
+            uploaded.extend(data)
+            return {'id': 'bp'}
+
+        client = CloudifyClient()
+        client._client.put = MagicMock(side_effect=put)
+        stats = ArchiveStats()
+        blueprint = blueprint_archive.upload_blueprint(
+            client, self.blueprint_path, 'bp', stats)
+        self.assertEqual('bp', blueprint.id)
+        self.assertEqual(3, len(self._members(uploaded)))
+        self.assertEqual(
+            {'application_file_name': 'blueprint.yaml'},
+            client._client.put.call_args[1]['params'])
+
+    def test_stopped_upload_stops_compressing(self):
+        chunks = blueprint_archive.stream_blueprint_archive(
+            self.blueprint_path)
+        next(chunks)
+        chunks.close()
+
+    def test_ignored_files_do_not_change_digest(self):
+        digest = blueprints_ledger.blueprint_digest(self.blueprint_path)
+        self._write('scripts/install.pyc', 'changed')
+        self.assertEqual(
+            digest, blueprints_ledger.blueprint_digest(self.blueprint_path))
+        self._write('scripts/install.sh', 'changed')
+        self.assertNotEqual(
+            digest, blueprints_ledger.blueprint_digest(self.blueprint_path))
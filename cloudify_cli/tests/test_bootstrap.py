@@ -15,15 +15,19 @@
 ############
 
 import os
+import base64
 import shutil
 import unittest
 import tempfile
 import filecmp
+import hashlib
+from StringIO import StringIO
 
 from mock import patch
 
 from cloudify_cli import constants
 from cloudify_cli import utils
+from cloudify_cli.logger import configure_loggers
 from cloudify_cli.bootstrap import bootstrap
 from cloudify_cli.bootstrap import tasks
 from cloudify_cli.exceptions import CloudifyBootstrapError
@@ -36,6 +40,7 @@ class CliBootstrapUnitTests(unittest.TestCase):
     """Unit tests for functions in bootstrap/bootstrap.py"""
 
     def setUp(self):
+        configure_loggers()
         os.makedirs(TEST_DIR)
         test_workdir = tempfile.mkdtemp(dir=TEST_DIR)
         utils.get_cwd = lambda: test_workdir
@@ -49,9 +54,16 @@ class CliBootstrapUnitTests(unittest.TestCase):
     def tearDown(self):
         shutil.rmtree(TEST_DIR)
 
-    def test_manager_deployment_dump(self, remove_deployment=True):
+    def _legacy_manager_deployment_dump(self):
+        # the base64 encoded archive previous versions kept in the provider
+        # context
+        output = StringIO()
+        base64.encode(bootstrap.tar_manager_deployment(), output)
+        return output.getvalue()
+
+    def test_manager_deployment_legacy_dump(self, remove_deployment=True):
         manager1_original_dir = self._copy_manager1_dir_to_manager_dir()
-        result = bootstrap.dump_manager_deployment()
+        result = self._legacy_manager_deployment_dump()
         if remove_deployment:
             shutil.rmtree(self.manager_dir)
             self.assertTrue(
@@ -84,8 +96,71 @@ class CliBootstrapUnitTests(unittest.TestCase):
             bootstrap.read_manager_deployment_dump_if_needed(''))
         self.assertFalse(os.path.exists(self.manager_dir))
 
-    def test_manager_deployment_dump_read_already_exists(self):
-        self.test_manager_deployment_dump(remove_deployment=False)
+    def test_manager_deployment_legacy_dump_read_already_exists(self):
+        self.test_manager_deployment_legacy_dump(remove_deployment=False)
+
+    def test_manager_deployment_store(self):
+        self._copy_manager1_dir_to_manager_dir()
+        manager_deployment = bootstrap.store_manager_deployment()
+        archive_path = os.path.join(
+            utils.get_cwd(), '.cloudify', 'manager-deployments',
+            '{0}.tar.gz'.format(manager_deployment['sha256']))
+        with open(archive_path, 'rb') as f:
+            archive = f.read()
+        self.assertEqual(hashlib.sha256(archive).hexdigest(),
+                         manager_deployment['sha256'])
+        self.assertEqual(len(archive), manager_deployment['size'])
+        shutil.rmtree(self.manager_dir)
+        self.assertTrue(bootstrap.read_manager_deployment_dump_if_needed(
+            manager_deployment))
+        self.assertIn('file1', os.listdir(self.manager_dir))
+        self.assertNotIn('.git', os.listdir(self.manager_dir))
+
+    def test_manager_deployment_fetched_when_needed(self):
+        self._copy_manager1_dir_to_manager_dir()
+        manager_deployment = bootstrap.store_manager_deployment()
+        # only kept on the manager's host
+        remote_path = os.path.join(TEST_DIR, 'remote.tar.gz')
+        os.rename(bootstrap._archive_path(manager_deployment['sha256']),
+                  remote_path)
+
+        def get(remote_source_path, destination_path):
+            self.assertEqual(manager_deployment['path'], remote_source_path)
+            shutil.copy(remote_path, destination_path)
+
+        with patch.object(utils, 'build_manager_host_string'), \
+                patch.object(utils, 'get_management_port'), \
+                patch.object(bootstrap.fabric, 'get',
+                             side_effect=get) as get_mock:
+            self.assertFalse(bootstrap.read_manager_deployment_dump_if_needed(
+                manager_deployment, key_filename='key.pem'))
+            self.assertFalse(get_mock.called)
+            shutil.rmtree(self.manager_dir)
+            self.assertTrue(bootstrap.read_manager_deployment_dump_if_needed(
+                manager_deployment, key_filename='key.pem'))
+            self.assertEqual(1, get_mock.call_count)
+        self.assertIn('file1', os.listdir(self.manager_dir))
+
+    def test_manager_deployment_fetched_digest_mismatch(self):
+        self._copy_manager1_dir_to_manager_dir()
+        manager_deployment = bootstrap.store_manager_deployment()
+        os.remove(bootstrap._archive_path(manager_deployment['sha256']))
+        shutil.rmtree(self.manager_dir)
+
+        def get(remote_source_path, destination_path):
+            with open(destination_path, 'wb') as f:
+                f.write('not the archive')
+
+        with patch.object(utils, 'build_manager_host_string'), \
+                patch.object(utils, 'get_management_port'), \
+                patch.object(bootstrap.fabric, 'get', side_effect=get):
+            self.assertRaisesRegexp(
+                CloudifyBootstrapError,
+                'does not match its sha256 digest',
+                bootstrap.read_manager_deployment_dump_if_needed,
+                manager_deployment,
+                key_filename='key.pem')
+        self.assertFalse(os.path.exists(self.manager_dir))
 
     def test_validate_manager_deployment_size_success(self):
         # reusing the copying code, but actually there's no significance for
@@ -106,6 +181,21 @@ class CliBootstrapUnitTests(unittest.TestCase):
                 bootstrap.validate_manager_deployment_size,
                 blueprint_path=os.path.join(self.manager_dir, 'file1'))
 
+    def test_validate_manager_deployment_size_names_largest_paths(self):
+        self._copy_manager1_dir_to_manager_dir()
+        large_dir = os.path.join(self.manager_dir, 'large_dir')
+        os.mkdir(large_dir)
+        with open(os.path.join(large_dir, 'large_file'), 'wb') as f:
+            f.write(os.urandom(64 * 1024))
+        with patch.object(bootstrap, 'MAX_MANAGER_DEPLOYMENT_SIZE',
+                          16 * 1024):
+            self.assertRaisesRegexp(
+                CloudifyBootstrapError,
+                r"largest files are: large_dir/large_file \(65536 bytes\).*"
+                r"largest directories are: large_dir \(65536 bytes\)",
+                bootstrap.validate_manager_deployment_size,
+                blueprint_path=os.path.join(self.manager_dir, 'file1'))
+
     def test_validate_manager_deployment_size_ignore_gitfile_success(self):
         # this test checks that the validation of the manager deployment size
         # also ignores the .git folder
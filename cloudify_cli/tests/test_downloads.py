@@ -0,0 +1,170 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import os
+import re
+import shutil
+import hashlib
+import tempfile
+import threading
+import unittest
+import BaseHTTPServer
+from SocketServer import ThreadingMixIn
+
+from mock import patch
+
+from cloudify_rest_client.client import CloudifyClient
+from cloudify_rest_client.exceptions import CloudifyClientError
+
+from cloudify_cli import downloads
+from cloudify_cli.exceptions import CloudifyCliError
+
+
+CONTENT = os.urandom(256 * 1024)
+
+
+class _ArchiveHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self._respond(send_body=False)
+
+    def do_GET(self):
+        self._respond(send_body=True)
+
+    def _respond(self, send_body):
+        server = self.server
+        server.requests.append((self.command, self.headers.get('Range')))
+        if self.path.split('?')[0] != '/api/v2.1/snapshots/snap/archive':
+            self.send_response(404)
+            self.end_headers()
+            return
+        start, end = 0, len(CONTENT) - 1
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if match and server.accept_ranges:
+            start = int(match.group(1))
+            end = int(match.group(2) or end)
+            self.send_response(206)
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Content-Disposition',
+                         'attachment; filename=snap.zip')
+        self.send_header('ETag', '"v1"')
+        if server.accept_ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        if not send_body:
+            return
+        body = CONTENT[start:end + 1]
+        if server.drop_after is not None:
+            # drop the connection midway, once
+            body = body[:server.drop_after]
+            server.drop_after = None
+        self.wfile.write(body)
+
+
+class _Server(ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class DownloadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = _Server(('127.0.0.1', 0), _ArchiveHandler)
+        self.server.requests = []
+        self.server.accept_ranges = True
+        self.server.drop_after = None
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        self.client = CloudifyClient(host='127.0.0.1',
+                                     port=self.server.server_address[1])
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir)
+        self.output = os.path.join(self.output_dir, 'snap.zip')
+        patcher = patch('cloudify_cli.downloads.time.sleep')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _download(self, uri='/snapshots/snap/archive', **kwargs):
+        return downloads.download(self.client, uri, self.output, **kwargs)
+
+    def _assert_downloaded(self, result):
+        with open(self.output, 'rb') as f:
+            self.assertEqual(CONTENT, f.read())
+        self.assertEqual(hashlib.sha256(CONTENT).hexdigest(), result.sha256)
+        self.assertFalse(os.path.exists(
+            self.output + downloads.PART_FILE_SUFFIX))
+        self.assertFalse(os.path.exists(
+            self.output + downloads.STATE_FILE_SUFFIX))
+
+    def test_download(self):
+        result = self._download()
+        self._assert_downloaded(result)
+        self.assertEqual(len(CONTENT), result.size)
+
+    def test_interrupted_download_is_resumed(self):
+        self.server.drop_after = 1000
+        self._assert_downloaded(self._download())
+        self.assertEqual(('GET', 'bytes=1000-'), self.server.requests[-1])
+
+    def test_interrupted_download_without_ranges_is_restarted(self):
+        self.server.accept_ranges = False
+        self.server.drop_after = 1000
+        self._assert_downloaded(self._download())
+        self.assertEqual(('GET', None), self.server.requests[-1])
+
+    def test_partial_download_of_a_previous_run_is_resumed(self):
+        self._download()
+        os.rename(self.output, self.output + downloads.PART_FILE_SUFFIX)
+        with open(self.output + downloads.PART_FILE_SUFFIX, 'r+b') as f:
+            f.truncate(5000)
+        with open(self.output + downloads.STATE_FILE_SUFFIX, 'w') as f:
+            f.write('{"url": "%s", "size": %d, "validator": "\\"v1\\"", '
+                    '"chunks": []}' % (self.client._client.url +
+                                       '/snapshots/snap/archive',
+                                       len(CONTENT)))
+        result = self._download()
+        self._assert_downloaded(result)
+        self.assertEqual(5000, result.resumed_size)
+
+    def test_parallel_chunks(self):
+        with patch('cloudify_cli.downloads.PARALLEL_MIN_SIZE', 1), \
+                patch('cloudify_cli.downloads.PARALLEL_CHUNK_SIZE',
+                      64 * 1024):
+            self.server.drop_after = 1000
+            self._assert_downloaded(self._download(concurrency=3))
+        ranges = [requested_range for method, requested_range
+                  in self.server.requests if method == 'GET']
+        self.assertIn('bytes=65536-131071', ranges)
+
+    def test_checksum_mismatch(self):
+        self.assertRaises(CloudifyCliError, self._download,
+                          expected_sha256='0' * 64)
+        self.assertFalse(os.path.exists(self.output))
+
+    def test_output_exists(self):
+        open(self.output, 'w').close()
+        self.assertRaises(OSError, self._download)
+
+    def test_missing_archive(self):
+        self.assertRaises(CloudifyClientError, self._download,
+                          uri='/snapshots/missing/archive')
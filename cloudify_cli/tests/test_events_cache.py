@@ -0,0 +1,144 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from mock import MagicMock
+
+from cloudify_rest_client.client import CloudifyClient
+from cloudify_rest_client.executions import Execution
+
+from cloudify_cli import events_cache
+from cloudify_cli.events_cache import ExecutionEventsCache
+from cloudify_cli.execution_events_fetcher import ExecutionEventsFetcher
+from cloudify_cli.tests.resources.mocks.mock_list_response \
+    import MockListResponse
+
+
+class ExecutionEventsCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+
+    def _cache(self, execution_id='execution_id', include_logs=False):
+        return ExecutionEventsCache(self.cache_dir, execution_id,
+                                    include_logs=include_logs)
+
+    def test_append_and_iter(self):
+        cache = self._cache()
+        cache.append(0, [{'id': 0}, {'id': 1}])
+        cache.append(2, [{'id': 2}])
+        self.assertEqual(3, cache.count)
+        self.assertEqual([{'id': 1}, {'id': 2}],
+                         list(self._cache().iter_events(1)))
+
+    def test_append_with_gap_is_ignored(self):
+        cache = self._cache()
+        cache.append(0, [{'id': 0}])
+        cache.append(5, [{'id': 5}])
+        self.assertEqual(1, cache.count)
+
+    def test_logs_are_cached_separately(self):
+        self._cache().append(0, [{'id': 0}])
+        self.assertEqual(0, self._cache(include_logs=True).count)
+
+    def test_events_written_after_metadata_are_dropped(self):
+        cache = self._cache()
+        cache.append(0, [{'id': 0}])
+        with open(os.path.join(self.cache_dir, 'execution_id.ndjson'),
+                  'a') as f:
+            f.write('{"id": "partial"')
+        self.assertEqual([{'id': 0}], list(self._cache().iter_events()))
+
+    def test_end_event_is_tracked(self):
+        cache = self._cache()
+        cache.append(0, [{'event_type': 'task_succeeded'}])
+        self.assertFalse(cache.end_log_received)
+        cache.append(1, [{'event_type': 'workflow_succeeded'}])
+        self.assertTrue(self._cache().end_log_received)
+
+    def test_evict_least_recently_used(self):
+        old_cache = self._cache('old')
+        old_cache.append(0, [{'id': 0}])
+        new_cache = self._cache('new')
+        new_cache.append(0, [{'id': 0}])
+        old_events_path = os.path.join(self.cache_dir, 'old.ndjson')
+        new_events_path = os.path.join(self.cache_dir, 'new.ndjson')
+        past = time.time() - 60
+        os.utime(old_events_path, (past, past))
+
+        events_cache.evict(self.cache_dir,
+                           max_size=os.path.getsize(new_events_path))
+        self.assertFalse(os.path.exists(old_events_path))
+        self.assertTrue(os.path.exists(new_events_path))
+
+
+class CachedExecutionEventsFetcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        self.events = [{'id': i} for i in range(5)]
+        self.events.append({'id': 5, 'event_type': 'workflow_succeeded'})
+        self.client = CloudifyClient()
+        self.client.executions.get = MagicMock(
+            return_value=Execution({'status': Execution.TERMINATED}))
+        self.client.events.list = MagicMock(side_effect=self._mock_list)
+
+    def _mock_list(self, **kwargs):
+        from_event = kwargs.get('_offset', 0)
+        batch_size = kwargs.get('_size', 100)
+        return MockListResponse(
+            self.events[from_event:from_event + batch_size], len(self.events))
+
+    def _fetch_all(self):
+        fetched_events = []
+        cache = ExecutionEventsCache(self.cache_dir, 'execution_id')
+        events_fetcher = ExecutionEventsFetcher(self.client,
+                                                'execution_id',
+                                                batch_size=2,
+                                                events_cache=cache)
+        events_fetcher.fetch_and_process_events(
+            events_handler=fetched_events.extend)
+        return fetched_events, cache
+
+    def test_only_new_events_are_fetched(self):
+        all_events = self.events
+        self.events = all_events[:3]
+        self.client.executions.get.return_value = \
+            Execution({'status': Execution.STARTED})
+        self._fetch_all()
+
+        self.events = all_events
+        self.client.events.list.reset_mock()
+        fetched_events, _ = self._fetch_all()
+        self.assertEqual(all_events, fetched_events)
+        offsets = [call[1]['_offset']
+                   for call in self.client.events.list.call_args_list]
+        self.assertEqual(3, offsets[0])
+
+    def test_ended_execution_is_immutable(self):
+        _, cache = self._fetch_all()
+        self.assertTrue(cache.immutable)
+
+        self.client.events.list.reset_mock()
+        fetched_events, _ = self._fetch_all()
+        self.assertEqual(self.events, fetched_events)
+        self.assertFalse(self.client.events.list.called)
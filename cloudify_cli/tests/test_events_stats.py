@@ -0,0 +1,110 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import unittest
+
+from cloudify_cli import events_stats
+from cloudify_cli.events_stats import ExecutionEventsStats
+
+
+def task_event(seconds, event_type, task_id, node_instance, operation):
+    return {
+        '@timestamp': '2016-01-01T00:00:{0:06.3f}Z'.format(seconds),
+        'event_type': event_type,
+        'context': {
+            'task_id': task_id,
+            'node_id': node_instance,
+            'node_name': node_instance.rsplit('_', 1)[0],
+            'operation': operation
+        }
+    }
+
+
+def task_events(task_id, node_instance, operation, sent, started, ended,
+                end_type='task_succeeded'):
+    return [
+        task_event(sent, 'sending_task', task_id, node_instance, operation),
+        task_event(started, 'task_started', task_id, node_instance,
+                   operation),
+        task_event(ended, end_type, task_id, node_instance, operation)
+    ]
+
+
+class EventsStatsTest(unittest.TestCase):
+
+    def _stats(self, events):
+        stats = ExecutionEventsStats()
+        stats(sorted(events, key=lambda event: event['@timestamp']))
+        return stats
+
+    def test_parse_event_timestamp(self):
+        self.assertEqual(
+            1451606400.5,
+            events_stats.parse_event_timestamp(
+                {'@timestamp': '2016-01-01T00:00:00.500Z'}))
+        self.assertEqual(
+            1451606400,
+            events_stats.parse_event_timestamp(
+                {'timestamp': '2016-01-01 00:00:00+0000'}))
+        self.assertIsNone(events_stats.parse_event_timestamp({}))
+
+    def test_durations_and_queue_delay(self):
+        stats = self._stats(
+            task_events('t1', 'vm_1', 'create', 0, 1, 4) +
+            task_events('t2', 'vm_2', 'create', 0, 2, 3))
+        node_instances = dict((row['node_instance'], row) for row in
+                              stats.aggregates('node_instance'))
+        self.assertEqual(3, node_instances['vm_1']['duration'])
+        self.assertEqual(1, node_instances['vm_1']['avg_queue_delay'])
+        self.assertEqual(1, node_instances['vm_2']['duration'])
+
+        [node] = stats.aggregates('node')
+        self.assertEqual('vm', node['node'])
+        self.assertEqual(2, node['tasks'])
+        self.assertEqual(4, node['duration'])
+        self.assertEqual(3, node['max_duration'])
+        self.assertEqual(1.5, node['avg_queue_delay'])
+
+    def test_retries(self):
+        stats = self._stats(
+            task_events('t1', 'vm_1', 'start', 0, 0, 1,
+                        end_type='task_rescheduled') +
+            task_events('t2', 'vm_1', 'start', 2, 2, 3,
+                        end_type='task_rescheduled') +
+            task_events('t3', 'vm_1', 'start', 4, 4, 5))
+        [operation] = stats.aggregates('operation')
+        self.assertEqual(3, operation['tasks'])
+        self.assertEqual(2, operation['retries'])
+        self.assertEqual(1, operation['succeeded'])
+        self.assertEqual(0, stats.open_tasks_count)
+
+    def test_critical_path(self):
+        stats = self._stats(
+            task_events('t1', 'vm_1', 'create', 0, 0, 2) +
+            task_events('t2', 'db_1', 'create', 0, 0, 5) +
+            task_events('t3', 'vm_1', 'start', 2, 2, 3) +
+            task_events('t4', 'db_1', 'start', 5, 5, 9) +
+            task_events('t5', 'app_1', 'create', 9, 9, 10))
+        self.assertEqual(
+            [('db_1', 'create'), ('db_1', 'start'), ('app_1', 'create')],
+            [(step['node_instance'], step['operation'])
+             for step in stats.critical_path()])
+        self.assertEqual(10, stats.to_dict()['wall_time'])
+
+    def test_open_tasks(self):
+        stats = self._stats(
+            task_events('t1', 'vm_1', 'create', 0, 0, 2)[:2])
+        self.assertEqual(1, stats.open_tasks_count)
+        self.assertEqual([], stats.aggregates('node'))
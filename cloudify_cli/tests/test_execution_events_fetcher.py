@@ -18,9 +18,9 @@ import unittest
 
 from mock import MagicMock, patch
 from cloudify_cli.execution_events_fetcher import ExecutionEventsFetcher, \
-    wait_for_execution
-from cloudify_cli.exceptions import EventProcessingTimeoutError, \
-    ExecutionTimeoutError
+    DeploymentEventsFetcher, EventsFilter, wait_for_execution, merge_events
+from cloudify_cli.exceptions import CloudifyCliError, \
+    EventProcessingTimeoutError, ExecutionTimeoutError
 from cloudify_rest_client.client import CloudifyClient
 from cloudify_rest_client.executions import Execution
 
@@ -144,6 +144,15 @@ class ExecutionEventsFetcherTest(unittest.TestCase):
         all_fetched_events.extend(remaining_events_batch)
         self.assertEqual(self.events, all_fetched_events)
 
+    def test_fetch_events_from_event(self):
+        self.events = range(0, 10)
+        events_fetcher = ExecutionEventsFetcher(self.client,
+                                                'execution_id',
+                                                from_event=6)
+        events_count = events_fetcher.fetch_and_process_events()
+        self.assertEqual(4, events_count)
+        self.assertEqual(10, events_fetcher.from_event)
+
     def test_fetch_and_process_events_timeout(self):
         self.events = range(0, 2000000)
         events_fetcher = ExecutionEventsFetcher(self.client,
@@ -248,3 +257,176 @@ class WaitForExecutionTests(unittest.TestCase):
         self.assertEqual(calls_count, 101, """wait_for_execution didnt keep
             polling the execution status after it received a workflow_succeeded
             event (expected 101 calls, got %d)""" % calls_count)
+
+
+class DeploymentEventsFetcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = CloudifyClient()
+        self.executions = {}
+        self.events = {}
+        self.client.executions.list = lambda **kwargs: [
+            Execution({'id': execution_id})
+            for execution_id in sorted(self.executions)]
+        self.client.executions.get = lambda execution_id: Execution(
+            {'id': execution_id, 'status': self.executions[execution_id]})
+        self.client.events.list = self._mock_list
+
+    def _mock_list(self, execution_id, **kwargs):
+        from_event = kwargs.get('_offset', 0)
+        batch_size = kwargs.get('_size', 100)
+        events = self.events[execution_id]
+        return MockListResponse(events[from_event:from_event + batch_size],
+                                len(events))
+
+    def _add_execution(self, execution_id, timestamps,
+                       status=Execution.TERMINATED):
+        self.executions[execution_id] = status
+        self.events[execution_id] = [
+            {'@timestamp': '2016-01-01T00:00:{0:02d}.000Z'.format(timestamp),
+             'execution_id': execution_id}
+            for timestamp in timestamps]
+
+    def test_merge_events(self):
+        merged = merge_events([
+            [{'timestamp': '1'}, {'timestamp': '3'}],
+            [],
+            [{'timestamp': '2'}, {'timestamp': '3', 'second': True}]
+        ])
+        self.assertEqual(
+            [{'timestamp': '1'}, {'timestamp': '2'}, {'timestamp': '3'},
+             {'timestamp': '3', 'second': True}],
+            list(merged))
+
+    def test_events_are_merged_by_timestamp(self):
+        self._add_execution('install', [0, 2, 4, 6, 8])
+        self._add_execution('scale', [1, 3, 5])
+        self._add_execution('heal', [])
+        processed_events = []
+        deployment_events = DeploymentEventsFetcher(self.client,
+                                                    'deployment_id',
+                                                    batch_size=2)
+        events_count = deployment_events.fetch_and_process_events(
+            events_handler=processed_events.extend)
+        self.assertEqual(8, events_count)
+        self.assertEqual(
+            ['install', 'scale', 'install', 'scale', 'install', 'scale',
+             'install', 'install'],
+            [event['execution_id'] for event in processed_events])
+
+    def test_fetch_error_is_raised(self):
+        self._add_execution('install', [0])
+
+        def failing_list(**kwargs):
+            raise RuntimeError('events list failed')
+
+        self.client.events.list = failing_list
+        deployment_events = DeploymentEventsFetcher(self.client,
+                                                    'deployment_id')
+        self.assertRaisesRegexp(RuntimeError, 'events list failed',
+                                deployment_events.fetch_and_process_events)
+
+    @patch('cloudify_cli.execution_events_fetcher.time')
+    def test_tail_picks_up_new_executions(self, time_mock):
+        self._add_execution('install', [0, 1])
+
+        class StopTailing(Exception):
+            pass
+
+        rounds = count()
+
+        def next_round(_):
+            round_number = next(rounds)
+            if round_number == 0:
+                self._add_execution('scale', [2, 3],
+                                    status=Execution.STARTED)
+            elif round_number == 1:
+                self.events['scale'].append(
+                    {'@timestamp': '2016-01-01T00:00:04.000Z',
+                     'execution_id': 'scale'})
+            else:
+                raise StopTailing()
+
+        time_mock.sleep.side_effect = next_round
+        processed_events = []
+        deployment_events = DeploymentEventsFetcher(self.client,
+                                                    'deployment_id')
+        self.assertRaises(StopTailing, deployment_events.tail,
+                          events_handler=processed_events.extend)
+        self.assertEqual(
+            ['install', 'install', 'scale', 'scale', 'scale'],
+            [event['execution_id'] for event in processed_events])
+
+
+class EventsFilterTest(unittest.TestCase):
+
+    def _event(self, **kwargs):
+        event = {'@timestamp': '2016-01-01T12:00:00.000Z',
+                 'event_type': 'task_failed',
+                 'context': {'node_name': 'vm',
+                             'operation':
+                                 'cloudify.interfaces.lifecycle.create'}}
+        event.update(kwargs)
+        return event
+
+    def test_query_params(self):
+        events_filter = EventsFilter(
+            event_types=['task_failed'],
+            node_id='vm',
+            operation='cloudify.interfaces.lifecycle.create',
+            since='2016-01-01 12:00',
+            until='2016-01-02T00:00:00Z')
+        self.assertEqual({
+            'event_type': ['task_failed'],
+            'context.node_name': 'vm',
+            'context.operation': 'cloudify.interfaces.lifecycle.create',
+            'from_datetime': '2016-01-01T12:00:00',
+            'to_datetime': '2016-01-02T00:00:00'
+        }, events_filter.query_params())
+
+    def test_level_query_params(self):
+        events_filter = EventsFilter(level='WARNING', operation='create')
+        self.assertTrue(events_filter.include_logs)
+        self.assertEqual({'level': ['warning', 'error', 'critical']},
+                         events_filter.query_params())
+
+    def test_matches(self):
+        self.assertTrue(EventsFilter(operation='create').matches(
+            self._event()))
+        self.assertFalse(EventsFilter(operation='start').matches(
+            self._event()))
+        self.assertFalse(EventsFilter(node_id='db').matches(self._event()))
+        self.assertFalse(EventsFilter(event_types=['task_succeeded']).matches(
+            self._event()))
+        self.assertTrue(EventsFilter(level='error').matches(
+            self._event(level='error')))
+        self.assertFalse(EventsFilter(level='error').matches(
+            self._event(level='info')))
+        self.assertFalse(EventsFilter(level='error').matches(self._event()))
+        self.assertTrue(EventsFilter(since='2016-01-01 12:00').matches(
+            self._event()))
+        self.assertFalse(EventsFilter(since='2016-01-01 12:01').matches(
+            self._event()))
+        self.assertFalse(EventsFilter(until='2016-01-01 11:59').matches(
+            self._event()))
+
+    def test_invalid_filter(self):
+        self.assertRaises(CloudifyCliError, EventsFilter, level='verbose')
+        self.assertRaises(CloudifyCliError, EventsFilter, since='yesterday')
+        self.assertRaises(CloudifyCliError, EventsFilter,
+                          level='error', event_types=['task_failed'])
+
+    def test_wait_for_execution_with_filter(self):
+        """With a filter, the workflow-end event isn't waited for, as the
+        manager might have filtered it out
+        """
+        client = CloudifyClient()
+        client.executions.get = MagicMock(
+            return_value=MagicMock(status=Execution.TERMINATED))
+        client.events.list = MagicMock(
+            return_value=MockListResponse([], 0))
+        mock_execution = MagicMock(status=Execution.STARTED)
+        wait_for_execution(client, mock_execution, timeout=None,
+                           events_filter=EventsFilter(level='error'))
+        self.assertEqual(['error', 'critical'],
+                         client.events.list.call_args[1]['level'])
@@ -0,0 +1,159 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import requests
+from mock import patch, MagicMock
+from dsl_parser.exceptions import DSLParsingLogicException
+from dsl_parser.import_resolver.default_import_resolver import \
+    DefaultImportResolver
+
+from cloudify_cli import import_cache
+from cloudify_cli import plan_cache
+from cloudify_cli.import_cache import CachingImportResolver
+from cloudify_cli.tests import cli_runner
+from cloudify_cli.tests.commands.test_cli_command import CliCommandTest
+
+
+IMPORT_URL = 'http://example.com/types.yaml'
+
+BLUEPRINT = """
+tosca_definitions_version: cloudify_dsl_1_2
+imports:
+    - {0}
+node_templates:
+    node:
+        type: test_type
+""".format(IMPORT_URL)
+
+TYPES = """
+node_types:
+    test_type: {}
+"""
+
+
+def _response(status_code=200, text=TYPES, headers=None):
+    response = MagicMock(status_code=status_code, text=text)
+    response.headers = headers or {}
+    return response
+
+
+class CachingImportResolverTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        patcher = patch('cloudify_cli.import_cache.requests.get')
+        self.get_mock = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.get_mock.return_value = _response(headers={'ETag': '"v1"'})
+
+    def _resolver(self, resolver=None, **kwargs):
+        return CachingImportResolver(resolver or DefaultImportResolver(),
+                                     self.cache_dir, **kwargs)
+
+    def test_served_from_cache_within_ttl(self):
+        self.assertEqual(TYPES, self._resolver().fetch_import(IMPORT_URL))
+        resolver = self._resolver(ttl=60)
+        self.assertEqual(TYPES, resolver.fetch_import(IMPORT_URL))
+        self.assertEqual(1, self.get_mock.call_count)
+        self.assertEqual([(IMPORT_URL, import_cache.STATUS_CACHED,
+                           len(TYPES))], resolver.served)
+
+    def test_revalidated_after_ttl(self):
+        self._resolver().fetch_import(IMPORT_URL)
+        self.get_mock.return_value = _response(status_code=304, text='')
+        resolver = self._resolver()
+        self.assertEqual(TYPES, resolver.fetch_import(IMPORT_URL))
+        headers = self.get_mock.call_args[1]['headers']
+        self.assertEqual('"v1"', headers['If-None-Match'])
+        self.assertEqual(import_cache.STATUS_NOT_MODIFIED,
+                         resolver.served[0][1])
+
+    def test_refresh_ignores_ttl(self):
+        self._resolver().fetch_import(IMPORT_URL)
+        self.get_mock.return_value = _response(text='changed')
+        self.assertEqual(
+            'changed',
+            self._resolver(ttl=60, refresh=True).fetch_import(IMPORT_URL))
+
+    def test_rules_are_applied(self):
+        resolver = DefaultImportResolver(
+            rules=[{'http://example.com': 'http://mirror.com'}])
+        self._resolver(resolver).fetch_import(IMPORT_URL)
+        self.assertEqual('http://mirror.com/types.yaml',
+                         self.get_mock.call_args[0][0])
+
+    def test_stale_entry_served_when_fetch_fails(self):
+        self._resolver().fetch_import(IMPORT_URL)
+        self.get_mock.side_effect = requests.ConnectionError('unreachable')
+        with patch('time.sleep'):
+            resolver = self._resolver()
+            self.assertEqual(TYPES, resolver.fetch_import(IMPORT_URL))
+        self.assertEqual(import_cache.STATUS_STALE, resolver.served[0][1])
+
+    def test_offline(self):
+        self._resolver().fetch_import(IMPORT_URL)
+        self.get_mock.reset_mock()
+        resolver = self._resolver(offline=True)
+        self.assertEqual(TYPES, resolver.fetch_import(IMPORT_URL))
+        self.assertRaises(DSLParsingLogicException,
+                          resolver.fetch_import,
+                          'http://example.com/other.yaml')
+        self.assertFalse(self.get_mock.called)
+
+    def test_local_imports_are_delegated(self):
+        types_path = os.path.join(self.cache_dir, 'types.yaml')
+        with open(types_path, 'w') as f:
+            f.write(TYPES)
+        resolver = self._resolver(offline=True)
+        self.assertEqual(TYPES, resolver.fetch_import('file:' + types_path))
+        self.assertEqual([], resolver.served)
+
+
+class ImportsPrefetchTest(CliCommandTest):
+
+    def setUp(self):
+        super(ImportsPrefetchTest, self).setUp()
+        self._create_cosmo_wd_settings()
+        self.blueprint_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.blueprint_dir)
+        self.blueprint_path = os.path.join(self.blueprint_dir,
+                                           'blueprint.yaml')
+        with open(self.blueprint_path, 'w') as f:
+            f.write(BLUEPRINT)
+        plan_cache.clear()
+        self.addCleanup(plan_cache.clear)
+
+    def test_prefetch_then_validate_offline(self):
+        with patch('cloudify_cli.import_cache.requests.get',
+                   return_value=_response()) as get_mock:
+            cli_runner.run_cli('cfy imports prefetch -p {0}'
+                               .format(self.blueprint_path))
+        self.assertEqual(1, get_mock.call_count)
+
+        with patch('cloudify_cli.import_cache.requests.get') as get_mock:
+            cli_runner.run_cli('cfy blueprints validate --offline -p {0}'
+                               .format(self.blueprint_path))
+        self.assertFalse(get_mock.called)
+
+    def test_validate_offline_without_prefetch(self):
+        self._assert_ex('cfy blueprints validate --offline -p {0}'
+                        .format(self.blueprint_path),
+                        err_str_segment="can't be fetched in offline mode")
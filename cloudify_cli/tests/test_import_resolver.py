@@ -29,6 +29,7 @@ from dsl_parser.import_resolver.default_import_resolver import \
 from cloudify_cli.bootstrap import bootstrap
 from cloudify_cli.tests import cli_runner
 from cloudify_cli import utils
+from cloudify_cli import plan_cache
 from cloudify_cli.tests.commands.test_cli_command import \
     CliCommandTest, BLUEPRINTS_DIR
 
@@ -98,7 +99,6 @@ class ImportResolverLocalUseTests(CliCommandTest):
     def _test_using_import_resolver(self,
                                     command,
                                     blueprint_path,
-                                    mocked_module,
                                     mock_get_resolver):
         cli_runner.run_cli('cfy init -r')
 
@@ -110,25 +110,24 @@ class ImportResolverLocalUseTests(CliCommandTest):
         resolver = DefaultImportResolver(**parameters)
         # set the return value of mock_get_resolver -
         # this is the resolver we expect to be passed to
-        # the parse_from_path method.
+        # the parse_blueprint method.
         mock_get_resolver.return_value = resolver
 
         # run the cli command and check that
-        # parse_from_path was called with the expected resolver
+        # parse_blueprint was called with the expected resolver
         cli_command = 'cfy {0} -p {1}'.format(command, blueprint_path)
         kwargs = {
-            'dsl_file_path': blueprint_path,
             'resolver': resolver,
             'validate_version': True
         }
         self.assert_method_called(
-            cli_command, mocked_module, 'parse_from_path', kwargs=kwargs)
+            cli_command, plan_cache, 'parse_blueprint',
+            args=[blueprint_path], kwargs=kwargs)
 
     def test_validate_blueprint_uses_import_resolver(self):
-        from cloudify_cli.commands import blueprints
         blueprint_path = '{0}/local/blueprint.yaml'.format(BLUEPRINTS_DIR)
         self._test_using_import_resolver(
-            'blueprints validate', blueprint_path, blueprints)
+            'blueprints validate', blueprint_path)
 
     @mock.patch.object(local._Environment, 'execute')
     @mock.patch.object(dsl_parser.tasks, 'prepare_deployment_plan')
@@ -177,7 +176,7 @@ class ImportResolverLocalUseTests(CliCommandTest):
 
         try:
             self._test_using_import_resolver(
-                'bootstrap', blueprint_path, dsl_parser.parser)
+                'bootstrap', blueprint_path)
         finally:
             bootstrap.validate_manager_deployment_size = old_validate_dep_size
             bootstrap.load_env = old_load_env
@@ -193,4 +192,4 @@ class ImportResolverLocalUseTests(CliCommandTest):
         blueprint_path = '{0}/local/{1}.yaml'.format(BLUEPRINTS_DIR,
                                                      'blueprint')
         self._test_using_import_resolver(
-            'local init', blueprint_path, dsl_parser.parser)
+            'local init', blueprint_path)
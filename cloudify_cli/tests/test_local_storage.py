@@ -0,0 +1,180 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+
+from cloudify.workflows import local
+from cloudify_rest_client.node_instances import NodeInstance
+
+from cloudify_cli import local_storage
+from cloudify_cli.exceptions import CloudifyCliError
+
+
+PLAN = {'workflows': {}, 'outputs': {}}
+NODES = [{'id': 'server', 'type': 'type'},
+         {'id': 'app', 'type': 'type'}]
+NODE_INSTANCES = [
+    NodeInstance({'id': 'server_1', 'node_id': 'server', 'version': 0,
+                  'runtime_properties': {}, 'state': 'uninitialized'}),
+    NodeInstance({'id': 'server_2', 'node_id': 'server', 'version': 0,
+                  'runtime_properties': {}, 'state': 'uninitialized'}),
+    NodeInstance({'id': 'app_1', 'node_id': 'app', 'version': 0,
+                  'runtime_properties': {}, 'state': 'uninitialized'})]
+
+
+class SQLiteStorageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.storage_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.storage_dir)
+        self.blueprint_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.blueprint_dir)
+        self.blueprint_path = os.path.join(self.blueprint_dir,
+                                           'blueprint.yaml')
+        with open(self.blueprint_path, 'w') as f:
+            f.write('tosca_definitions_version: cloudify_dsl_1_2\n')
+
+    def _init(self, storage):
+        storage.init(name='env',
+                     plan=PLAN,
+                     nodes=NODES,
+                     node_instances=NODE_INSTANCES,
+                     blueprint_path=self.blueprint_path,
+                     provider_context={'key': 'value'})
+        return storage
+
+    def _load(self):
+        storage = local_storage.load_storage(self.storage_dir, 'env')
+        storage.load('env')
+        return storage
+
+    def test_init_and_load(self):
+        self._init(local_storage.SQLiteStorage(self.storage_dir))
+        self.assertEqual(local_storage.STORAGE_SQLITE,
+                         local_storage.storage_type(self.storage_dir, 'env'))
+        storage = self._load()
+        self.assertEqual(PLAN, storage.plan)
+        self.assertEqual({'key': 'value'}, storage.get_provider_context())
+        self.assertEqual(['app', 'server'],
+                         sorted(node.id for node in storage.get_nodes()))
+        self.assertTrue(os.path.isfile(storage.get_blueprint_path()))
+        self.assertTrue(os.path.isdir(storage.get_workdir()))
+
+    def test_get_node_instances_of_a_node(self):
+        storage = self._init(local_storage.SQLiteStorage(self.storage_dir))
+        self.assertEqual(['server_1', 'server_2'],
+                         [instance.id for instance
+                          in storage.get_node_instances(node_id='server')])
+        self.assertEqual(3, len(storage.get_node_instances()))
+
+    def test_update_node_instance(self):
+        storage = self._init(local_storage.SQLiteStorage(self.storage_dir))
+        storage.update_node_instance('app_1', 0,
+                                     runtime_properties={'ip': '1.1.1.1'},
+                                     state='started')
+        instance = self._load().get_node_instance('app_1')
+        self.assertEqual({'ip': '1.1.1.1'}, instance.runtime_properties)
+        self.assertEqual('started', instance.state)
+        self.assertEqual(1, instance.version)
+        self.assertRaises(local.StorageConflictError,
+                          storage.update_node_instance, 'app_1', 0,
+                          runtime_properties={})
+        self.assertEqual({'ip': '1.1.1.1'}, self._load().get_node_instance(
+            'app_1').runtime_properties)
+
+    def test_iter_node_instances_of_a_file_storage(self):
+        storage = self._init(local.FileStorage(self.storage_dir))
+        # `server` is a prefix of the `server_1` instance ids, too
+        self.assertEqual(
+            ['app_1'],
+            [instance.id for instance in
+             local_storage.iter_node_instances(storage, node_id='app')])
+        self.assertEqual(
+            ['server_1', 'server_2'],
+            [instance.id for instance in
+             local_storage.iter_node_instances(storage, node_id='server')])
+        self.assertEqual(
+            [], list(local_storage.iter_node_instances(storage,
+                                                       node_id='serv')))
+        self.assertEqual(
+            3, len(list(local_storage.iter_node_instances(storage))))
+
+    def test_payload(self):
+        storage = self._init(local_storage.SQLiteStorage(self.storage_dir))
+        with storage.payload() as payload:
+            payload['key'] = 'value'
+        with self._load().payload() as payload:
+            self.assertEqual({'key': 'value'}, payload)
+
+    def test_migrate_file_storage(self):
+        storage = self._init(local.FileStorage(self.storage_dir))
+        storage.update_node_instance('server_1', 0, state='started')
+        with storage.payload() as payload:
+            payload['key'] = 'value'
+        # FileStorage.init doesn't create the work directory itself
+        os.mkdir(storage.get_workdir())
+        with open(os.path.join(storage.get_workdir(), 'state'), 'w') as f:
+            f.write('state')
+
+        local_storage.migrate_file_storage(self.storage_dir, 'env')
+        self.assertEqual(local_storage.STORAGE_SQLITE,
+                         local_storage.storage_type(self.storage_dir, 'env'))
+        self.assertEqual(['env'], os.listdir(self.storage_dir))
+        storage = self._load()
+        self.assertEqual('started',
+                         storage.get_node_instance('server_1').state)
+        self.assertEqual(1, storage.get_node_instance('server_1').version)
+        with storage.payload() as payload:
+            self.assertEqual({'key': 'value'}, payload)
+        with open(os.path.join(storage.get_workdir(), 'state')) as f:
+            self.assertEqual('state', f.read())
+
+    def test_migrate_file_storage_failed_swap(self):
+        storage = self._init(local.FileStorage(self.storage_dir))
+        storage.update_node_instance('server_1', 0, state='started')
+        rename = os.rename
+
+        def failing_rename(src, dst):
+            if dst == os.path.join(self.storage_dir, 'env') and \
+                    '.migrating' in src:
+                raise OSError('rename failed')
+            rename(src, dst)
+
+        with patch('os.rename', side_effect=failing_rename):
+            self.assertRaises(OSError,
+                              local_storage.migrate_file_storage,
+                              self.storage_dir, 'env')
+        # the file storage is left in place
+        self.assertEqual(local_storage.STORAGE_FILE,
+                         local_storage.storage_type(self.storage_dir, 'env'))
+        self.assertEqual(['env'], os.listdir(self.storage_dir))
+        storage = self._load()
+        self.assertEqual('started',
+                         storage.get_node_instance('server_1').state)
+
+    def test_migrate_missing_file_storage(self):
+        self.assertRaises(CloudifyCliError,
+                          local_storage.migrate_file_storage,
+                          self.storage_dir, 'env')
+
+    def test_unknown_storage_type(self):
+        self.assertRaises(CloudifyCliError,
+                          local_storage.create_storage,
+                          'unknown', self.storage_dir)
@@ -0,0 +1,171 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import os
+import random
+import shutil
+import tempfile
+
+from mock import patch
+from cloudify.workflows import local
+
+from cloudify_cli import common
+from cloudify_cli import constants
+from cloudify_cli import plan_cache
+from cloudify_cli.tests.commands.test_cli_command import CliCommandTest
+
+
+BLUEPRINT = """
+tosca_definitions_version: cloudify_dsl_1_2
+imports:
+    - types.yaml
+node_templates:
+    node:
+        type: test_type
+"""
+
+TYPES = """
+node_types:
+    test_type:
+        properties:
+            prop:
+                default: {0}
+"""
+
+CONTAINED_BLUEPRINT = """
+tosca_definitions_version: cloudify_dsl_1_2
+inputs:
+    prop:
+        default: value
+node_types:
+    test_type:
+        properties:
+            prop:
+                default: value
+relationships:
+    cloudify.relationships.contained_in: {}
+node_templates:
+    host:
+        type: test_type
+        properties:
+            prop: { get_input: prop }
+        instances:
+            deploy: 3
+    node:
+        type: test_type
+        relationships:
+            - type: cloudify.relationships.contained_in
+              target: host
+"""
+
+
+class PlanCacheTest(CliCommandTest):
+
+    def setUp(self):
+        super(PlanCacheTest, self).setUp()
+        self._create_cosmo_wd_settings()
+        self.blueprint_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.blueprint_dir)
+        self.blueprint_path = os.path.join(self.blueprint_dir,
+                                           'blueprint.yaml')
+        self._write('blueprint.yaml', BLUEPRINT)
+        self._write('types.yaml', TYPES.format('value'))
+        plan_cache.clear()
+        self.addCleanup(plan_cache.clear)
+
+    def _write(self, name, content):
+        with open(os.path.join(self.blueprint_dir, name), 'w') as f:
+            f.write(content)
+
+    def _parse(self):
+        with patch('cloudify_cli.plan_cache.parse_from_path',
+                   wraps=plan_cache.parse_from_path) as parse_mock:
+            plan = plan_cache.parse_blueprint(self.blueprint_path)
+        [node] = plan['nodes']
+        return node['properties']['prop'], parse_mock.call_count
+
+    def test_parsed_once_per_process(self):
+        self.assertEqual(('value', 1), self._parse())
+        self.assertEqual(('value', 0), self._parse())
+
+    def test_disk_cache(self):
+        self._parse()
+        plan_cache.clear()
+        self.assertEqual(('value', 0), self._parse())
+
+    def test_changed_import_is_parsed_again(self):
+        self._parse()
+        plan_cache.clear()
+        self._write('types.yaml', TYPES.format('new_value'))
+        self.assertEqual(('new_value', 1), self._parse())
+
+    def test_import_changed_in_process_is_parsed_again(self):
+        self.assertEqual(('value', 1), self._parse())
+        self._write('types.yaml', TYPES.format('new_value'))
+        self.assertEqual(('new_value', 1), self._parse())
+        self.assertEqual(('new_value', 0), self._parse())
+
+    def test_changed_blueprint_is_parsed_again(self):
+        self._parse()
+        self._write('blueprint.yaml', BLUEPRINT.replace('node:', 'node2:'))
+        with patch('cloudify_cli.plan_cache.parse_from_path',
+                   wraps=plan_cache.parse_from_path) as parse_mock:
+            plan = plan_cache.parse_blueprint(self.blueprint_path)
+        self.assertEqual(['node2'], [node['id'] for node in plan['nodes']])
+        self.assertEqual(1, parse_mock.call_count)
+
+    def test_returned_plan_is_a_copy(self):
+        plan = plan_cache.parse_blueprint(self.blueprint_path)
+        plan['nodes'] = []
+        self.assertEqual(
+            1, len(plan_cache.parse_blueprint(self.blueprint_path)['nodes']))
+
+    def test_planned_environment_matches_init_env(self):
+        # common._PlannedEnvironment follows local._Environment's
+        # initialization past the parsing; both have to end up the same
+        self._write('contained.yaml', CONTAINED_BLUEPRINT)
+        blueprint_path = os.path.join(self.blueprint_dir, 'contained.yaml')
+        inputs = {'prop': 'new_value'}
+        # node instance ids are random
+        random.seed(0)
+        env = local.init_env(
+            blueprint_path,
+            inputs=inputs,
+            ignored_modules=constants.IGNORED_LOCAL_WORKFLOW_MODULES)
+        random.seed(0)
+        planned_env = common.initialize_blueprint(blueprint_path,
+                                                  name='local',
+                                                  storage=None,
+                                                  inputs=inputs)
+        self.assertEqual(env.plan, planned_env.plan)
+        self.assertEqual(env.storage.get_nodes(),
+                         planned_env.storage.get_nodes())
+        self.assertEqual(
+            sorted(env.storage.get_node_instances(), key=lambda i: i.id),
+            sorted(planned_env.storage.get_node_instances(),
+                   key=lambda i: i.id))
+        self.assertEqual(6, len(env.storage.get_node_instances()))
+
+    def test_planned_environment_without_dsl_parser(self):
+        plan = plan_cache.parse_blueprint(self.blueprint_path)
+        with patch.object(local, 'dsl_parser', None):
+            self.assertRaisesRegexp(
+                ImportError,
+                'cloudify-dsl-parser must be installed',
+                common._PlannedEnvironment,
+                plan=plan,
+                blueprint_path=self.blueprint_path,
+                name='local',
+                storage=local.InMemoryStorage())
@@ -0,0 +1,106 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import os
+import hashlib
+import tempfile
+import unittest
+
+import requests
+from mock import MagicMock, patch
+
+from cloudify_rest_client.client import CloudifyClient
+from cloudify_rest_client.exceptions import CloudifyClientError
+
+from cloudify_cli import uploads
+from cloudify_cli.exceptions import CloudifyCliError
+
+
+CONTENT = os.urandom(200 * 1024)
+
+
+class _Clock(object):
+
+    def __init__(self):
+        self.now = 0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class UploadTest(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        with os.fdopen(fd, 'wb') as f:
+            f.write(CONTENT)
+        self.addCleanup(os.remove, self.path)
+        self.client = CloudifyClient()
+        self.uploaded = []
+        self.failures = []
+        self.client._client.put = MagicMock(side_effect=self._put)
+        patcher = patch('cloudify_cli.uploads.time.sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _put(self, uri, data, **kwargs):
+        uploaded = []
+        for chunk in data:
+            uploaded.append(chunk)
+            if self.failures:
+                raise self.failures.pop(0)
+        self.uploaded.append(''.join(uploaded))
+        return {'id': 'snap'}
+
+    def test_upload_snapshot(self):
+        snapshot, result = uploads.upload_snapshot(self.client, self.path,
+                                                   'snap')
+        self.assertEqual('snap', snapshot.id)
+        self.assertEqual([CONTENT], self.uploaded)
+        self.assertEqual(hashlib.sha256(CONTENT).hexdigest(), result.sha256)
+        self.assertEqual(len(CONTENT), result.size)
+        self.assertEqual('/snapshots/snap/archive',
+                         self.client._client.put.call_args[0][0])
+
+    def test_failed_upload_is_retried(self):
+        self.failures = [requests.ConnectionError(),
+                         CloudifyClientError('unavailable', status_code=503)]
+        _, result = uploads.upload_snapshot(self.client, self.path, 'snap')
+        self.assertEqual(3, result.attempts)
+        self.assertEqual([CONTENT], self.uploaded)
+        self.assertEqual(hashlib.sha256(CONTENT).hexdigest(), result.sha256)
+
+    def test_rejected_upload_is_not_retried(self):
+        self.failures = [CloudifyClientError('conflict', status_code=409)]
+        self.assertRaises(CloudifyClientError, uploads.upload_snapshot,
+                          self.client, self.path, 'snap')
+        self.assertEqual(1, self.client._client.put.call_count)
+
+    def test_upload_gives_up(self):
+        self.failures = [requests.ConnectionError()] * \
+            uploads.UPLOAD_ATTEMPTS
+        self.assertRaises(CloudifyCliError, uploads.upload_snapshot,
+                          self.client, self.path, 'snap')
+
+    def test_bandwidth_limit(self):
+        clock = _Clock()
+        with patch('cloudify_cli.uploads.time', clock):
+            uploads.upload_snapshot(self.client, self.path, 'snap',
+                                    bandwidth_limit=100 * 1024)
+        # 200K at 100K a second take two seconds
+        self.assertAlmostEqual(2, clock.now)
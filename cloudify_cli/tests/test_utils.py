@@ -15,6 +15,7 @@
 ############
 
 import os
+import json
 import shutil
 import unittest
 
@@ -200,3 +201,27 @@ class CliUtilsUnitTests(unittest.TestCase):
             utils.inputs_to_dict,
             input_str,
             resource_name)
+
+    def test_parse_size(self):
+        self.assertEqual(100, utils.parse_size('100'))
+        self.assertEqual(512 * 1024, utils.parse_size('512K'))
+        self.assertEqual(1572864, utils.parse_size('1.5mb'))
+        self.assertEqual(2 * 1024 ** 3, utils.parse_size('2G'))
+        self.assertRaises(ValueError, utils.parse_size, '10 parsecs')
+
+    def test_iter_json_array(self):
+        items = [{'id': 'a', 'properties': {'list': [1, 2], 'x': None}},
+                 {'id': 'b'}]
+        lines = list(utils.iter_json_array(iter(items)))
+        # a chunk per item
+        self.assertEqual(4, len(lines))
+        self.assertTrue(lines[1].startswith('  {\n    "id": "a",\n'))
+        self.assertEqual(items, json.loads('\n'.join(lines)))
+        self.assertEqual(['[]'], list(utils.iter_json_array([])))
+
+    def test_iter_json_object(self):
+        pairs = [('b', {'nested': [1]}), ('a', 'value')]
+        lines = list(utils.iter_json_object(pairs))
+        self.assertEqual(dict(pairs), json.loads('\n'.join(lines)))
+        self.assertEqual('  "a": "value"', lines[-2])
+        self.assertEqual(['{}'], list(utils.iter_json_object([])))
@@ -0,0 +1,133 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import os
+import shlex
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+from cloudify.exceptions import CommandExecutionException
+
+from cloudify_cli import wheel_cache
+from cloudify_cli.logger import configure_loggers
+from cloudify_cli.wheel_cache import WheelCache
+
+
+class _PipRunner(object):
+    """Pretends to be pip, building a wheel named after the source"""
+
+    def __init__(self):
+        self.commands = []
+        self.broken_sources = set()
+
+    def run(self, command, **kwargs):
+        # split as LocalCommandRunner does
+        arguments = shlex.split(command)[3:]
+        self.commands.append(arguments)
+        if arguments[0] != 'wheel' or '--no-deps' not in arguments:
+            return
+        source = arguments[-1]
+        if source in self.broken_sources:
+            raise CommandExecutionException(command, 'failed', None, 1)
+        wheel_dir = arguments[arguments.index('--wheel-dir') + 1]
+        name = os.path.splitext(os.path.basename(source))[0].replace('-', '_')
+        open(os.path.join(wheel_dir, '{0}-1.0-py2-none-any.whl'
+                          .format(name)), 'w').close()
+
+    def installs(self):
+        return [arguments for arguments in self.commands
+                if arguments[0] == 'install']
+
+
+class WheelCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        configure_loggers()
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        self.runner = _PipRunner()
+        self.cache = WheelCache(self.cache_dir, self.runner)
+        self.installed = set()
+        patcher = patch('cloudify_cli.wheel_cache.is_installed',
+                        side_effect=lambda name, version:
+                        (name, version) in self.installed)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_source_digest_of_a_directory_follows_its_content(self):
+        source = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, source)
+        with open(os.path.join(source, 'setup.py'), 'w') as f:
+            f.write('setup()')
+        digest = wheel_cache.source_digest(source)
+        with open(os.path.join(source, 'setup.pyc'), 'w') as f:
+            f.write('compiled')
+        self.assertEqual(digest, wheel_cache.source_digest(source))
+        with open(os.path.join(source, 'setup.py'), 'w') as f:
+            f.write('setup(name="plugin")')
+        self.assertNotEqual(digest, wheel_cache.source_digest(source))
+
+    def test_plugins_are_built_once_and_installed_offline(self):
+        sources = ['http://host/plugin-a.zip', 'http://host/plugin-b.zip']
+        unbuilt = wheel_cache.install_plugins(self.cache, sources)
+        self.assertEqual([], unbuilt)
+        install, = self.runner.installs()
+        self.assertIn('--no-index', install)
+        self.assertEqual(['plugin_a==1.0', 'plugin_b==1.0'],
+                         sorted(install[-2:]))
+
+        self.runner.commands = []
+        wheel_cache.install_plugins(self.cache, sources)
+        self.assertEqual(['install'],
+                         [arguments[0] for arguments
+                          in self.runner.commands])
+
+    def test_installed_plugins_are_skipped(self):
+        sources = ['http://host/plugin-a.zip']
+        wheel_cache.install_plugins(self.cache, sources)
+        self.installed.add(('plugin_a', '1.0'))
+        self.runner.commands = []
+        wheel_cache.install_plugins(self.cache, sources)
+        self.assertEqual([], self.runner.commands)
+
+    def test_paths_with_spaces(self):
+        cache_dir = os.path.join(self.cache_dir, 'a cache')
+        cache = WheelCache(cache_dir, self.runner)
+        sources = ['/plugins dir/plugin-a']
+        self.assertEqual([], wheel_cache.install_plugins(cache, sources))
+        self.assertEqual('/plugins dir/plugin-a',
+                         cache.get(sources[0])['source'])
+        install, = self.runner.installs()
+        self.assertIn(cache.get(sources[0])['wheels_dir'], install)
+
+    def test_unbuildable_sources_are_returned(self):
+        self.runner.broken_sources.add('http://host/plugin-b.zip')
+        unbuilt = wheel_cache.install_plugins(
+            self.cache, ['http://host/plugin-a.zip',
+                         'http://host/plugin-b.zip'])
+        self.assertEqual(['http://host/plugin-b.zip'], unbuilt)
+        self.assertIsNone(self.cache.get('http://host/plugin-b.zip'))
+        self.assertEqual(1, len(os.listdir(self.cache_dir)))
+
+
+class IsInstalledTest(unittest.TestCase):
+
+    def test_is_installed(self):
+        import mock
+        self.assertTrue(wheel_cache.is_installed('mock', mock.__version__))
+        self.assertFalse(wheel_cache.is_installed('mock', '0.0.1'))
+        self.assertFalse(wheel_cache.is_installed('no-such-plugin', '1.0'))
@@ -0,0 +1,165 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+"""
+Streamed uploads of large archives (e.g. snapshots) to the manager.
+
+A file is read from disk and sent in chunks, so it's never kept whole in
+memory. Its SHA256 is computed as it's sent, progress is reported along
+the way, and the upload rate may be capped. The manager can't resume an
+upload, so a failed upload is retried from the start (up to
+`UPLOAD_ATTEMPTS` times, backing off between attempts).
+"""
+
+import os
+import time
+import hashlib
+
+import requests
+
+from cloudify_rest_client.snapshots import Snapshot
+from cloudify_rest_client.exceptions import CloudifyClientError
+
+from cloudify_cli import utils
+from cloudify_cli.downloads import Progress, wait_before_retry
+from cloudify_cli.exceptions import CloudifyCliError
+
+
+UPLOAD_ATTEMPTS = 5
+READ_SIZE = 64 * 1024
+
+
+class UploadResult(object):
+
+    def __init__(self, response, size, sha256, elapsed, attempts):
+        # the manager's response to the upload request
+        self.response = response
+        self.size = size
+        self.sha256 = sha256
+        self.elapsed = elapsed
+        self.attempts = attempts
+
+    def __str__(self):
+        throughput = self.size / self.elapsed if self.elapsed else 0
+        description = '{0} in {1:.2f} seconds ({2}/s)'.format(
+            utils.format_size(self.size),
+            self.elapsed,
+            utils.format_size(throughput))
+        if self.attempts > 1:
+            description += ', after {0} attempts'.format(self.attempts)
+        return '{0}; sha256: {1}'.format(description, self.sha256)
+
+
+class _Throttle(object):
+    """Caps the average rate data is sent at, to `limit` bytes a second"""
+
+    def __init__(self, limit):
+        self._limit = limit
+        self._started = time.time()
+        self._sent = 0
+
+    def sent(self, size):
+        self._sent += size
+        ahead = self._sent / float(self._limit) - \
+            (time.time() - self._started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+def _file_chunks(path, sha256, progress, bandwidth_limit):
+    throttle = _Throttle(bandwidth_limit) if bandwidth_limit else None
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_SIZE), ''):
+            sha256.update(chunk)
+            yield chunk
+            progress.add(len(chunk))
+            if throttle:
+                throttle.sent(len(chunk))
+
+
+def _retryable(error):
+    if isinstance(error, CloudifyClientError):
+        # only server side failures may go away on their own
+        return error.status_code >= 500
+    return True
+
+
+def put_stream(client, uri, data, params=None, expected_status_code=201):
+    """PUT the chunks `data` yields to `uri` on the manager `client` is
+    connected to, and return the manager's response
+    """
+    # the REST client's upload methods (e.g. `blueprints.publish_archive`,
+    # `snapshots.upload`) only take a path or a URL of a file, so streamed
+    # data is sent with its (private) HTTP client directly. All streamed
+    # uploads go through here; `downloads._Download` and
+    # `utils.use_connection_pool` rely on that HTTP client's internals too,
+    # so check all three when upgrading cloudify-rest-client.
+    return client._client.put(uri,
+                              params=params,
+                              data=data,
+                              expected_status_code=expected_status_code)
+
+
+def upload_file(client, uri, path, params=None, expected_status_code=201,
+                bandwidth_limit=None, progress_handler=None):
+    """PUT the file at `path` to `uri` on the manager `client` is
+    connected to, streaming it from disk
+
+    :param bandwidth_limit: the maximal average upload rate, in bytes a
+                            second (None for no limit)
+    :param progress_handler: called with the number of bytes uploaded,
+                             the total size and the elapsed time
+    :return: an UploadResult
+    """
+    size = os.path.getsize(path)
+    started = time.time()
+    for attempt in range(1, UPLOAD_ATTEMPTS + 1):
+        sha256 = hashlib.sha256()
+        progress = Progress(size, progress_handler)
+        try:
+            response = put_stream(
+                client,
+                uri,
+                _file_chunks(path, sha256, progress, bandwidth_limit),
+                params=params,
+                expected_status_code=expected_status_code)
+            break
+        except (CloudifyClientError, requests.RequestException) as e:
+            if not _retryable(e):
+                raise
+            if attempt == UPLOAD_ATTEMPTS:
+                raise CloudifyCliError(
+                    'Upload of {0} failed after {1} attempts: {2}'
+                    .format(path, attempt, e))
+            wait_before_retry(attempt)
+    return UploadResult(response,
+                        size,
+                        sha256.hexdigest(),
+                        time.time() - started,
+                        attempt)
+
+
+def upload_snapshot(client, snapshot_path, snapshot_id, bandwidth_limit=None,
+                    progress_handler=None):
+    """Upload a snapshot archive (see `upload_file`)
+
+    :return: the uploaded Snapshot and the UploadResult
+    """
+    result = upload_file(client,
+                         '/snapshots/{0}/archive'.format(snapshot_id),
+                         snapshot_path,
+                         bandwidth_limit=bandwidth_limit,
+                         progress_handler=progress_handler)
+    return Snapshot(result.response), result
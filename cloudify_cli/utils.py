@@ -15,6 +15,7 @@
 ############
 
 import os
+import re
 import sys
 import json
 import glob
@@ -28,8 +29,10 @@ import getpass
 import tempfile
 from datetime import datetime
 from contextlib import contextmanager
+from multiprocessing.pool import Pool, ThreadPool
 
 import yaml
+import requests
 import pkg_resources
 from prettytable import PrettyTable
 from jinja2.environment import Template
@@ -52,6 +55,9 @@ DEFAULT_LOG_FILE = os.path.expanduser(
     .format(tempfile.gettempdir(),
             getpass.getuser()))
 
+# a year, in seconds
+_THREAD_POOL_WAIT_TIMEOUT = 365 * 24 * 60 * 60
+
 
 def get_management_user():
     cosmo_wd_settings = load_cloudify_working_dir_settings()
@@ -182,9 +188,11 @@ def inputs_to_dict(resources, resource_name):
         resources = [resources]
 
     for resource in resources:
-        # workflow parameters always pass an empty dictionary.
-        # we ignore it.
-        if isinstance(resource, str):
+        # already parsed inputs (workflow parameters always pass an empty
+        # dictionary)
+        if isinstance(resource, dict):
+            parsed_dict.update(resource)
+        elif isinstance(resource, str):
             input_files = glob.glob(resource)
             if os.path.isdir(resource):
                 for input_file in os.listdir(resource):
@@ -598,6 +606,159 @@ def table(cols, data, defaults=None):
     return pt
 
 
+def format_size(size):
+    """Return a number of bytes in a human readable form (e.g. 1.5 MB)"""
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if abs(size) < 1024 or unit == 'GB':
+            break
+        size /= 1024.0
+    if unit == 'B':
+        return '{0} B'.format(int(size))
+    return '{0:.1f} {1}'.format(size, unit)
+
+
+def parse_size(size):
+    """Return the number of bytes in a size such as 512K, 10M or 1.5GB
+
+    A size without a unit is a number of bytes. Raises ValueError if
+    `size` can't be parsed (so it can be used as an argparse type).
+    """
+    match = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([KMG]?)B?\s*$', str(size),
+                     re.IGNORECASE)
+    if not match:
+        raise ValueError('Invalid size: {0}'.format(size))
+    number, unit = match.groups()
+    multiplier = 1024 ** ' KMG'.index(unit.upper() or ' ')
+    return int(float(number) * multiplier)
+
+
+def parse_task_thread_pool_size(size):
+    """Return a task thread pool size: a positive number of threads, or
+    `auto` (see `common.task_thread_pool_size`)
+
+    Raises ValueError for any other value (so it can be used as an
+    argparse type).
+    """
+    if size == constants.AUTO_TASK_THREAD_POOL_SIZE:
+        return size
+    if int(size) < 1:
+        raise ValueError('Invalid task thread pool size: {0}'.format(size))
+    return int(size)
+
+
+def iter_json_array(items, indent=2):
+    """Encode the iterable `items` as an indented JSON array, an item at a
+    time, so large collections are never encoded (or held) whole
+
+    Yields the opening bracket, each encoded item and the closing bracket;
+    nothing is yielded before the first item is read.
+    """
+    return _iter_json_container(
+        '[', ']', (_indented_json(item, indent) for item in items), indent)
+
+
+def iter_json_object(pairs, indent=2):
+    """Like `iter_json_array`, for a JSON object of (key, value) `pairs`"""
+    return _iter_json_container(
+        '{', '}', ('{0}: {1}'.format(json.dumps(key),
+                                     _indented_json(value, indent))
+                   for key, value in pairs), indent)
+
+
+def _iter_json_container(opening, closing, encoded_items, indent):
+    prefix = ' ' * indent
+    previous = None
+    for encoded in encoded_items:
+        if previous is None:
+            yield opening
+        else:
+            yield prefix + previous + ','
+        previous = encoded
+    if previous is None:
+        yield opening + closing
+    else:
+        yield prefix + previous
+        yield closing
+
+
+def _indented_json(value, indent):
+    # JSON strings never hold raw newlines, so every newline starts a line
+    # that needs the extra indentation of a nested value
+    return json.dumps(value, sort_keys=True, indent=indent,
+                      separators=(',', ': ')).replace(
+        '\n', '\n' + ' ' * indent)
+
+
+def use_connection_pool(client, pool_size):
+    """
+    Make `client` send its requests over a single pool of up to
+    `pool_size` kept-alive connections, rather than opening a connection
+    per request.
+
+    The pool may be shared by up to `pool_size` threads using `client`.
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                            pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    # the REST client calls the module level functions of `requests`
+    # (e.g. `requests.put`), so they're replaced with the session's
+    http_client = client._client
+    do_request = http_client._do_request
+
+    def _do_request(requests_method, **kwargs):
+        return do_request(
+            requests_method=getattr(session, requests_method.__name__),
+            **kwargs)
+
+    http_client._do_request = _do_request
+    return client
+
+
+def run_concurrently(func, items, concurrency):
+    """
+    Call `func` on each of `items`, using no more than `concurrency`
+    threads at a time.
+
+    Returns the results in the same order as `items`. An exception raised
+    by `func` is re-raised here, so callers that want to handle
+    per-item failures should catch them inside `func`.
+    """
+    items = list(items)
+    if not items:
+        return []
+    pool = ThreadPool(processes=max(1, min(concurrency, len(items))))
+    try:
+        # waiting with a timeout (rather than calling `map`) keeps the
+        # main thread responsive to KeyboardInterrupt
+        return pool.map_async(func, items).get(_THREAD_POOL_WAIT_TIMEOUT)
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def run_in_processes(func, items, processes):
+    """
+    Call `func` on each of `items`, using no more than `processes`
+    worker processes at a time.
+
+    Like `run_concurrently`, but for CPU bound work. `func`, `items` and
+    the results must be picklable, so `func` has to be a module level
+    function.
+    """
+    items = list(items)
+    if not items:
+        return []
+    pool = Pool(processes=max(1, min(processes, len(items))))
+    try:
+        return pool.map_async(func, items).get(_THREAD_POOL_WAIT_TIMEOUT)
+    finally:
+        pool.terminate()
+        pool.join()
+
+
 def upload_plugin(plugin_path, rest_client, validate):
     logger = get_logger()
     validate(plugin_path)
@@ -735,6 +896,32 @@ class CloudifyConfig(object):
     def validate_definitions_version(self):
         return self._config.get('validate_definitions_version', True)
 
+    @property
+    def events_cache_max_size(self):
+        """The events cache's size limit, in bytes (0 disables it)"""
+        max_size_mb = self._config.get(
+            'events_cache_max_size_mb',
+            constants.DEFAULT_EVENTS_CACHE_MAX_SIZE_MB)
+        return int(max_size_mb * (10 ** 6))
+
+    @property
+    def blueprint_plan_cache(self):
+        return self._config.get('blueprint_plan_cache', True)
+
+    @property
+    def task_thread_pool_size(self):
+        return self._config.get('task_thread_pool_size',
+                                constants.DEFAULT_TASK_THREAD_POOL_SIZE)
+
+    @property
+    def max_task_thread_pool_size(self):
+        return self._config.get('max_task_thread_pool_size')
+
+    @property
+    def import_cache_ttl(self):
+        return self._config.get('import_cache_ttl',
+                                constants.DEFAULT_IMPORT_CACHE_TTL)
+
 
 def build_manager_host_string(user='', ip=''):
     user = user or get_management_user()
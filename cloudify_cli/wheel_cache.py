@@ -0,0 +1,231 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+"""
+A local cache of the wheels blueprint plugins are installed from.
+
+Every plugin source (a URL, or a local plugin directory) is built once,
+with `pip wheel`, into a directory of wheels holding the plugin and its
+dependencies. These directories are kept under `.cloudify/wheels-cache/`,
+named after a digest of the source: the URL itself, or the content of the
+local directory. Plugins are then installed from the cache without
+accessing the network, and aren't installed at all when the installed
+distributions already satisfy them.
+
+A URL is assumed to always refer to the same content (e.g. a tagged
+archive); remove `.cloudify/wheels-cache/` to have the wheels rebuilt.
+"""
+
+import os
+import sys
+import json
+import pipes
+import shutil
+import fnmatch
+import hashlib
+import tempfile
+
+import pkg_resources
+from cloudify.utils import LocalCommandRunner
+from cloudify.exceptions import CommandExecutionException
+
+from cloudify_cli import utils
+from cloudify_cli.logger import get_logger
+from cloudify_cli.constants import DEFAULT_CONCURRENCY
+
+
+WHEELS_CACHE_DIR_NAME = 'wheels-cache'
+METADATA_FILE_NAME = 'plugin.json'
+IGNORED_SOURCE_PATTERNS = ['.git', '*.pyc', '*.egg-info', 'build', 'dist']
+
+_READ_CHUNK_SIZE = 64 * 1024
+
+
+def source_digest(source):
+    """Return a digest identifying the content of a plugin source"""
+    digest = hashlib.sha256()
+    if not os.path.isdir(source):
+        digest.update(source)
+        return digest.hexdigest()
+    for dirpath, dirnames, filenames in os.walk(source):
+        dirnames[:] = sorted(name for name in dirnames
+                             if not _ignored_source_path(name))
+        for filename in sorted(filenames):
+            if _ignored_source_path(filename):
+                continue
+            path = os.path.join(dirpath, filename)
+            digest.update(os.path.relpath(path, source).replace(os.sep, '/'))
+            digest.update('\0')
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(_READ_CHUNK_SIZE), ''):
+                    digest.update(chunk)
+            digest.update('\0')
+    return digest.hexdigest()
+
+
+def _ignored_source_path(name):
+    return any(fnmatch.fnmatch(name, pattern)
+               for pattern in IGNORED_SOURCE_PATTERNS)
+
+
+def is_installed(name, version):
+    """Whether a distribution is installed at `version`, along with its
+    requirements
+    """
+    try:
+        # a fresh working set, as plugins may have just been installed
+        pkg_resources.WorkingSet().require('{0}=={1}'.format(name, version))
+        return True
+    except (pkg_resources.DistributionNotFound,
+            pkg_resources.VersionConflict):
+        return False
+
+
+class WheelCache(object):
+    """Wheels of plugin sources, kept in `cache_dir`"""
+
+    def __init__(self, cache_dir, runner=None):
+        self._cache_dir = cache_dir
+        self._runner = runner or LocalCommandRunner(get_logger())
+
+    def get(self, source):
+        """Return the cached plugin built from `source`, or None
+
+        The plugin is a dict with its distribution's `name` and
+        `version`, and the `wheels_dir` holding it and its dependencies.
+        """
+        wheels_dir = self._wheels_dir(source)
+        try:
+            with open(os.path.join(wheels_dir, METADATA_FILE_NAME)) as f:
+                plugin = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        plugin['wheels_dir'] = wheels_dir
+        return plugin
+
+    def build(self, source):
+        """Build the wheels of `source` and its dependencies into the
+        cache, and return the cached plugin (see `get`)
+        """
+        if not os.path.isdir(self._cache_dir):
+            os.makedirs(self._cache_dir)
+        # built aside, so a failed build leaves nothing behind
+        build_dir = tempfile.mkdtemp(dir=self._cache_dir)
+        try:
+            self._pip('wheel', '--no-deps', '--wheel-dir', build_dir, source)
+            wheels = [name for name in os.listdir(build_dir)
+                      if name.endswith('.whl')]
+            if len(wheels) != 1:
+                raise CommandExecutionException(
+                    command='pip wheel {0}'.format(source),
+                    error='expected a single wheel, got {0}'.format(wheels),
+                    output=None,
+                    code=1)
+            name, version = wheels[0].split('-')[:2]
+            self._pip('wheel', '--wheel-dir', build_dir,
+                      '--find-links', build_dir,
+                      os.path.join(build_dir, wheels[0]))
+            with open(os.path.join(build_dir, METADATA_FILE_NAME), 'w') as f:
+                json.dump({'source': source,
+                           'name': name,
+                           'version': version}, f)
+            wheels_dir = self._wheels_dir(source)
+            shutil.rmtree(wheels_dir, ignore_errors=True)
+            os.rename(build_dir, wheels_dir)
+        except BaseException:
+            shutil.rmtree(build_dir, ignore_errors=True)
+            raise
+        return self.get(source)
+
+    def install(self, plugins):
+        """Install cached plugins, without accessing the network"""
+        arguments = ['install', '--no-index']
+        for plugin in plugins:
+            arguments.extend(['--find-links', plugin['wheels_dir']])
+        arguments.extend('{0}=={1}'.format(plugin['name'], plugin['version'])
+                         for plugin in plugins)
+        self._pip(*arguments)
+
+    def _wheels_dir(self, source):
+        return os.path.join(self._cache_dir, source_digest(source))
+
+    def _pip(self, *arguments):
+        command_parts = [sys.executable, '-m', 'pip'] + list(arguments)
+        # the runner splits the command as a shell would
+        self._runner.run(command=' '.join(pipes.quote(part)
+                                          for part in command_parts),
+                         stdout_pipe=False)
+
+
+def get_wheel_cache():
+    """Return the working directory's wheel cache, or None if the working
+    directory isn't initialized
+    """
+    if not utils.is_initialized():
+        return None
+    return WheelCache(os.path.join(utils.get_init_path(),
+                                   WHEELS_CACHE_DIR_NAME))
+
+
+def install_plugins(cache, sources, concurrency=DEFAULT_CONCURRENCY):
+    """Install the plugins of `sources` from `cache`
+
+    Sources missing from the cache are built into it first, `concurrency`
+    at a time. Nothing is installed if the installed distributions already
+    satisfy all of the plugins.
+
+    :return: the sources that couldn't be built into wheels, and should be
+             installed with pip directly
+    """
+    logger = get_logger()
+    plugins = {}
+    for source in sources:
+        plugin = cache.get(source)
+        if plugin is not None:
+            plugins[source] = plugin
+
+    to_build = [source for source in sources if source not in plugins]
+    if to_build:
+        logger.info('Building wheels of {0} plugins...'.format(len(to_build)))
+
+    def _build(source):
+        try:
+            return cache.build(source)
+        except CommandExecutionException as e:
+            logger.warning('Failed building wheels of {0}; it will be '
+                           'installed from its source ({1})'
+                           .format(source, e))
+            return None
+
+    unbuilt = []
+    for source, plugin in zip(to_build, utils.run_concurrently(
+            _build, to_build, concurrency)):
+        if plugin is None:
+            unbuilt.append(source)
+        else:
+            plugins[source] = plugin
+
+    to_install = [plugin for plugin in plugins.values()
+                  if not is_installed(plugin['name'], plugin['version'])]
+    if to_install:
+        logger.info('Installing {0} plugins from the wheel cache: {1}'.format(
+            len(to_install), ', '.join(sorted(
+                '{0}=={1}'.format(plugin['name'], plugin['version'])
+                for plugin in to_install))))
+        cache.install(to_install)
+    elif plugins:
+        logger.info('All {0} plugins are already installed'
+                    .format(len(plugins)))
+    return unbuilt